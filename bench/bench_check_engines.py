@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+bench.bench_check_engines -- compare the check engines against a local listener farm
+
+Starts a farm of listening sockets on 127.0.0.1 in a child process (plus some closed
+ports, that refuse connections) and runs one sweep over all of them with every
+check engine from main.CHECK_ENGINES.
+
+Run from the projects root directory: python -m bench.bench_check_engines -n 1000
+"""
+
+import sys
+import os
+import time
+import socket
+import select
+import resource
+import multiprocessing
+from argparse import ArgumentParser
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+def listener_farm(num, ports_out, stop):
+    """
+    Listen on num ports on 127.0.0.1, accept and close all connections until stop is set.
+
+    :param integer num: number of listening sockets
+    :param multiprocessing.Queue ports_out: gets the list of ports
+    :param multiprocessing.Event stop: stop serving when set
+    """
+    listeners = dict()
+    for _ in range(num):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(128)
+        listeners[sock.fileno()] = sock
+    ports_out.put([sock.getsockname()[1] for sock in listeners.values()])
+    poller = select.epoll()
+    for fd in listeners:
+        poller.register(fd, select.EPOLLIN)
+    while not stop.is_set():
+        for fd, _ in poller.poll(0.1):
+            try:
+                conn, _ = listeners[fd].accept()
+                conn.close()
+            except socket.error:
+                pass
+
+
+def closed_ports(num):
+    """
+    :param integer num: number of ports
+    :return: ports on 127.0.0.1 nobody listens on
+    :rtype: list
+    """
+    socks = list()
+    for _ in range(num):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--listeners", type=int, default=500, help="number of listening ports [%(default)s]")
+    parser.add_argument("-r", "--refusing", type=int, default=10, help="number of closed ports [%(default)s]")
+    parser.add_argument("-p", "--max_parallel", type=int, nargs="+", default=[10, 100],
+                        help="values for --max_parallel to compare [%(default)s]")
+    parser.add_argument("--rounds", type=int, default=3, help="sweeps per engine, best is reported [%(default)s]")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from main import CHECK_ENGINES
+
+    raise_fd_limit()
+    ports_q = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    farm = multiprocessing.Process(target=listener_farm, args=(args.listeners, ports_q, stop))
+    farm.daemon = True
+    farm.start()
+    ports = ports_q.get() + closed_ports(args.refusing)
+
+    print "%d services (%d listening, %d refusing)" % (len(ports), args.listeners, args.refusing)
+    print "%-8s %12s %10s %8s" % ("engine", "max_parallel", "best [s]", "failed")
+    try:
+        for engine in sorted(CHECK_ENGINES.keys()):
+            check_class, executor_class = CHECK_ENGINES[engine]
+            for max_parallel in args.max_parallel:
+                best = None
+                for _ in range(args.rounds):
+                    checks = [check_class("127.0.0.1", port, "TCP") for port in ports]
+                    start = time.time()
+                    results = executor_class(max_parallel).run(checks, stop_on_failure=False)
+                    duration = time.time() - start
+                    best = duration if best is None else min(best, duration)
+                print "%-8s %12d %10.3f %8d" % (engine, max_parallel, best, len([x for x in results if not x]))
+    finally:
+        stop.set()
+        farm.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
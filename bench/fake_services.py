@@ -0,0 +1,192 @@
+# encoding: utf-8
+"""
+bench.fake_services -- a farm of local services that are up, down, black-holed or slow
+
+The farm runs in a child process and listens on 127.0.0.1:
+
+- listening: accepts connections and answers HTTP requests right away
+- slow: accepts connections, but answers only after a delay
+- black-holed: never accepts, the accept queue is full, so connects time out
+- refusing: closed ports, connects are refused
+
+Services can be failed while the farm runs (their port is closed), to measure the time
+from an outage to the message about it.
+"""
+
+import time
+import heapq
+import socket
+import select
+import multiprocessing
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+RESPONSE = "HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nOK"
+KINDS = ("listening", "slow", "blackholed", "refusing")
+
+
+class ServiceFarm(object):
+
+    """
+    Local services in a child process.
+    """
+
+    def __init__(self, listening=100, slow=0, blackholed=0, refusing=0, slow_delay=1.0):
+        """
+        :param integer listening: number of services that answer right away
+        :param integer slow: number of services that answer after slow_delay
+        :param integer blackholed: number of services whose connects time out
+        :param integer refusing: number of closed ports
+        :param float slow_delay: seconds the slow services wait before answering
+        """
+        self.counts = {"listening": listening, "slow": slow, "blackholed": blackholed, "refusing": refusing}
+        self.slow_delay = slow_delay
+        self.ports = dict()  # kind: [port, ...]
+        self._connection = None
+        self._process = None
+
+    def start(self):
+        """
+        Start the farm, sets self.ports.
+        """
+        self._connection, child_end = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child_end, self.counts, self.slow_delay),
+                                                name="service-farm")
+        self._process.daemon = True
+        self._process.start()
+        self.ports = self._connection.recv()
+        self.ports["refusing"] = closed_ports(self.counts["refusing"])
+
+    def stop(self):
+        """
+        Stop the farm.
+        """
+        self._connection.send(("stop",))
+        self._process.join()
+
+    def fail(self, port):
+        """
+        Close the port of a listening or slow service, so that connects to it are refused.
+
+        :param integer port: port of the service
+        """
+        self._connection.send(("fail", port))
+        self._connection.recv()
+        for kind in ("listening", "slow"):
+            if port in self.ports[kind]:
+                self.ports[kind].remove(port)
+                self.ports["refusing"].append(port)
+
+    def services(self):
+        """
+        :return: [(port, kind), ...]
+        :rtype: list
+        """
+        return [(port, kind) for kind in KINDS for port in self.ports.get(kind, [])]
+
+
+def closed_ports(num):
+    """
+    :param integer num: number of ports
+    :return: ports on 127.0.0.1 nobody listens on
+    :rtype: list
+    """
+    socks = list()
+    for _ in range(num):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def _listen(backlog):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(backlog)
+    return sock
+
+
+def _serve(connection, counts, slow_delay):
+    # main function of the farm process
+    listeners = dict()  # fd: (socket, delay)
+    for kind, delay in (("listening", 0), ("slow", slow_delay)):
+        for _ in range(counts[kind]):
+            sock = _listen(128)
+            listeners[sock.fileno()] = (sock, delay)
+    blackholed = list()
+    fillers = list()
+    for _ in range(counts["blackholed"]):
+        sock = _listen(0)
+        blackholed.append(sock)
+        # fill the accept queue, further SYNs are dropped
+        for _ in range(2):
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(0)
+            filler.connect_ex(sock.getsockname())
+            fillers.append(filler)
+    by_port = dict((sock.getsockname()[1], fd) for fd, (sock, _) in listeners.items())
+    connection.send({"listening": [sock.getsockname()[1] for sock, delay in listeners.values() if not delay],
+                     "slow": [sock.getsockname()[1] for sock, delay in listeners.values() if delay],
+                     "blackholed": [sock.getsockname()[1] for sock in blackholed]})
+    poller = select.epoll()
+    for fd in listeners:
+        poller.register(fd, select.EPOLLIN)
+    poller.register(connection.fileno(), select.EPOLLIN)
+    clients = dict()  # fd: (socket, time to answer, data received)
+    pending = list()  # heap of (time to answer, socket) of clients whose request is complete
+    while True:
+        timeout = max(0.0, pending[0][0] - time.time()) if pending else 1.0
+        for fd, _ in poller.poll(timeout):
+            if fd == connection.fileno():
+                message = connection.recv()
+                if message[0] == "stop":
+                    return
+                fd = by_port.pop(message[1], None)
+                if fd is not None:
+                    poller.unregister(fd)
+                    listeners.pop(fd)[0].close()
+                connection.send(True)
+            elif fd in listeners:
+                sock, delay = listeners[fd]
+                try:
+                    conn, _ = sock.accept()
+                except socket.error:
+                    continue
+                conn.setblocking(0)
+                clients[conn.fileno()] = (conn, time.time() + delay, "")
+                poller.register(conn.fileno(), select.EPOLLIN)
+            elif fd in clients:
+                conn, answer_at, data = clients[fd]
+                try:
+                    chunk = conn.recv(4096)
+                except socket.error:
+                    chunk = ""
+                if chunk and "\r\n\r\n" not in data + chunk:
+                    clients[fd] = (conn, answer_at, data + chunk)
+                    continue
+                poller.unregister(fd)
+                del clients[fd]
+                if chunk:
+                    # answer the request (after the delay of a slow service)
+                    heapq.heappush(pending, (answer_at, conn))
+                else:
+                    # connect checks close the connection without a request
+                    conn.close()
+        while pending and pending[0][0] <= time.time():
+            _, conn = heapq.heappop(pending)
+            try:
+                conn.setblocking(1)
+                conn.sendall(RESPONSE)
+                conn.shutdown(socket.SHUT_WR)
+            except socket.error:
+                pass
+            conn.close()
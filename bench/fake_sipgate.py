@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+bench.fake_sipgate -- a local stand-in for the XML-RPC API of sipgate
+
+Answers samurai.ClientIdentify and samurai.SessionInitiate like sipgate does, after a
+configurable delay, and records the messages it got. Point main.py to it with
+--sms_url, username and password are not checked.
+
+Run from the projects root directory:
+    python -m bench.fake_sipgate --port 8090 --latency 0.3
+    ./main.py --sms_url http://127.0.0.1:8090/RPC2 ...
+"""
+
+import sys
+import time
+import threading
+from argparse import ArgumentParser
+from SocketServer import ThreadingMixIn
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+
+    # keep connections open like sipgate, SipgateSMS reuses them
+    protocol_version = "HTTP/1.1"
+    rpc_paths = ("/RPC2",)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSipgate(object):
+
+    """
+    XML-RPC server imitating sipgate, in a background thread.
+    """
+
+    def __init__(self, latency=0.0, address="127.0.0.1", port=0, on_message=None):
+        """
+        :param float latency: seconds to wait before answering a request
+        :param str address: address to listen on
+        :param integer port: port to listen on, 0 for any free port
+        :param on_message: function called with (time, destination, message) for every message, None for none
+        """
+        self.latency = latency
+        self.on_message = on_message
+        self.messages = list()  # [(time received, destination, message), ...]
+        self.identified = 0
+        self._condition = threading.Condition()
+        self._server = ThreadingXMLRPCServer((address, port), requestHandler=KeepAliveRequestHandler,
+                                             logRequests=False, allow_none=True)
+        self._server.register_function(self._client_identify, "samurai.ClientIdentify")
+        self._server.register_function(self._session_initiate, "samurai.SessionInitiate")
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        :return: URL for --sms_url
+        :rtype: str
+        """
+        return "http://%s:%d/RPC2" % self._server.server_address[:2]
+
+    def start(self):
+        """
+        Serve requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-sipgate")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving and close the port.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def wait_for_messages(self, count, timeout):
+        """
+        :param integer count: number of messages
+        :param float timeout: seconds to wait at most
+        :return: True if at least count messages were received
+        :rtype: bool
+        """
+        end = time.time() + timeout
+        with self._condition:
+            while len(self.messages) < count and time.time() < end:
+                self._condition.wait(end - time.time())
+            return len(self.messages) >= count
+
+    def _client_identify(self, params):
+        time.sleep(self.latency)
+        with self._condition:
+            self.identified += 1
+        return {"StatusCode": 200, "StatusString": "Method success"}
+
+    def _session_initiate(self, params):
+        received = time.time()
+        time.sleep(self.latency)
+        destination = params.get("RemoteUri", "").partition(":")[2].partition("@")[0]
+        with self._condition:
+            self.messages.append((received, destination, params.get("Content", "")))
+            self._condition.notify_all()
+        if self.on_message:
+            self.on_message(received, destination, params.get("Content", ""))
+        return {"StatusCode": 200, "StatusString": "Method success", "SessionID": "%032x" % len(self.messages)}
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-a", "--address", default="127.0.0.1", help="address to listen on [%(default)s]")
+    parser.add_argument("-p", "--port", type=int, default=8090, help="port to listen on [%(default)s]")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before answering a request [%(default)s]")
+    args = parser.parse_args()
+
+    def show(received, destination, message):
+        print "%s %s: %s" % (time.strftime("%H:%M:%S", time.localtime(received)), destination, message)
+        sys.stdout.flush()
+
+    sipgate = FakeSipgate(args.latency, args.address, args.port, show)
+    print "Serving on %s" % sipgate.url
+    sys.stdout.flush()
+    sipgate.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sipgate.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
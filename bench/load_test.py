@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+bench.load_test -- sweep times, check latencies and time to notify against local fake services
+
+Starts a farm of local services (listening, slow, black-holed and refusing, see
+bench.fake_services) and measures for every check engine and --max_parallel value:
+
+- sweep: the best wall time of a run over all services, the 50th and 99th percentile of
+  the time of the successful checks, failed checks and the peak memory of the process
+  running the checks
+- outage (with --outages): starts main.py as a daemon checking the listening services,
+  with a fake sipgate (bench.fake_sipgate), fails services one after the other and
+  measures the time from closing the port to the message reaching the fake sipgate
+
+Slow services are checked with HTTP, all others with TCP connects. Run from the projects
+root directory:
+    python -m bench.load_test -n 1000 -s 50 -b 10 -r 10 -p 10 100 --outages 3
+"""
+
+import os
+import sys
+import time
+import shlex
+import signal
+import shutil
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from argparse import ArgumentParser, Namespace
+
+from bench.fake_services import ServiceFarm
+from bench.fake_sipgate import FakeSipgate
+from bench.bench_check_engines import raise_fd_limit
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def service_specs(farm):
+    """
+    :param ServiceFarm farm: started farm
+    :return: services for -s or an inventory file, HTTP for slow services, TCP for the others
+    :rtype: list
+    """
+    return [("http://127.0.0.1:%d/" if kind == "slow" else "127.0.0.1:%d") % port for port, kind in farm.services()]
+
+
+def percentile(values, percent):
+    """
+    :param list values: sorted numbers
+    :param float percent: 0 - 100
+    :return: the value below which percent of values are, None if values is empty
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def sweep(engine, max_parallel, specs, rounds, timeout, results_out):
+    """
+    Check all services rounds times, in a child process so that the peak memory is its own.
+
+    :param str engine: key of main.CHECK_ENGINES
+    :param integer max_parallel: checks at the same time
+    :param list specs: services
+    :param integer rounds: number of sweeps, the best is reported
+    :param float timeout: seconds to wait for a connection
+    :param multiprocessing.Queue results_out: gets (best sweep time, p50, p99, failed checks, peak RSS in KB)
+    """
+    from main import execute_checks
+    from check_service.inventory import Inventory
+
+    inventory = Inventory({"depends": list(), "interval": 1, "latency_threshold": 0.0, "msg_limit": 0, "priority": 0,
+                           "timeout": timeout})
+    for spec in specs:
+        inventory.add(spec)
+    services = inventory.services()
+    args = Namespace(check_engine=engine, max_parallel=max_parallel, timeout_ceiling=timeout, force_all_checks=True)
+    best = None
+    for _ in range(rounds):
+        start = time.time()
+        results = execute_checks(args, services)
+        duration = time.time() - start
+        if best is None or duration < best[0]:
+            best = (duration, results)
+    duration, results = best
+    latencies = sorted(result[0].latency for result in results if result[0] and result[0].latency is not None)
+    results_out.put((duration, percentile(latencies, 50), percentile(latencies, 99),
+                     len([x for x in results if not x[0]]), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def outages(engine, max_parallel, farm, sipgate, count, interval, daemon_args):
+    """
+    Run main.py as a daemon and fail count listening services of the farm, one after the other.
+
+    :param str engine: key of main.CHECK_ENGINES
+    :param integer max_parallel: checks at the same time
+    :param ServiceFarm farm: started farm, its listening services are checked and count of them failed
+    :param FakeSipgate sipgate: started fake sipgate
+    :param integer count: number of outages
+    :param float interval: seconds between checks of a service
+    :param list daemon_args: further arguments for main.py
+    :return: seconds from each outage to its message (None if there was none), RSS of the daemon in KB
+    :rtype: tuple
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="sms_notify_bench_")
+    inventory = os.path.join(tmp_dir, "services.txt")
+    with open(inventory, "wb") as inventory_file:
+        for port in farm.ports["listening"]:
+            inventory_file.write("127.0.0.1:%d interval=%r\n" % (port, interval / 60.0))
+    pid_file = os.path.join(tmp_dir, "sms_notify.pid")
+    command = [sys.executable, os.path.join(ROOT, "main.py"), "--inventory", inventory, "-u", "bench", "-p", "bench",
+               "-m", "4900000000", "-d", "-f", "--pid_file", pid_file, "-l", os.path.join(tmp_dir, "sms_notify.log"),
+               "--sms_url", sipgate.url, "--check_engine", engine, "--max_parallel", str(max_parallel),
+               "--timeout_ceiling", str(max(1.0, interval / 2)), "--jitter", "0", "--msg_limit", "100000"
+               ] + daemon_args
+    with open(os.devnull, "wb") as devnull:
+        daemon = subprocess.Popen(command, cwd=ROOT, stdout=devnull, stderr=subprocess.STDOUT)
+    delays = list()
+    rss = None
+    try:
+        # the daemon logs in at start, then wait for the first checks of all services
+        identified = sipgate.identified
+        end = time.time() + 10
+        while sipgate.identified == identified and time.time() < end and daemon.poll() in (None, 0):
+            time.sleep(0.1)
+        time.sleep(interval + 1)
+        victims = farm.ports["listening"][-count:]
+        for port in victims:
+            received = len(sipgate.messages)
+            start = time.time()
+            farm.fail(port)
+            if sipgate.wait_for_messages(received + 1, 3 * interval + 10):
+                delays.append(sipgate.messages[received][0] - start)
+            else:
+                delays.append(None)
+        pid = _read_pid(pid_file) or daemon.pid
+        rss = _rss(pid)
+    finally:
+        _stop(_read_pid(pid_file) or daemon.pid)
+        if daemon.poll() is None:
+            daemon.kill()
+        daemon.wait()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return delays, rss
+
+
+def _read_pid(path):
+    try:
+        with open(path) as pid_file:
+            return int(pid_file.read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def _rss(pid):
+    # resident memory of a process in KB, from /proc
+    try:
+        with open("/proc/%d/status" % pid) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def _stop(pid):
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            return
+        for _ in range(50):
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                return
+            time.sleep(0.1)
+
+
+def _ms(seconds):
+    return "%10.2f" % (seconds * 1000) if seconds is not None else "%10s" % "-"
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", "--listening", type=int, default=500, help="number of listening services [%(default)s]")
+    parser.add_argument("-s", "--slow", type=int, default=10, help="number of slow HTTP services [%(default)s]")
+    parser.add_argument("--slow_delay", type=float, default=0.5,
+                        help="seconds the slow services wait before answering [%(default)s]")
+    parser.add_argument("-b", "--blackholed", type=int, default=10,
+                        help="number of services whose connects time out [%(default)s]")
+    parser.add_argument("-r", "--refusing", type=int, default=10, help="number of closed ports [%(default)s]")
+    parser.add_argument("-p", "--max_parallel", type=int, nargs="+", default=[10, 100],
+                        help="values for --max_parallel to compare [%(default)s]")
+    parser.add_argument("-e", "--engines", nargs="+", help="check engines to compare [all]")
+    parser.add_argument("--rounds", type=int, default=3, help="sweeps per engine, best is reported [%(default)s]")
+    parser.add_argument("--timeout", type=float, default=1.0,
+                        help="seconds to wait for a connection, black-holed services take that long [%(default)s]")
+    parser.add_argument("--outages", type=int, default=0,
+                        help="measure the time to notify about x outages per engine, 0 to skip [%(default)s]")
+    parser.add_argument("--interval", type=float, default=3.0,
+                        help="seconds between checks of a service in the outage test [%(default)s]")
+    parser.add_argument("--sms_latency", type=float, default=0.2,
+                        help="seconds the fake sipgate waits before answering [%(default)s]")
+    parser.add_argument("--daemon_args", default="",
+                        help="further arguments for main.py in the outage test, e.g. '--workers 4' [none]")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from main import CHECK_ENGINES
+
+    engines = args.engines or sorted(CHECK_ENGINES.keys())
+    unknown = [x for x in engines if x not in CHECK_ENGINES]
+    if unknown:
+        parser.error("Unknown check engine(s): %s." % ", ".join(unknown))
+    raise_fd_limit()
+    farm = ServiceFarm(args.listening, args.slow, args.blackholed, args.refusing, args.slow_delay)
+    farm.start()
+    specs = service_specs(farm)
+    print "%d services (%d listening, %d slow, %d black-holed, %d refusing)" % (
+        len(specs), args.listening, args.slow, args.blackholed, args.refusing)
+    try:
+        print "%-8s %12s %10s %10s %10s %8s %10s" % ("engine", "max_parallel", "sweep [s]", "p50 [ms]", "p99 [ms]",
+                                                     "failed", "peak [MB]")
+        for engine in engines:
+            for max_parallel in args.max_parallel:
+                results = multiprocessing.Queue()
+                child = multiprocessing.Process(target=sweep, args=(engine, max_parallel, specs, args.rounds,
+                                                                    args.timeout, results))
+                child.start()
+                duration, p50, p99, failed, peak = results.get()
+                child.join()
+                print "%-8s %12d %10.3f %s %s %8d %10.1f" % (engine, max_parallel, duration, _ms(p50), _ms(p99),
+                                                             failed, peak / 1024.0)
+        if args.outages:
+            if args.outages * len(engines) * len(args.max_parallel) > args.listening:
+                parser.error("Not enough listening services for %d outages per engine." % args.outages)
+            sipgate = FakeSipgate(args.sms_latency)
+            sipgate.start()
+            print
+            print "%-8s %12s %8s %10s %10s %10s %10s" % ("engine", "max_parallel", "outages", "min [s]", "median [s]",
+                                                         "max [s]", "RSS [MB]")
+            try:
+                for engine in engines:
+                    for max_parallel in args.max_parallel:
+                        delays, rss = outages(engine, max_parallel, farm, sipgate, args.outages, args.interval,
+                                              shlex.split(args.daemon_args))
+                        notified = sorted(x for x in delays if x is not None)
+                        if notified:
+                            print "%-8s %12d %8s %10.2f %10.2f %10.2f %10s" % (
+                                engine, max_parallel, "%d/%d" % (len(notified), len(delays)), notified[0],
+                                percentile(notified, 50), notified[-1], "%.1f" % (rss / 1024.0) if rss else "-")
+                        else:
+                            print "%-8s %12d %8s   no messages, see --daemon_args" % (
+                                engine, max_parallel, "0/%d" % len(delays))
+            finally:
+                sipgate.stop()
+    finally:
+        farm.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
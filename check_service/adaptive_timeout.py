@@ -0,0 +1,82 @@
+# encoding: utf-8
+"""
+adaptive_timeout -- connect timeout of each service, derived from its recent connect times
+
+Works like the retransmission timeout of TCP (RFC 6298): every connect time updates a
+smoothed connect time (srtt) and its variation (rttvar), the timeout is srtt + k * rttvar,
+kept between a floor and a ceiling. After a failed check the timeout is doubled (up to
+the ceiling) until the next successful check, so a re-check waits longer than the check
+before it. A service without successful checks gets the ceiling.
+"""
+
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class AdaptiveTimeout(object):
+
+    """
+    Connect timeout of each service, derived from its recent connect times.
+    """
+
+    def __init__(self, floor=3.0, ceiling=10.0, k=4.0, alpha=0.125, beta=0.25):
+        """
+        :param float floor: minimum timeout in seconds, at least 1 so that a lost SYN can be sent again
+        :param float ceiling: maximum timeout in seconds, used for services without successful checks
+        :param float k: weight of the variation of the connect time
+        :param float alpha: weight of a new connect time in srtt
+        :param float beta: weight of a new deviation in rttvar
+        """
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.k = k
+        self.alpha = alpha
+        self.beta = beta
+        self._stats = dict()  # key: [srtt, rttvar, backoff]
+
+    def get(self, key):
+        """
+        :param key: hashable identifying the service
+        :return: timeout in seconds
+        :rtype: float
+        """
+        entry = self._stats.get(key)
+        if entry is None or entry[0] is None:
+            return self.ceiling
+        srtt, rttvar, backoff = entry
+        return min(self.ceiling, max(self.floor, srtt + self.k * rttvar) * backoff)
+
+    def update(self, key, latency):
+        """
+        :param key: hashable identifying the service
+        :param float latency: connect time in seconds, None if the check failed
+        """
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = [None, None, 1]
+        if latency is None:
+            if entry[0] is not None and self.get(key) < self.ceiling:
+                entry[2] *= 2
+                logger.debug("Timeout of %s backed off to %.3fs.", key, self.get(key))
+        elif entry[0] is None:
+            entry[:] = [latency, latency / 2.0, 1]
+        else:
+            entry[1] = (1 - self.beta) * entry[1] + self.beta * abs(entry[0] - latency)
+            entry[0] = (1 - self.alpha) * entry[0] + self.alpha * latency
+            entry[2] = 1
+
+    def remove(self, key):
+        """
+        Forget a service, does nothing if it is unknown.
+
+        :param key: hashable identifying the service
+        """
+        self._stats.pop(key, None)
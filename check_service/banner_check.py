@@ -0,0 +1,89 @@
+# encoding: utf-8
+"""
+banner_check -- connects, optionally sends a request, and matches what the server answers
+
+Works for services that greet the client (SMTP, SSH, FTP) or answer a short request (Redis).
+"""
+
+from check_service import CheckService, CheckResult
+import re
+import socket
+import logging
+
+from common.clock import monotonic
+from generic_tcp_connect import open_connection
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+# read at most this many bytes of the answer
+MAX_BANNER = 4096
+
+
+class BannerCheck(CheckService):
+
+    """
+    connects, optionally sends a request, and matches what the server answers
+    """
+
+    OPTIONS = ("send", "expect")
+
+    def __init__(self, host, port, protocol="BANNER", resolver=None, timeout=10, send=None, expect=None):
+        """
+        :param str host: FQDN or IP
+        :param integer port: port
+        :param str protocol: name of the protocol, only used in messages
+        :param DNSCache resolver: get addresses from here instead of resolving host on every run
+        :param float timeout: seconds to wait for the connection and the answer
+        :param str send: sent after connecting, escape sequences like \\r\\n are decoded, None to send nothing
+        :param str expect: regular expression that must match the start of the answer, None for any answer
+        """
+        super(BannerCheck, self).__init__(host, port, protocol)
+        self.resolver = resolver
+        self.timeout = timeout
+        self.send = send.decode("string_escape") if send else None
+        self.expect = re.compile(expect) if expect else None
+
+    def run(self):
+        """
+        Runs the check, raises no exception.
+
+        :return: result, true if success
+        :rtype: CheckResult
+        """
+        start = monotonic()
+        try:
+            sock = open_connection(self.host, self.port, self.resolver, self.timeout)
+            try:
+                if self.send:
+                    sock.sendall(self.send)
+                answer = ""
+                while len(answer) < MAX_BANNER:
+                    try:
+                        data = sock.recv(MAX_BANNER - len(answer))
+                    except socket.timeout:
+                        if not answer:
+                            raise
+                        # the server waits for us, match what it sent so far
+                        break
+                    if not data:
+                        break
+                    answer += data
+                    if self.expect is None or self.expect.match(answer):
+                        break
+            finally:
+                sock.close()
+        except Exception, e:
+            logger.debug("Could not check banner of %s:%d: %s", self.host, self.port, e)
+            return CheckResult(False, error=e)
+        if not answer or (self.expect and not self.expect.match(answer)):
+            error = "unexpected answer %r" % answer[:40]
+            logger.debug("Banner check of %s:%d failed: %s", self.host, self.port, error)
+            return CheckResult(False, error=error)
+        return CheckResult(True, monotonic() - start)
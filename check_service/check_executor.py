@@ -0,0 +1,80 @@
+# encoding: utf-8
+"""
+check_executor -- runs service checks concurrently in a bounded pool of threads
+"""
+
+import threading
+import Queue
+import logging
+
+from check_service import CheckResult
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class CheckExecutor(object):
+
+    """
+    Runs service checks concurrently in a bounded pool of threads.
+    """
+
+    def __init__(self, max_parallel=10):
+        """
+        :param integer max_parallel: maximum number of checks running at the same time
+        """
+        self.max_parallel = max(1, max_parallel)
+
+    def run(self, checks, stop_on_failure=False):
+        """
+        Runs the checks, raises no exception.
+
+        If stop_on_failure is set, checks after the first (in list order) failed check
+        are not started and not returned, just like running them one after the other.
+
+        :param list checks: CheckService objects
+        :param bool stop_on_failure: do not run checks after the first failed one
+        :return: results of check.run() in the order of checks
+        :rtype: list
+        """
+        results = [None] * len(checks)
+        first_failure = [len(checks)]
+        lock = threading.Lock()
+        jobs = Queue.Queue()
+        for num in range(len(checks)):
+            jobs.put(num)
+
+        def worker():
+            while True:
+                try:
+                    num = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                with lock:
+                    if num > first_failure[0]:
+                        continue
+                try:
+                    result = checks[num].run()
+                except Exception, e:
+                    logger.exception("Check %s:%s raised an exception.", checks[num].host, checks[num].port)
+                    result = CheckResult(False, error=e)
+                results[num] = result
+                if stop_on_failure and not result:
+                    with lock:
+                        first_failure[0] = min(first_failure[0], num)
+
+        threads = [threading.Thread(target=worker, name="check-%d" % num)
+                   for num in range(min(self.max_parallel, len(checks)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return results[:first_failure[0] + 1]
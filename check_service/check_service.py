@@ -1,6 +1,6 @@
 # encoding: utf-8
 """
-Base class for service check classes.
+Base class for service check classes and their result.
 """
 
 __author__ = "Daniel Tröder"
@@ -17,6 +17,11 @@ class CheckService(object):
     Base class for service check classes.
     """
 
+    # options from the [service ...] section of the config file, passed as keyword arguments to __init__()
+    OPTIONS = ()
+    # True for checks that only look at reports of the service (no connection, no port), they run in the daemon
+    PASSIVE = False
+
     def __init__(self, host, port, protocol="TCP"):
         """
         :param str host: FQDN or IP
@@ -31,7 +36,34 @@ class CheckService(object):
         """
         Runs the check, raises no exception.
 
-        :return: True if success
-        :rtype: bool
+        :return: result, true if success
+        :rtype: CheckResult
         """
         raise NotImplementedError
+
+
+class CheckResult(object):
+
+    """
+    Result of a check, true if the check succeeded.
+    """
+
+    __slots__ = ("success", "latency", "error")
+
+    def __init__(self, success, latency=None, error=None):
+        """
+        :param bool success: True if the check succeeded
+        :param float latency: seconds it took to connect, None if unknown
+        :param error: reason the check failed
+        """
+        self.success = bool(success)
+        self.latency = latency
+        self.error = error
+
+    def __nonzero__(self):
+        return self.success
+
+    def __repr__(self):
+        if self.success:
+            return "CheckResult(True, %s)" % ("%.6f" % self.latency if self.latency is not None else None)
+        return "CheckResult(False, error=%r)" % (self.error,)
@@ -0,0 +1,68 @@
+# encoding: utf-8
+"""
+confirmation -- confirm failed checks by probing the service again a few times
+
+After a failed check, the service is probed again after each of the delays. The failure
+is confirmed as soon as failures_needed of the (1 + number of delays) probes failed. It
+is cleared as soon as that cannot happen anymore.
+"""
+
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class Confirmation(object):
+
+    """
+    Confirm failed checks by probing the service again a few times.
+    """
+
+    def __init__(self, delays, failures_needed=1):
+        """
+        :param list delays: seconds to wait before each re-check, e.g. [2, 5, 15]
+        :param integer failures_needed: number of failed probes to confirm a failure
+        """
+        self.delays = list(delays)
+        self.failures_needed = min(max(1, failures_needed), len(self.delays) + 1)
+        self.pending = dict()  # key: [probes, failures]
+
+    def update(self, key, success):
+        """
+        Feed the result of a check or re-check.
+
+        :param key: hashable identifying the service
+        :param bool success: result of the probe
+        :return: (result, delay): result is True/False once decided, None while undecided,
+                 delay is the number of seconds to wait before the next re-check, if undecided
+        :rtype: tuple
+        """
+        if key not in self.pending and success:
+            return True, None
+        probes, failures = self.pending.pop(key, (0, 0))
+        probes += 1
+        failures += int(not success)
+        if failures >= self.failures_needed:
+            if probes > 1:
+                logger.debug("Failure of %s confirmed by %d of %d probes.", key, failures, probes)
+            return False, None
+        if failures + (len(self.delays) + 1 - probes) < self.failures_needed:
+            logger.debug("Failure of %s not confirmed, %d of %d probes failed.", key, failures, probes)
+            return True, None
+        self.pending[key] = [probes, failures]
+        return None, self.delays[probes - 1]
+
+    def forget(self, key):
+        """
+        Drop a pending confirmation.
+
+        :param key: hashable identifying the service
+        """
+        self.pending.pop(key, None)
@@ -0,0 +1,111 @@
+# encoding: utf-8
+"""
+dependencies -- services that can only be reached if other services are up
+
+A service can depend on other services (its parents), e.g. all services of a host on
+its SSH port, and that on the gateway. Parents are checked before their children, and
+the children of a service that is down are not checked at all: they would only wait for
+their timeouts. When notifying, failed services with a failed ancestor are left out, so
+the message names only the root cause.
+"""
+
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class Dependencies(object):
+
+    """
+    Services that can only be reached if other services are up.
+    """
+
+    def __init__(self, parents):
+        """
+        :param dict parents: {service name: [names of the services it depends on], ...}, every
+               service must be a key
+        :raises ValueError: if a parent is unknown or services depend on each other, with all problems
+        """
+        self.parents = dict((name, list(p)) for name, p in parents.items())
+        self.children = dict((name, list()) for name in self.parents)
+        errors = list()
+        for name, parent_names in sorted(self.parents.items()):
+            for parent in parent_names:
+                if parent not in self.parents:
+                    errors.append("%s depends on unknown service %s" % (name, parent))
+                elif parent == name:
+                    errors.append("%s depends on itself" % name)
+                else:
+                    self.children[parent].append(name)
+        if not errors:
+            errors.extend("dependency cycle %s" % " -> ".join(cycle) for cycle in self._cycles())
+        if errors:
+            raise ValueError(", ".join(errors))
+        self._depth = dict()
+        for name in self.parents:
+            self._get_depth(name)
+
+    def levels(self, names):
+        """
+        Order services so that parents come before their children.
+
+        :param list names: names of services
+        :return: [[names without parents among names], [their children], ...]
+        :rtype: list
+        """
+        if not any(self.parents[name] for name in names):
+            return [list(names)] if names else list()
+        levels = dict()
+        for name in names:
+            levels.setdefault(self._depth[name], list()).append(name)
+        return [levels[depth] for depth in sorted(levels)]
+
+    def down_ancestor(self, name, is_down):
+        """
+        :param str name: name of a service
+        :param is_down: function(name) returning True if a service is down
+        :return: name of the nearest ancestor that is down, None if all are up
+        :rtype: str
+        """
+        seen = set()
+        todo = list(self.parents[name])
+        while todo:
+            parent = todo.pop(0)
+            if parent in seen:
+                continue
+            seen.add(parent)
+            if is_down(parent):
+                return parent
+            todo.extend(self.parents[parent])
+        return None
+
+    def _get_depth(self, name):
+        # length of the longest chain of ancestors, parents are always on a lower level than their children
+        if name not in self._depth:
+            self._depth[name] = 1 + max([self._get_depth(parent) for parent in self.parents[name]] or [-1])
+        return self._depth[name]
+
+    def _cycles(self):
+        cycles = list()
+        state = dict()  # name: 1 while visiting its parents, 2 when done
+
+        def visit(name, path):
+            state[name] = 1
+            for parent in self.parents[name]:
+                if state.get(parent) == 1:
+                    cycles.append(path[path.index(parent):] + [parent])
+                elif parent not in state:
+                    visit(parent, path + [parent])
+            state[name] = 2
+
+        for name in sorted(self.parents):
+            if name not in state:
+                visit(name, [name])
+        return cycles
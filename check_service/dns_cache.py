@@ -0,0 +1,122 @@
+# encoding: utf-8
+"""
+dns_cache -- caches host name lookups for service checks
+
+Each host is looked up once and its addresses are kept for ttl seconds, no matter how many
+ports of it are checked. Failed lookups are remembered for negative_ttl seconds. If a host
+cannot be resolved anymore, but was resolved before, the old addresses are used.
+"""
+
+import socket
+import threading
+import logging
+from multiprocessing.pool import ThreadPool
+
+from common.clock import monotonic
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class DNSCache(object):
+
+    """
+    Caches host name lookups for service checks.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=30):
+        """
+        :param integer ttl: seconds to keep addresses of a host
+        :param integer negative_ttl: seconds to keep a failed lookup
+        """
+        self.ttl = max(0, ttl)
+        self.negative_ttl = max(0, negative_ttl)
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self._cache = dict()  # host: (expires, [addrinfo, ...] or None, socket.gaierror or None)
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """
+        Get the addresses of a host, from the cache if possible.
+
+        :param str host: FQDN or IP
+        :param integer port: port to put into the returned addresses
+        :return: list of (family, socktype, proto, canonname, sockaddr) like socket.getaddrinfo()
+        :rtype: list
+        :raises socket.gaierror: if the host could not be resolved
+        """
+        now = monotonic()
+        with self._lock:
+            expires, addrinfos, error = self._cache.get(host, (0, None, None))
+            if now < expires:
+                if addrinfos is None:
+                    self.negative_hits += 1
+                    raise error
+                self.hits += 1
+                return _with_port(addrinfos, port)
+            self.misses += 1
+
+        try:
+            new_addrinfos = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)
+        except socket.gaierror, e:
+            with self._lock:
+                if addrinfos:
+                    # better use old addresses than reporting the service as down
+                    logger.warn("Could not resolve '%s' (%s), using stale addresses.", host, e)
+                    self.stale_hits += 1
+                    self._cache[host] = (now + self.negative_ttl, addrinfos, None)
+                    return _with_port(addrinfos, port)
+                self._cache[host] = (now + self.negative_ttl, None, e)
+            raise
+
+        with self._lock:
+            self._cache[host] = (now + self.ttl, new_addrinfos, None)
+        return _with_port(new_addrinfos, port)
+
+    def prefetch(self, hosts, max_parallel=10):
+        """
+        Resolve hosts, that are not in the cache, in parallel. Raises no exception.
+
+        :param hosts: FQDNs or IPs
+        :param integer max_parallel: maximum number of lookups at the same time
+        """
+        now = monotonic()
+        with self._lock:
+            hosts = [host for host in set(hosts) if self._cache.get(host, (0,))[0] <= now]
+        if not hosts:
+            return
+        pool = ThreadPool(min(max_parallel, len(hosts)))
+        try:
+            pool.map(self._prefetch_one, hosts)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _prefetch_one(self, host):
+        try:
+            self.resolve(host, 0)
+        except socket.gaierror, e:
+            logger.debug("Could not resolve '%s': %s", host, e)
+
+    def stats(self):
+        """
+        :return: {hits, misses, stale_hits, negative_hits, size}
+        :rtype: dict
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "stale_hits": self.stale_hits,
+                    "negative_hits": self.negative_hits, "size": len(self._cache)}
+
+
+def _with_port(addrinfos, port):
+    return [(family, socktype, proto, canonname, (sockaddr[0], port) + tuple(sockaddr[2:]))
+            for family, socktype, proto, canonname, sockaddr in addrinfos]
@@ -3,10 +3,14 @@
 generic_tcp_connect -- tries to connect to a TCP socket
 """
 
-from check_service import CheckService
+from check_service import CheckService, CheckResult
 import socket
 import logging
 
+from common.clock import monotonic
+from instrumentation.metrics import REGISTRY
+from instrumentation.trace import TRACER
+
 __author__ = "Daniel Tröder"
 __copyright__ = "2015, Daniel Tröder"
 __credits__ = ["Daniel Tröder"]
@@ -16,6 +20,8 @@ __email__ = "daniel@admin-box.com"
 
 logger = logging.getLogger()
 
+CONNECT_SECONDS = REGISTRY.histogram("sms_notify_connect_seconds", "Time to connect to a service.", ["service"])
+
 
 class GenericTCPConnect(CheckService):
 
@@ -23,18 +29,74 @@ class GenericTCPConnect(CheckService):
     tries to connect to a TCP socket
     """
 
+    def __init__(self, host, port, protocol="TCP", resolver=None, timeout=10):
+        """
+        :param str host: FQDN or IP
+        :param integer port: port
+        :param str protocol: protocol to use (default is TCP)
+        :param DNSCache resolver: get addresses from here instead of resolving host on every run
+        :param float timeout: seconds to wait for the connection to be established
+        """
+        super(GenericTCPConnect, self).__init__(host, port, protocol)
+        self.resolver = resolver
+        self.timeout = timeout
+
     def run(self):
         """
         Runs the check, raises no exception.
 
-        :return: True if success
-        :rtype: bool
+        :return: result, true if success
+        :rtype: CheckResult
         """
+        start = monotonic()
         try:
-            s = socket.create_connection(address=(self.host, self.port), timeout=10)
-            s.close()
-            success = True
+            open_connection(self.host, self.port, self.resolver, self.timeout).close()
         except Exception, e:
-            success = False
             logger.debug("Could not connect to %s:%d (TCP): %s", self.host, self.port, e)
-        return success
+            return CheckResult(False, error=e)
+        result = CheckResult(True, monotonic() - start)
+        CONNECT_SECONDS.labels("%s:%d" % (self.host, self.port)).observe(result.latency)
+        return result
+
+
+def open_connection(host, port, resolver=None, timeout=10):
+    """
+    Connect to a TCP service.
+
+    :param str host: FQDN or IP
+    :param integer port: port
+    :param DNSCache resolver: get addresses from here, None to resolve host now
+    :param float timeout: seconds to wait for the connection and for each following operation on the socket
+    :return: connected socket
+    :rtype: socket.socket
+    :raises socket.error: if no connection could be established
+    """
+    with TRACER.span("connect", "check", host=host, port=port):
+        if resolver:
+            return connect(resolver.resolve(host, port), timeout)
+        return socket.create_connection(address=(host, port), timeout=timeout)
+
+
+def connect(addrinfos, timeout):
+    """
+    Connect to the first address that accepts the connection, like socket.create_connection().
+
+    :param list addrinfos: list of (family, socktype, proto, canonname, sockaddr)
+    :param float timeout: seconds to wait for each address
+    :return: connected socket
+    :rtype: socket.socket
+    :raises socket.error: if no connection could be established
+    """
+    error = socket.error("no address")
+    for family, socktype, proto, _, sockaddr in addrinfos:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            return sock
+        except socket.error, e:
+            error = e
+            if sock is not None:
+                sock.close()
+    raise error
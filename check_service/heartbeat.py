@@ -0,0 +1,297 @@
+# encoding: utf-8
+"""
+heartbeat -- passive services, that report to the daemon instead of being checked
+
+A passive service is given as push://name, name like a host name (e.g.
+push://nightly.backup1). It sends reports over UDP or HTTP POST to the
+HeartbeatReceiver, one per line:
+
+    push://nightly.backup1 ok
+    push://nightly.backup1 fail disk full
+
+The status is ok/up/1 or fail/down/0 (ok if missing), the rest of the line is the reason
+of a failure. The "check" of a passive service (HeartbeatCheck) opens no connection: it
+fails if the last report was a failure or if there was no report for longer than the
+deadline of the service (its interval plus its timeout), so a passive service counts for
+threshold, confirmation, dependencies and notifications like any other. Reports that
+change the status of a service make the daemon check it right away.
+
+There is no authentication, the heartbeat port must only be reachable from the services.
+"""
+
+import socket
+import threading
+import BaseHTTPServer
+import SocketServer
+import logging
+
+from check_service import CheckService, CheckResult
+from common.clock import monotonic
+from instrumentation.metrics import REGISTRY
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+REPORTS_TOTAL = REGISTRY.counter("sms_notify_heartbeats_total", "Reports of passive services, by result.",
+                                 ["result"])
+
+STATUSES = {"ok": True, "up": True, "1": True, "fail": False, "down": False, "0": False}
+# larger HTTP requests are rejected
+MAX_BODY = 1024 * 1024
+# seconds an HTTP client may take to send its request
+REQUEST_TIMEOUT = 5
+
+
+class HeartbeatStore(object):
+
+    """
+    Last report of each passive service. Thread safe.
+    """
+
+    def __init__(self, clock=monotonic):
+        """
+        :param clock: function returning the current monotonic time in seconds
+        """
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._deadlines = dict()  # name: seconds without report after which the service failed
+        self._since = dict()  # name: time the service is expected since
+        self._reports = dict()  # name: (time, success, reason)
+        self._changed = set()  # services whose status changed by a report
+
+    def expect(self, deadlines):
+        """
+        Set the passive services, e.g. after the services were reloaded. Reports of other
+        services are ignored.
+
+        :param dict deadlines: {name: seconds without report after which the service failed, ...}
+        """
+        now = self.clock()
+        with self._lock:
+            for name in set(self._deadlines) - set(deadlines):
+                self._since.pop(name, None)
+                self._reports.pop(name, None)
+                self._changed.discard(name)
+            for name in deadlines:
+                self._since.setdefault(name, now)
+            self._deadlines = dict(deadlines)
+
+    def report(self, name, success=True, reason=None):
+        """
+        Record a report of a service.
+
+        :param str name: name of the service
+        :param bool success: status the service reported
+        :param str reason: why it failed, None if not given
+        :return: False if name is not a passive service
+        :rtype: bool
+        """
+        now = self.clock()
+        with self._lock:
+            if name not in self._deadlines:
+                return False
+            if self._status(name, now).success != success:
+                self._changed.add(name)
+            self._reports[name] = (now, success, reason)
+        return True
+
+    def status(self, name):
+        """
+        :param str name: name of a passive service
+        :return: failed if the last report was a failure or too old, success (without latency) otherwise
+        :rtype: CheckResult
+        """
+        with self._lock:
+            return self._status(name, self.clock())
+
+    def pop_changed(self):
+        """
+        :return: services whose status changed by a report since the last call
+        :rtype: set
+        """
+        with self._lock:
+            changed = self._changed
+            self._changed = set()
+        return changed
+
+    def _status(self, name, now):
+        deadline = self._deadlines.get(name)
+        if deadline is None:
+            return CheckResult(False, error="not a passive service")
+        report = self._reports.get(name)
+        if report is None:
+            if now - self._since[name] > deadline:
+                return CheckResult(False, error="no report for %ds" % (now - self._since[name]))
+            # give it the time to report after the start
+            return CheckResult(True)
+        received, success, reason = report
+        if now - received > deadline:
+            return CheckResult(False, error="no report for %ds" % (now - received))
+        if not success:
+            return CheckResult(False, error=reason or "reported failure")
+        return CheckResult(True)
+
+
+HEARTBEATS = HeartbeatStore()
+
+
+class HeartbeatCheck(CheckService):
+
+    """
+    Status of a passive service, from its last report in HEARTBEATS.
+    """
+
+    OPTIONS = ("name",)
+    PASSIVE = True
+
+    def __init__(self, host, port, protocol="PUSH", resolver=None, timeout=10, name=None):
+        """
+        :param str host: name of the service without push://, only for messages
+        :param integer port: 0
+        :param str protocol: PUSH
+        :param resolver: ignored
+        :param float timeout: ignored, part of the deadline given to HEARTBEATS
+        :param str name: name of the service, as in its reports
+        """
+        super(HeartbeatCheck, self).__init__(host, port, protocol)
+        self.name = name
+
+    def run(self):
+        """
+        Runs the check, raises no exception.
+
+        :return: result, true if success
+        :rtype: CheckResult
+        """
+        result = HEARTBEATS.status(self.name)
+        if not result:
+            logger.debug("Passive service %s failed: %s", self.name, result.error)
+        return result
+
+
+def parse_reports(data, store=HEARTBEATS):
+    """
+    Record the reports in data.
+
+    :param str data: one report per line: name [status [reason]]
+    :param HeartbeatStore store: record the reports here
+    :return: number of accepted reports, number of reports of unknown services or with invalid status
+    :rtype: tuple
+    """
+    accepted = rejected = 0
+    for line in data.splitlines():
+        fields = line.split(None, 2)
+        if not fields:
+            continue
+        status = fields[1].lower() if len(fields) > 1 else "ok"
+        if status in STATUSES and store.report(fields[0], STATUSES[status], fields[2] if len(fields) > 2 else None):
+            accepted += 1
+        else:
+            rejected += 1
+            logger.debug("Ignoring report %r.", line[:200])
+    REPORTS_TOTAL.labels("accepted").inc(accepted)
+    REPORTS_TOTAL.labels("rejected").inc(rejected)
+    return accepted, rejected
+
+
+class HeartbeatReceiver(object):
+
+    """
+    Receives reports of passive services over UDP and HTTP POST on the same port, in background threads.
+    """
+
+    def __init__(self, store=HEARTBEATS, address="127.0.0.1", port=9136):
+        """
+        :param HeartbeatStore store: record the reports here
+        :param str address: address to listen on
+        :param integer port: UDP and TCP port to listen on
+        :raises socket.error: if the port cannot be opened
+        """
+        self.store = store
+        self._server = _ThreadingHTTPServer((address, port), _ReportHandler)
+        self._server.store = store
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((address, self._server.server_address[1]))
+        # wake up regularly, to notice stop()
+        self._sock.settimeout(1.0)
+        self._stop = threading.Event()
+        self._threads = list()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        """
+        Start receiving reports in background threads.
+        """
+        for target, thread_name in [(self._server.serve_forever, "heartbeat-http"),
+                                    (self._receive, "heartbeat-udp")]:
+            thread = threading.Thread(target=target, name=thread_name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop receiving and close the ports.
+        """
+        self._stop.set()
+        if self._threads:
+            self._server.shutdown()
+        self._server.server_close()
+        self._sock.close()
+
+    def _receive(self):
+        while not self._stop.is_set():
+            try:
+                data, _ = self._sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except socket.error:
+                if self._stop.is_set():
+                    return
+                logger.exception("Receiving heartbeats.")
+                continue
+            parse_reports(data, self.store)
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    # a thread per request, so that a slow or idle client does not block the reports of others
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        logger.debug("Heartbeat request from %s failed.", client_address[0], exc_info=True)
+
+
+class _ReportHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # close connections of clients that do not send their request
+    timeout = REQUEST_TIMEOUT
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.send_error(411)
+            return
+        if not 0 <= length <= MAX_BODY:
+            self.send_error(413)
+            return
+        accepted, rejected = parse_reports(self.rfile.read(length), self.server.store)
+        body = "accepted %d, rejected %d\n" % (accepted, rejected)
+        self.send_response(200 if accepted or not rejected else 404)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug("Heartbeat request from %s: %s", self.client_address[0], fmt % args)
@@ -0,0 +1,155 @@
+# encoding: utf-8
+"""
+http_check -- requests a page over HTTP or HTTPS and checks the status and the body of the response
+
+Connections are kept open between checks in POOL, see http_pool.
+"""
+
+from check_service import CheckService, CheckResult
+import re
+import ssl
+import httplib
+import logging
+
+from common.clock import monotonic
+from generic_tcp_connect import open_connection
+from http_pool import HTTPPool
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+USER_AGENT = "sms_notify_if_host_down"
+
+# read at most this many bytes of the body
+MAX_BODY = 65536
+
+# keep-alive connections of all HTTP checks
+POOL = HTTPPool()
+
+
+class HTTPCheck(CheckService):
+
+    """
+    requests a page over HTTP or HTTPS and checks the status and the body of the response
+    """
+
+    OPTIONS = ("path", "expect_status", "expect_body", "tls_verify")
+
+    def __init__(self, host, port, protocol="HTTP", resolver=None, timeout=10, path="/", expect_status="2xx,3xx",
+                 expect_body=None, tls_verify=True):
+        """
+        :param str host: FQDN or IP
+        :param integer port: port
+        :param str protocol: HTTP or HTTPS
+        :param DNSCache resolver: get addresses from here instead of resolving host on every run
+        :param float timeout: seconds to wait for the connection and the response
+        :param str path: path (and query) of the page
+        :param str expect_status: comma separated status codes or classes like 2xx
+        :param str expect_body: regular expression that must match (a part of) the body, None for any body
+        :param bool tls_verify: check the certificate of the server (HTTPS only)
+        """
+        super(HTTPCheck, self).__init__(host, port, protocol)
+        self.resolver = resolver
+        self.timeout = timeout
+        self.path = path or "/"
+        self.expect_status = [x.strip().lower() for x in expect_status.split(",") if x.strip()]
+        self.expect_body = re.compile(expect_body) if expect_body else None
+        self.tls_verify = tls_verify
+
+    def run(self):
+        """
+        Runs the check, raises no exception.
+
+        :return: result, true if success
+        :rtype: CheckResult
+        """
+        start = monotonic()
+        try:
+            status, body = POOL.request((self.protocol, self.host, self.port, self.tls_verify), self.connection,
+                                        self.path, {"User-Agent": USER_AGENT}, self.timeout, MAX_BODY)
+        except Exception, e:
+            logger.debug("Could not get %s: %s", self.url(), e)
+            return CheckResult(False, error=e)
+        error = self.check_response(status, body)
+        if error:
+            logger.debug("Check of %s failed: %s", self.url(), error)
+            return CheckResult(False, error=error)
+        return CheckResult(True, monotonic() - start)
+
+    def connection(self):
+        """
+        :return: new connection to the server, not connected yet
+        :rtype: httplib.HTTPConnection
+        """
+        if self.protocol == "HTTPS":
+            return ResolvingHTTPSConnection(self.host, self.port, self.timeout, self.resolver,
+                                            tls_context(self.tls_verify))
+        return ResolvingHTTPConnection(self.host, self.port, self.timeout, self.resolver)
+
+    def check_response(self, status, body):
+        """
+        :param integer status: HTTP status code
+        :param str body: (start of the) body
+        :return: why the response is not as expected, None if it is
+        :rtype: str
+        """
+        if not any(str(status) == x or (x.endswith("xx") and str(status)[0] == x[0]) for x in self.expect_status):
+            return "status %d" % status
+        if self.expect_body and not self.expect_body.search(body):
+            return "body does not match '%s'" % self.expect_body.pattern
+        return None
+
+    def url(self):
+        """
+        :return: URL of the page
+        :rtype: str
+        """
+        return "%s://%s:%d%s" % (self.protocol.lower(), self.host, self.port, self.path)
+
+
+class ResolvingHTTPConnection(httplib.HTTPConnection):
+
+    """
+    HTTP connection that gets the address of the server from a DNSCache.
+    """
+
+    def __init__(self, host, port, timeout, resolver=None):
+        httplib.HTTPConnection.__init__(self, host, port, timeout=timeout)
+        self.resolver = resolver
+
+    def connect(self):
+        self.sock = open_connection(self.host, self.port, self.resolver, self.timeout)
+
+
+class ResolvingHTTPSConnection(httplib.HTTPSConnection):
+
+    """
+    HTTPS connection that gets the address of the server from a DNSCache.
+    """
+
+    def __init__(self, host, port, timeout, resolver=None, context=None):
+        httplib.HTTPSConnection.__init__(self, host, port, timeout=timeout, context=context)
+        self.resolver = resolver
+
+    def connect(self):
+        sock = open_connection(self.host, self.port, self.resolver, self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def tls_context(verify=True):
+    """
+    :param bool verify: check the certificate and host name of the server
+    :return: context for TLS connections
+    :rtype: ssl.SSLContext
+    """
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
@@ -0,0 +1,230 @@
+# encoding: utf-8
+"""
+http_pool -- keeps HTTP(S) connections to the checked servers open between checks
+
+Each server (protocol, host, port) has its own pool. A check borrows an idle connection
+if there is one, so a check every minute does not need a new TCP and TLS handshake every
+minute. At most max_per_host connections per server are open at the same time, a check
+waits for a free one if necessary. Connections idle for longer than idle_timeout are
+closed.
+
+Servers close idle keep-alive connections after some time. A pooled connection the
+server has closed is noticed before it is used (it is readable), or when the request on
+it fails right away. In both cases the request is sent once more on a new connection,
+within the rest of the timeout, so that a stale connection does not make a check fail.
+Errors on a new connection are not retried. A connection dropped silently by a NAT or
+firewall on the way cannot be told apart from a slow server: it looks alive but never
+answers, and the check times out. idle_timeout must be shorter than the idle timeout of
+such devices, so that their dropped connections are not used again.
+
+The time a check waits for a free connection counts against its timeout.
+"""
+
+import select
+import socket
+import httplib
+import threading
+import logging
+
+from common.clock import monotonic
+from instrumentation.metrics import REGISTRY
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+CONNECTIONS_TOTAL = REGISTRY.counter("sms_notify_http_connections_total",
+                                     "HTTP connections used by checks, by whether they were new, reused or stale.",
+                                     ["result"])
+
+# errors on a reused connection after which the request is sent again on a new one, if there is time left,
+# except socket.timeout: the request used all of it
+STALE_ERRORS = (socket.error, httplib.BadStatusLine, httplib.IncompleteRead)
+
+
+class HTTPPool(object):
+
+    """
+    Keeps HTTP(S) connections to the checked servers open between checks.
+    """
+
+    def __init__(self, max_per_host=2, idle_timeout=120.0, clock=monotonic):
+        """
+        :param integer max_per_host: maximum number of open connections to a server, 0 to not keep connections
+        :param float idle_timeout: close connections that were not used for x seconds
+        :param clock: function returning the current monotonic time in seconds
+        """
+        self.max_per_host = max(0, max_per_host)
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = dict()  # key: [(connection, time it was last used), ...], most recently used last
+        self._open = dict()  # key: number of open connections, idle and in use
+        self._last_sweep = clock()
+
+    def configure(self, max_per_host, idle_timeout):
+        """
+        Change the limits, closes all idle connections.
+
+        :param integer max_per_host: maximum number of open connections to a server, 0 to not keep connections
+        :param float idle_timeout: close connections that were not used for x seconds
+        """
+        self.close_idle()
+        with self._cond:
+            self.max_per_host = max(0, max_per_host)
+            self.idle_timeout = idle_timeout
+            self._cond.notify_all()
+
+    def request(self, key, factory, path, headers, timeout, max_body):
+        """
+        Send a GET request on a pooled or new connection and read the response.
+
+        :param key: hashable identifying the server, e.g. (protocol, host, port)
+        :param factory: function returning a new (not yet connected) httplib.HTTPConnection
+        :param str path: path (and query) of the page
+        :param dict headers: request headers
+        :param float timeout: seconds to wait for a free connection, the connection and the response
+        :param integer max_body: read at most this many bytes of the body
+        :return: (status, body)
+        :rtype: tuple
+        :raises Exception: if there was an error connecting or reading the response
+        """
+        if not self.max_per_host:
+            conn = factory()
+            try:
+                status, body, _ = _get(conn, path, headers, max_body)
+            finally:
+                conn.close()
+            CONNECTIONS_TOTAL.labels("new").inc()
+            return status, body
+
+        deadline = self.clock() + timeout
+        conn, reused = self._borrow(key, factory, deadline)
+        try:
+            _set_timeout(conn, _remaining(deadline, self.clock()))
+            try:
+                status, body, keep = _get(conn, path, headers, max_body)
+            except STALE_ERRORS, e:
+                if not reused or isinstance(e, socket.timeout) or deadline <= self.clock():
+                    raise
+                logger.debug("Pooled connection to %s:%d failed (%s), trying a new one.", conn.host, conn.port, e)
+                CONNECTIONS_TOTAL.labels("stale").inc()
+                conn.close()
+                conn = factory()
+                _set_timeout(conn, _remaining(deadline, self.clock()))
+                status, body, keep = _get(conn, path, headers, max_body)
+        except Exception:
+            conn.close()
+            self._release(key, None)
+            raise
+        self._release(key, conn if keep else None)
+        return status, body
+
+    def close_idle(self):
+        """
+        Close all idle connections.
+        """
+        with self._cond:
+            idle = self._idle
+            self._idle = dict()
+            for key, connections in idle.items():
+                self._open[key] -= len(connections)
+            self._cond.notify_all()
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def _borrow(self, key, factory, deadline):
+        stale = list()
+        try:
+            with self._cond:
+                now = self.clock()
+                if now - self._last_sweep >= 1:
+                    # also close idle connections of servers that are not checked anymore
+                    self._last_sweep = now
+                    for other in self._idle.keys():
+                        stale.extend(self._evict(other))
+                while True:
+                    stale.extend(self._evict(key))
+                    idle = self._idle.get(key)
+                    while idle:
+                        conn, _ = idle.pop()
+                        if _is_alive(conn):
+                            CONNECTIONS_TOTAL.labels("reused").inc()
+                            return conn, True
+                        CONNECTIONS_TOTAL.labels("stale").inc()
+                        stale.append(conn)
+                        self._open[key] -= 1
+                    if self._open.get(key, 0) < self.max_per_host:
+                        self._open[key] = self._open.get(key, 0) + 1
+                        CONNECTIONS_TOTAL.labels("new").inc()
+                        return factory(), False
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        raise socket.timeout("no free connection to the server")
+                    self._cond.wait(remaining)
+        finally:
+            for conn in stale:
+                conn.close()
+
+    def _release(self, key, conn):
+        # give a connection back, or None if it was closed
+        with self._cond:
+            if conn is None:
+                self._open[key] -= 1
+            else:
+                self._idle.setdefault(key, list()).append((conn, self.clock()))
+            self._cond.notify()
+
+    def _evict(self, key):
+        # remove connections of the server that are idle for too long, return them to be closed
+        idle = self._idle.get(key)
+        if not idle:
+            return list()
+        now = self.clock()
+        expired = [conn for conn, last_used in idle if now - last_used >= self.idle_timeout]
+        if expired:
+            idle[:] = [(conn, last_used) for conn, last_used in idle if now - last_used < self.idle_timeout]
+            self._open[key] -= len(expired)
+        return expired
+
+
+def _get(conn, path, headers, max_body):
+    # return (status, body, True if the connection can be used again)
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    body = response.read(max_body)
+    keep = not response.will_close and response.isclosed()
+    if not response.isclosed():
+        # body not read completely
+        response.close()
+    return response.status, body, keep
+
+
+def _set_timeout(conn, timeout):
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+
+
+def _remaining(deadline, now):
+    # seconds left until the deadline
+    if deadline <= now:
+        raise socket.timeout("timed out")
+    return deadline - now
+
+
+def _is_alive(conn):
+    # an idle connection must not be readable: the server closed it or sent something unexpected
+    if conn.sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return False
+    return not readable
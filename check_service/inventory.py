@@ -0,0 +1,309 @@
+# encoding: utf-8
+"""
+inventory -- reads the services to check from the command line, inventory files and the config file
+
+An inventory file lists one service per line, optionally followed by options of the
+service as option=value pairs (depends as comma separated list). Empty lines and lines
+starting with # are ignored:
+
+    db1:5432 priority=10 depends=db1:22
+    [2001:db8::1]:22
+    https://www.example.com/health expect_status=200
+
+Instead of a file a directory can be given, all its files are read in alphabetical
+order. Options in [host name] sections of the config file apply to all services of a
+host, unless they are set for the service on its line or in its [service name] section.
+
+All services are read in a single pass with precompiled validators. Errors do not stop
+the reading, they are collected and reported together, so that a list of thousands of
+services can be fixed in one go. Services are kept in Service objects with __slots__,
+which use much less memory than a dict per service.
+"""
+
+import os
+import re
+import socket
+import logging
+import ConfigParser
+
+from registry import parse_service, check_class_for
+from dependencies import Dependencies
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+# options that can be set for single services in the inventory or the config file: type
+SERVICE_OPTIONS = {"cert_min_days": int, "depends": list, "expect": str, "expect_body": str, "expect_status": str,
+                   "interval": float, "latency_threshold": float, "msg_limit": int, "priority": int, "send": str,
+                   "timeout": float, "tls_verify": bool}
+
+BOOLEANS = {"1": True, "yes": True, "true": True, "on": True, "0": False, "no": False, "false": False, "off": False}
+
+# https://stackoverflow.com/questions/2532053/validate-a-hostname-string
+HOSTNAME_LABEL = re.compile(r"(?!-)[A-Z\d-]{1,63}(?<!-)$", re.IGNORECASE)
+IPV4 = re.compile(r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
+DEPENDS_SEPARATOR = re.compile(r"[\s,]+")
+
+
+class InventoryError(ValueError):
+
+    """
+    The inventory has errors, all of them are in errors.
+    """
+
+    def __init__(self, errors):
+        """
+        :param list errors: descriptions of the errors, with their source
+        """
+        super(InventoryError, self).__init__("%d error(s) in services:\n  %s" % (len(errors), "\n  ".join(errors)))
+        self.errors = errors
+
+
+class Service(object):
+
+    """
+    A service to check. Options can be read like dict items (service["port"]), options that
+    were not set are missing ("expect" in service is False).
+    """
+
+    __slots__ = ("name", "scheme", "protocol", "host", "port", "path") + tuple(sorted(SERVICE_OPTIONS))
+
+    def __init__(self, **options):
+        for option, value in options.items():
+            setattr(self, option, value)
+
+    def __getitem__(self, option):
+        try:
+            return getattr(self, option)
+        except AttributeError:
+            raise KeyError(option)
+
+    def __setitem__(self, option, value):
+        try:
+            setattr(self, option, value)
+        except AttributeError:
+            raise KeyError(option)
+
+    def __contains__(self, option):
+        return hasattr(self, option)
+
+    def get(self, option, default=None):
+        return getattr(self, option, default)
+
+    def __repr__(self):
+        return "Service(%s)" % self.name
+
+
+class Inventory(object):
+
+    """
+    Collects services from the command line, inventory files and the config file.
+    """
+
+    def __init__(self, defaults):
+        """
+        :param dict defaults: default values of SERVICE_OPTIONS for all services
+        """
+        self.defaults = defaults
+        self.errors = list()
+        self._services = list()
+        self._sources = dict()  # service name: where it was listed first
+        self._own_options = dict()  # service name: options set on the line of the service
+
+    def add(self, spec, source="services option", options=None):
+        """
+        Add a service, errors are collected.
+
+        :param str spec: host:port or URI
+        :param str source: where spec was found, for error messages
+        :param dict options: options of the service as strings, e.g. {"priority": "10"}
+        :return: the service, None if spec or options are invalid
+        :rtype: Service
+        """
+        try:
+            service = parse_service(spec)
+        except ValueError, e:
+            self.errors.append("%s: invalid service '%s': %s" % (source, spec, e))
+            return None
+        error = host_error(service["host"])
+        if check_class_for(service).PASSIVE:
+            # the host is the name of a passive service, it is given in messages
+            if not error and (service["port"] or service["path"].strip("/")):
+                error = "a passive service has only a name, push://name"
+        elif not error and not 0 < service["port"] < 65536:
+            error = "invalid port %d" % service["port"]
+        if not error and service["name"] in self._sources:
+            error = "already listed in %s" % self._sources[service["name"]]
+        if error:
+            self.errors.append("%s: invalid service '%s': %s" % (source, spec, error))
+            return None
+        self._sources[service["name"]] = source
+        values = dict(self.defaults)
+        values.update(service)
+        for option, value in (options or dict()).items():
+            try:
+                values[option] = convert(option, value)
+            except ValueError, e:
+                self.errors.append("%s: invalid option %s of %s: %s" % (source, option, service["name"], e))
+        if options:
+            self._own_options[service["name"]] = set(options)
+        service = Service(**values)
+        self._services.append(service)
+        return service
+
+    def load(self, path):
+        """
+        Add the services of an inventory file, or of all files in a directory.
+
+        :param str path: file or directory
+        """
+        if os.path.isdir(path):
+            paths = [os.path.join(path, x) for x in sorted(os.listdir(path))
+                     if not x.startswith(".") and not x.endswith("~")]
+            paths = [x for x in paths if os.path.isfile(x)]
+        else:
+            paths = [path]
+        for path in paths:
+            try:
+                with open(path, "rb") as inventory_file:
+                    for number, line in enumerate(inventory_file, 1):
+                        fields = line.split()
+                        if not fields or fields[0].startswith("#"):
+                            continue
+                        source = "%s:%d" % (path, number)
+                        options = dict()
+                        for field in fields[1:]:
+                            option, sep, value = field.partition("=")
+                            if not sep or option not in SERVICE_OPTIONS:
+                                self.errors.append("%s: unknown option '%s'" % (source, field))
+                            else:
+                                options[option] = value
+                        self.add(fields[0], source, options)
+            except (IOError, OSError), e:
+                self.errors.append("%s: %s" % (path, e))
+
+    def read_config(self, conf_file):
+        """
+        Set the options in [host name] and [service name] sections of the config file.
+
+        :param str conf_file: path to config file
+        """
+        config = ConfigParser.SafeConfigParser()
+        config.read([conf_file])
+        sections = set(config.sections())
+        for service in self._services:
+            own_options = self._own_options.get(service.name, ())
+            # a section name cannot contain "]", IPv6 addresses are written without brackets there
+            name = service.name.replace("[", "").replace("]", "")
+            for section in ("host %s" % service.host, "service %s" % name):
+                if section not in sections:
+                    continue
+                for option in config.options(section):
+                    if option not in SERVICE_OPTIONS:
+                        # e.g. from the [DEFAULT] section, which is part of every section
+                        continue
+                    if section.startswith("host ") and option in own_options:
+                        continue
+                    try:
+                        # no interpolation, so that regular expressions can contain %
+                        service[option] = convert(option, config.get(section, option, raw=True))
+                    except ValueError, e:
+                        self.errors.append("%s: invalid option %s in section [%s]: %s" % (conf_file, option, section,
+                                                                                          e))
+
+    def services(self):
+        """
+        :return: all services, in the order they were added
+        :rtype: list
+        :raises InventoryError: with all errors found while adding services and in their options
+        """
+        errors = list(self.errors)
+        for service in self._services:
+            # a service does not depend on itself through the section of its host
+            service.depends = [x for x in service.depends if x != service.name]
+            if service.interval <= 0:
+                errors.append("%s: interval must be positive" % service.name)
+            if service.latency_threshold < 0:
+                errors.append("%s: latency_threshold must not be negative" % service.name)
+            if service.timeout < 0:
+                errors.append("%s: timeout must not be negative" % service.name)
+            if service.get("cert_min_days") and service.get("tls_verify") is False:
+                # the certificate is only decoded if it was verified
+                errors.append("%s: cert_min_days needs tls_verify" % service.name)
+        try:
+            Dependencies(dict((service.name, service.depends) for service in self._services))
+        except ValueError, e:
+            errors.append("invalid dependencies: %s" % e)
+        if errors:
+            raise InventoryError(errors)
+        return list(self._services)
+
+
+def diff_services(old, new):
+    """
+    :param list old: Service objects
+    :param list new: Service objects
+    :return: (added, removed, changed), names of the services
+    :rtype: tuple
+    """
+    old = dict((service.name, service) for service in old)
+    new_names = set(service.name for service in new)
+    added = [service.name for service in new if service.name not in old]
+    removed = [name for name in old if name not in new_names]
+    changed = [service.name for service in new if service.name in old and
+               _values(service) != _values(old[service.name])]
+    return added, removed, changed
+
+
+def _values(service):
+    return tuple(getattr(service, option, None) for option in Service.__slots__)
+
+
+def convert(option, value):
+    """
+    :param str option: name of an option in SERVICE_OPTIONS
+    :param str value: value as read from a file
+    :return: value of the type of the option
+    :raises ValueError: if value cannot be converted
+    """
+    option_type = SERVICE_OPTIONS[option]
+    if option_type == bool:
+        if value.lower() not in BOOLEANS:
+            raise ValueError("not a boolean: %s" % value)
+        return BOOLEANS[value.lower()]
+    elif option_type == list:
+        return [x for x in DEPENDS_SEPARATOR.split(value) if x]
+    return option_type(value)
+
+
+def host_error(host):
+    """
+    :param str host: host name, IPv4 or IPv6 address
+    :return: why host is invalid, None if it is valid
+    :rtype: str
+    """
+    if ":" in host:
+        try:
+            # without zone index (fe80::1%eth0)
+            socket.inet_pton(socket.AF_INET6, host.partition("%")[0])
+        except (socket.error, ValueError):
+            return "invalid IPv6 address '%s'" % host
+        return None
+    if IPV4.match(host):
+        if any(int(octet) > 255 for octet in host.split(".")):
+            return "invalid IP '%s'" % host
+        return None
+    if len(host) > 255:
+        return "hostname too long"
+    if host.endswith("."):
+        # strip exactly one dot from the right, if present
+        host = host[:-1]
+    if not all(HOSTNAME_LABEL.match(x) for x in host.split(".")):
+        return "invalid hostname '%s'" % host
+    return None
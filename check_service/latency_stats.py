@@ -0,0 +1,164 @@
+# encoding: utf-8
+"""
+latency_stats -- percentiles of the connect time of each service, in bounded space
+
+Connect times are counted in a histogram with logarithmic buckets (each bucket is 2%
+wider than the one before, from 10 microseconds to 60 seconds), like an HDR histogram.
+A percentile read from it is off by at most 2%, and a histogram never has more than
+about 800 buckets, however many samples it got. To follow changes of the latency, each
+service has two histograms: samples go into the current one, and when it is full, it
+replaces the previous one. Percentiles are read from both, so they cover the last
+window/2 to window samples.
+
+A service is slow while its percentile is above its threshold. It is not slow anymore
+when the percentile dropped below a fraction (hysteresis) of the threshold, so that a
+latency close to the threshold does not switch back and forth.
+"""
+
+import math
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+MIN_LATENCY = 1e-5
+MAX_LATENCY = 60.0
+PRECISION = 0.02
+
+_LOG_BASE = math.log(1 + PRECISION)
+_MAX_BUCKET = int(math.log(MAX_LATENCY / MIN_LATENCY) / _LOG_BASE)
+
+
+def bucket(seconds):
+    """
+    :param float seconds: latency
+    :return: number of the histogram bucket
+    :rtype: integer
+    """
+    if seconds <= MIN_LATENCY:
+        return 0
+    return min(_MAX_BUCKET, int(math.log(seconds / MIN_LATENCY) / _LOG_BASE) + 1)
+
+
+def bucket_limit(num):
+    """
+    :param integer num: number of the histogram bucket
+    :return: largest latency counted in the bucket
+    :rtype: float
+    """
+    return MIN_LATENCY * (1 + PRECISION) ** num
+
+
+class LatencyStats(object):
+
+    """
+    Percentiles of the connect time of each service.
+    """
+
+    def __init__(self, window=100, percentile=95.0, min_samples=5, hysteresis=0.8):
+        """
+        :param integer window: number of recent samples the percentiles are taken from
+        :param float percentile: percentile compared to the thresholds
+        :param integer min_samples: number of samples needed before a service can be slow
+        :param float hysteresis: a slow service is not slow anymore when the percentile is below this
+               fraction of the threshold
+        """
+        self.half_window = max(1, window // 2)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.hysteresis = hysteresis
+        self.slow = set()  # keys of slow services
+        self._histograms = dict()  # key: [current {bucket: count}, samples in current, previous {bucket: count}]
+
+    def add(self, key, seconds):
+        """
+        :param key: hashable identifying the service
+        :param float seconds: connect time
+        """
+        entry = self._histograms.get(key)
+        if entry is None:
+            entry = self._histograms[key] = [dict(), 0, dict()]
+        if entry[1] >= self.half_window:
+            entry[:] = [dict(), 0, entry[0]]
+        num = bucket(seconds)
+        entry[0][num] = entry[0].get(num, 0) + 1
+        entry[1] += 1
+
+    def count(self, key):
+        """
+        :param key: hashable identifying the service
+        :return: number of samples the percentiles are taken from
+        :rtype: integer
+        """
+        entry = self._histograms.get(key)
+        if entry is None:
+            return 0
+        return entry[1] + sum(entry[2].values())
+
+    def get_percentile(self, key, percentile=None):
+        """
+        :param key: hashable identifying the service
+        :param float percentile: e.g. 99.9, None for the percentile set in the constructor
+        :return: latency in seconds, None if there are no samples
+        :rtype: float
+        """
+        entry = self._histograms.get(key)
+        if entry is None:
+            return None
+        counts = dict(entry[2])
+        for num, count in entry[0].items():
+            counts[num] = counts.get(num, 0) + count
+        total = sum(counts.values())
+        if not total:
+            return None
+        rank = math.ceil(total * (self.percentile if percentile is None else percentile) / 100.0)
+        seen = 0
+        for num in sorted(counts):
+            seen += counts[num]
+            if seen >= rank:
+                return bucket_limit(num)
+        return bucket_limit(max(counts))
+
+    def update(self, key, seconds, threshold):
+        """
+        Add a sample and compare the percentile to the threshold.
+
+        :param key: hashable identifying the service
+        :param float seconds: connect time
+        :param float threshold: seconds, 0 to disable
+        :return: True if the service became slow, False if it is not slow anymore, None if nothing changed
+        :rtype: bool
+        """
+        self.add(key, seconds)
+        if not threshold:
+            if key in self.slow:
+                self.slow.discard(key)
+                return False
+            return None
+        if self.count(key) < self.min_samples:
+            return None
+        value = self.get_percentile(key)
+        if key not in self.slow and value > threshold:
+            self.slow.add(key)
+            logger.info("Service %s is slow, p%g of connect time is %.3fs.", key, self.percentile, value)
+            return True
+        elif key in self.slow and value < threshold * self.hysteresis:
+            self.slow.discard(key)
+            logger.info("Service %s is not slow anymore, p%g of connect time is %.3fs.", key, self.percentile, value)
+            return False
+        return None
+
+    def remove(self, key):
+        """
+        Forget a service, does nothing if it is unknown.
+
+        :param key: hashable identifying the service
+        """
+        self._histograms.pop(key, None)
+        self.slow.discard(key)
@@ -0,0 +1,316 @@
+# encoding: utf-8
+"""
+nonblocking_tcp_connect -- tries to connect to many TCP sockets at once from a single thread
+
+Instead of one blocking socket per check, ConnectProber starts non-blocking connect() calls
+for a whole list of checks and collects their completions with epoll (or poll/select where
+epoll is not available). The number of sockets open at the same time is limited.
+"""
+
+from check_service import CheckService, CheckResult
+import socket
+import select
+import errno
+import heapq
+import os
+import threading
+import logging
+
+from common.clock import monotonic
+from generic_tcp_connect import CONNECT_SECONDS
+from check_executor import CheckExecutor
+from instrumentation.trace import TRACER
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK)
+
+
+class NonBlockingTCPConnect(CheckService):
+
+    """
+    tries to connect to a TCP socket, without blocking when run by a ConnectProber
+    """
+
+    def __init__(self, host, port, protocol="TCP", resolver=None, timeout=10):
+        """
+        :param str host: FQDN or IP
+        :param integer port: port
+        :param str protocol: protocol to use (default is TCP)
+        :param DNSCache resolver: get addresses from here instead of resolving host on every run
+        :param float timeout: seconds to wait for the connection to be established
+        """
+        super(NonBlockingTCPConnect, self).__init__(host, port, protocol)
+        self.resolver = resolver
+        self.timeout = timeout
+
+    def run(self):
+        """
+        Runs the check, raises no exception.
+
+        :return: result, true if success
+        :rtype: CheckResult
+        """
+        return ConnectProber().run([self])[0]
+
+
+class ConnectProber(object):
+
+    """
+    Runs TCP connect checks concurrently on a single thread.
+    """
+
+    def __init__(self, max_parallel=256, max_threads=10):
+        """
+        :param integer max_parallel: maximum number of sockets open at the same time
+        :param integer max_threads: maximum number of threads for checks that are not NonBlockingTCPConnect
+        """
+        self.max_parallel = max(1, max_parallel)
+        self.max_threads = max(1, max_threads)
+
+    def run(self, checks, stop_on_failure=False):
+        """
+        Runs the checks, raises no exception.
+
+        If stop_on_failure is set, checks after the first (in list order) failed check
+        are not started and not returned. Checks that are not NonBlockingTCPConnect (e.g.
+        HTTP checks) are run in a pool of threads at the same time.
+
+        :param list checks: CheckService objects, NonBlockingTCPConnect have host, port, resolver and timeout
+        :param bool stop_on_failure: do not run checks after the first failed one
+        :return: CheckResult for each check in the order of checks
+        :rtype: list
+        """
+        others = [num for num, check in enumerate(checks) if not isinstance(check, NonBlockingTCPConnect)]
+        if not others:
+            return self._run(checks, stop_on_failure)
+        # both parts run completely, the results after the first failure are dropped afterwards
+        other_results = list()
+
+        def run_others():
+            other_results.extend(CheckExecutor(self.max_threads).run([checks[num] for num in others]))
+
+        thread = threading.Thread(target=run_others, name="prober-threads")
+        thread.daemon = True
+        thread.start()
+        connects = [num for num, check in enumerate(checks) if isinstance(check, NonBlockingTCPConnect)]
+        results = [None] * len(checks)
+        for num, result in zip(connects, self._run([checks[num] for num in connects])):
+            results[num] = result
+        thread.join()
+        for num, result in zip(others, other_results):
+            results[num] = result
+        if stop_on_failure:
+            failed = [num for num, result in enumerate(results) if not result]
+            if failed:
+                return results[:failed[0] + 1]
+        return results
+
+    def _run(self, checks, stop_on_failure=False):
+        results = [None] * len(checks)
+        first_failure = len(checks)
+        addresses = dict()
+        sockets = dict()  # fd: [num, sock, [addresses left to try], deadline]
+        deadlines = list()  # heap of (deadline, fd, sock)
+        next_check = 0
+        poller = _make_poller()
+
+        def done(num, success, reason=None, start=None):
+            if start is not None and TRACER.enabled:
+                args = {"host": checks[num].host, "port": checks[num].port}
+                if not success:
+                    args["error"] = str(reason)
+                TRACER.complete("connect", start, "check", args)
+            if success:
+                results[num] = CheckResult(True, monotonic() - start)
+                CONNECT_SECONDS.labels("%s:%d" % (checks[num].host, checks[num].port)).observe(results[num].latency)
+            else:
+                results[num] = CheckResult(False, error=reason)
+                logger.debug("Could not connect to %s:%d (TCP): %s", checks[num].host, checks[num].port, reason)
+
+        def failed(num):
+            return results[num] is not None and not results[num]
+
+        def close(fd):
+            num, sock, _, _ = sockets.pop(fd)
+            poller.unregister(fd)
+            sock.close()
+            return num
+
+        def connect(num, addrs):
+            # try the addresses one after the other, like socket.create_connection()
+            reason = None
+            while addrs:
+                family, socktype, proto, _, sockaddr = addrs.pop(0)
+                try:
+                    sock = socket.socket(family, socktype, proto)
+                except socket.error, e:
+                    reason = e
+                    continue
+                sock.setblocking(0)
+                start = monotonic()
+                err = sock.connect_ex(sockaddr)
+                if err == 0:
+                    sock.close()
+                    return done(num, True, start=start)
+                elif err in _IN_PROGRESS:
+                    fd = sock.fileno()
+                    deadline = start + checks[num].timeout
+                    sockets[fd] = [num, sock, addrs, deadline]
+                    heapq.heappush(deadlines, (deadline, fd, sock))
+                    poller.register(fd)
+                    return
+                else:
+                    sock.close()
+                    reason = os.strerror(err)
+            done(num, False, reason or "no address")
+
+        try:
+            while next_check < len(checks) or sockets:
+                # start new connects while there are free slots
+                while next_check < len(checks) and len(sockets) < self.max_parallel:
+                    num = next_check
+                    next_check += 1
+                    if num > first_failure:
+                        continue
+                    check = checks[num]
+                    try:
+                        if check.resolver:
+                            connect(num, check.resolver.resolve(check.host, check.port))
+                        else:
+                            if (check.host, check.port) not in addresses:
+                                addresses[(check.host, check.port)] = socket.getaddrinfo(check.host, check.port, 0,
+                                                                                         socket.SOCK_STREAM)
+                            connect(num, list(addresses[(check.host, check.port)]))
+                    except socket.error, e:
+                        done(num, False, e)
+                    if stop_on_failure and failed(num):
+                        first_failure = min(first_failure, num)
+
+                if not sockets:
+                    continue
+
+                # wait for connects to finish or the nearest deadline
+                timeout = max(0, deadlines[0][0] - monotonic())
+                for fd in poller.poll(timeout):
+                    if fd not in sockets:
+                        continue
+                    num, sock, addrs, deadline = sockets[fd]
+                    err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    close(fd)
+                    if err == 0:
+                        done(num, True, start=deadline - checks[num].timeout)
+                    elif addrs:
+                        connect(num, addrs)
+                    else:
+                        done(num, False, os.strerror(err), deadline - checks[num].timeout)
+                    if stop_on_failure and failed(num):
+                        first_failure = min(first_failure, num)
+
+                # time out connects that took too long
+                now = monotonic()
+                while deadlines and deadlines[0][0] <= now:
+                    deadline, fd, sock = heapq.heappop(deadlines)
+                    if fd not in sockets or sockets[fd][1] is not sock:
+                        # already finished (and fd maybe reused)
+                        continue
+                    num, _, addrs, _ = sockets[fd]
+                    close(fd)
+                    if addrs:
+                        connect(num, addrs)
+                    else:
+                        done(num, False, "timed out", deadline - checks[num].timeout)
+                    if stop_on_failure and failed(num):
+                        first_failure = min(first_failure, num)
+        finally:
+            for fd in sockets.keys():
+                close(fd)
+            poller.close()
+
+        return results[:first_failure + 1]
+
+
+def _make_poller():
+    if hasattr(select, "epoll"):
+        return _EpollPoller()
+    elif hasattr(select, "poll"):
+        return _PollPoller()
+    else:
+        return _SelectPoller()
+
+
+class _EpollPoller(object):
+
+    def __init__(self):
+        self._epoll = select.epoll()
+
+    def register(self, fd):
+        self._epoll.register(fd, select.EPOLLOUT | select.EPOLLERR | select.EPOLLHUP)
+
+    def unregister(self, fd):
+        self._epoll.unregister(fd)
+
+    def poll(self, timeout):
+        try:
+            return [fd for fd, _ in self._epoll.poll(timeout)]
+        except IOError, e:
+            if e.errno == errno.EINTR:
+                return list()
+            raise
+
+    def close(self):
+        self._epoll.close()
+
+
+class _PollPoller(object):
+
+    def __init__(self):
+        self._poll = select.poll()
+
+    def register(self, fd):
+        self._poll.register(fd, select.POLLOUT | select.POLLERR | select.POLLHUP)
+
+    def unregister(self, fd):
+        self._poll.unregister(fd)
+
+    def poll(self, timeout):
+        try:
+            return [fd for fd, _ in self._poll.poll(timeout * 1000)]
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return list()
+            raise
+
+    def close(self):
+        pass
+
+
+class _SelectPoller(object):
+
+    def __init__(self):
+        self._fds = set()
+
+    def register(self, fd):
+        self._fds.add(fd)
+
+    def unregister(self, fd):
+        self._fds.discard(fd)
+
+    def poll(self, timeout):
+        try:
+            _, writable, exceptional = select.select([], list(self._fds), list(self._fds), timeout)
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return list()
+            raise
+        return list(set(writable) | set(exceptional))
+
+    def close(self):
+        self._fds.clear()
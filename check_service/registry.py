@@ -0,0 +1,106 @@
+# encoding: utf-8
+"""
+registry -- which check class runs the check of a service
+
+Services are given as host:port (a TCP connect) or as URI, whose scheme selects the
+check: http://host:port/path, https://..., tls://host:port, banner://host:port and the
+banner checks with presets ssh://host, smtp://host and redis://host. Passive services,
+that report to the daemon, are push://name (see heartbeat). More checks can be added
+with register_check().
+"""
+
+import urlparse
+
+from generic_tcp_connect import GenericTCPConnect
+from http_check import HTTPCheck
+from tls_check import TLSCheck
+from banner_check import BannerCheck
+from heartbeat import HeartbeatCheck
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+# scheme: (check class, default port or None, {option: default value})
+CHECK_TYPES = dict()
+
+
+def register_check(scheme, check_class, default_port=None, **defaults):
+    """
+    Make a check class available for services with this URI scheme.
+
+    :param str scheme: URI scheme, lower case
+    :param check_class: CheckService subclass
+    :param integer default_port: port if the URI has none, None if a port is required, 0 for passive checks
+    :param defaults: default values of check_class.OPTIONS for this scheme
+    """
+    CHECK_TYPES[scheme] = (check_class, default_port, defaults)
+
+
+def parse_service(spec):
+    """
+    :param str spec: host:port, [IPv6]:port or URI like http://host:port/path
+    :return: {name, scheme, protocol, host, port, path, and the default options of the check}
+    :rtype: dict
+    :raises ValueError: if spec is invalid or its scheme is unknown
+    """
+    spec = spec.strip()
+    if "://" not in spec:
+        # host:port or [IPv6]:port, the common case is parsed without urlsplit()
+        host, _, port = spec.rpartition(":")
+        if host.startswith("[") and host.endswith("]"):
+            host = host[1:-1]
+        if not host or not port.isdigit() or "[" in host or "]" in host:
+            raise ValueError("Host and port required.")
+        check_class, default_port, defaults = CHECK_TYPES["tcp"]
+        service = dict(defaults)
+        service.update({"scheme": "tcp", "protocol": "TCP", "host": host, "port": int(port), "path": "",
+                        "name": host_port(host, int(port))})
+        return service
+    url = urlparse.urlsplit(spec)
+    scheme = url.scheme.lower()
+    if scheme not in CHECK_TYPES:
+        raise ValueError("Unknown check type '%s'." % scheme)
+    check_class, default_port, defaults = CHECK_TYPES[scheme]
+    host = url.hostname
+    port = url.port or default_port
+    if not host or not (port or check_class.PASSIVE):
+        raise ValueError("Host and port required.")
+    service = dict(defaults)
+    service.update({"scheme": scheme, "protocol": scheme.upper(), "host": host, "port": port,
+                    "path": url.path + ("?" + url.query if url.query else "")})
+    # TCP services keep their short names
+    service["name"] = host_port(host, port) if scheme == "tcp" else spec
+    return service
+
+
+def host_port(host, port):
+    """
+    :param str host: host name or IP
+    :param integer port: port
+    :return: host:port, IPv6 addresses in brackets
+    :rtype: str
+    """
+    return "[%s]:%d" % (host, port) if ":" in host else "%s:%d" % (host, port)
+
+
+def check_class_for(service):
+    """
+    :param dict service: returned by parse_service()
+    :return: check class for the service
+    """
+    return CHECK_TYPES[service["scheme"]][0]
+
+
+register_check("tcp", GenericTCPConnect)
+register_check("http", HTTPCheck, 80)
+register_check("https", HTTPCheck, 443)
+register_check("tls", TLSCheck, 443)
+register_check("banner", BannerCheck)
+register_check("ssh", BannerCheck, 22, expect=r"SSH-")
+register_check("smtp", BannerCheck, 25, expect=r"220[ -]")
+register_check("redis", BannerCheck, 6379, send=r"PING\r\n", expect=r"\+PONG")
+register_check("push", HeartbeatCheck, 0)
@@ -0,0 +1,169 @@
+# encoding: utf-8
+"""
+scheduler -- decides when each service is checked
+
+Every service has its own interval. Deadlines are kept on a fixed grid of monotonic time,
+so the period does not drift by the time the checks take. The first deadlines are spread
+over the interval and every deadline gets a little random jitter, so that not all checks
+run at the same moment. If checks take so long that deadlines were missed, the missed
+cycles are skipped instead of being run one after the other.
+
+A service can also be checked once, or re-checked after a short delay without changing
+its regular schedule.
+"""
+
+import heapq
+import itertools
+import random
+import time
+import logging
+
+from common.clock import monotonic
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+# seconds to sleep if nothing is scheduled, e.g. with an empty inventory (a reload interrupts the sleep)
+IDLE_WAIT = 60.0
+
+
+class Scheduler(object):
+
+    """
+    Decides when each service is checked.
+    """
+
+    def __init__(self, jitter=0.1, clock=monotonic):
+        """
+        :param float jitter: maximum random delay of a deadline, as fraction of the interval
+        :param clock: function returning the current monotonic time in seconds
+        """
+        self.jitter = min(max(0.0, jitter), 1.0)
+        self.clock = clock
+        self.skipped = 0
+        self._entries = dict()  # key: [grid deadline, interval or None if once, due, is re-check]
+        self._heap = list()  # (due, seq, key)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, interval, spread=True):
+        """
+        Schedule a service.
+
+        :param key: hashable identifying the service
+        :param float interval: seconds between checks, None to check only once (now)
+        :param bool spread: first check at a random time in the first interval, else now
+        """
+        now = self.clock()
+        if interval is None:
+            self._entries[key] = [now, None, now, False]
+            heapq.heappush(self._heap, (now, next(self._seq), key))
+            return
+        grid = now + random.uniform(0, interval) if spread else now
+        self._entries[key] = [grid, float(interval), None, False]
+        self._push(key, grid)
+
+    def recheck(self, key, delay):
+        """
+        Check a service again after delay seconds, if its next regular check is later.
+        The regular schedule does not change.
+
+        :param key: hashable identifying the service
+        :param float delay: seconds
+        """
+        due = self.clock() + delay
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [due, None, None, False]
+        elif due >= entry[2]:
+            return
+        self._entries[key][3] = True
+        self._entries[key][2] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+
+    def remove(self, key):
+        """
+        Unschedule a service, does nothing if it is not scheduled.
+
+        :param key: hashable identifying the service
+        """
+        self._entries.pop(key, None)
+
+    def pop_due(self):
+        """
+        Get the services whose deadline has passed and schedule their next check.
+
+        :return: keys of services to check now
+        :rtype: list
+        """
+        now = self.clock()
+        due = list()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[2] != deadline:
+                # removed or rescheduled
+                continue
+            due.append(key)
+            grid, interval, _, is_recheck = entry
+            if interval is None:
+                del self._entries[key]
+                continue
+            if is_recheck:
+                entry[3] = False
+                if grid > now:
+                    # back to the regular schedule
+                    self._push(key, grid)
+                    continue
+            grid += interval
+            if grid <= now:
+                # overrun: coalesce all missed cycles into the one that runs now
+                missed = int((now - grid) // interval) + 1
+                grid += missed * interval
+                self.skipped += missed
+                logger.warn("Checks running late, skipped %d cycle(s) of %s.", missed, key)
+            entry[0] = grid
+            self._push(key, grid)
+        return due
+
+    def next_deadline(self):
+        """
+        :return: monotonic time of the next deadline, None if nothing is scheduled
+        :rtype: float
+        """
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def wait(self, max_wait=None):
+        """
+        Sleep until the next deadline, IDLE_WAIT seconds if nothing is scheduled.
+
+        :param float max_wait: sleep at most this many seconds
+        """
+        deadline = self.next_deadline()
+        delay = IDLE_WAIT if deadline is None else max(0.0, deadline - self.clock())
+        if max_wait is not None:
+            delay = min(delay, max_wait)
+        if delay:
+            time.sleep(delay)
+
+    def _push(self, key, grid):
+        entry = self._entries[key]
+        entry[2] = grid + random.uniform(0, self.jitter * entry[1])
+        heapq.heappush(self._heap, (entry[2], next(self._seq), key))
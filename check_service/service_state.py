@@ -0,0 +1,146 @@
+# encoding: utf-8
+"""
+service_state -- remembers the state of each service between checks
+
+Every result updates the state of one service (UP or DOWN, since when, number of
+consecutive results). A service that changes its state too often is flapping, its state
+changes are not notified until it calmed down. The store keeps track of services whose
+state differs from the last notified one, so that only those have to be looked at.
+"""
+
+import time
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+UP = "UP"
+DOWN = "DOWN"
+
+# number of results to look at for flap detection
+FLAP_WINDOW = 21
+
+
+class ServiceState(object):
+
+    """
+    State of a single service.
+    """
+
+    __slots__ = ("state", "since", "consecutive", "history", "samples", "flapping", "notified")
+
+    def __init__(self):
+        self.state = None
+        self.since = None
+        self.consecutive = 0
+        self.history = 0  # bit per result, 1 = UP, newest in the lowest bit
+        self.samples = 0  # number of bits in history
+        self.flapping = False
+        self.notified = UP
+
+    def flap_ratio(self):
+        """
+        :return: state changes per result in the flap window
+        :rtype: float
+        """
+        changes = (self.history ^ (self.history >> 1)) & ((1 << max(0, self.samples - 1)) - 1)
+        return bin(changes).count("1") / float(FLAP_WINDOW - 1)
+
+
+class StateStore(object):
+
+    """
+    Remembers the state of each service between checks.
+    """
+
+    def __init__(self, flap_threshold=0.5, clock=time.time):
+        """
+        :param float flap_threshold: a service is flapping if at least this fraction of its last results
+               were state changes, it stops flapping at half of it, 0 disables flap detection
+        :param clock: function returning the current time in seconds
+        """
+        self.flap_threshold = flap_threshold
+        self.clock = clock
+        self.states = dict()  # key: ServiceState
+        self.down_count = 0
+        self.unnotified = set()  # keys whose state differs from the last notified one
+
+    def __getitem__(self, key):
+        return self.states[key]
+
+    def __contains__(self, key):
+        return key in self.states
+
+    def update(self, key, success):
+        """
+        Feed a (confirmed) result.
+
+        :param key: hashable identifying the service
+        :param bool success: result of the check
+        :return: (old state, new state) if the state changed, else None
+        :rtype: tuple
+        """
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = ServiceState()
+        new = UP if success else DOWN
+        old = state.state
+        state.history = ((state.history << 1) | int(success)) & ((1 << FLAP_WINDOW) - 1)
+        state.samples = min(state.samples + 1, FLAP_WINDOW)
+        self._update_flapping(key, state)
+
+        transition = None
+        if new == old:
+            state.consecutive += 1
+        else:
+            state.state = new
+            state.since = self.clock()
+            state.consecutive = 1
+            self.down_count += (new == DOWN) - (old == DOWN)
+            transition = (old, new)
+            logger.info("Service %s is %s%s.", key, new, " (flapping)" if state.flapping else "")
+
+        if state.state != state.notified and not state.flapping:
+            self.unnotified.add(key)
+        else:
+            self.unnotified.discard(key)
+        return transition
+
+    def mark_notified(self, keys):
+        """
+        Remember that the current state of services has been notified.
+
+        :param keys: keys of services
+        """
+        for key in list(keys):
+            state = self.states[key]
+            state.notified = state.state
+            self.unnotified.discard(key)
+
+    def remove(self, key):
+        """
+        Forget a service, does nothing if it is unknown.
+
+        :param key: hashable identifying the service
+        """
+        state = self.states.pop(key, None)
+        if state is not None and state.state == DOWN:
+            self.down_count -= 1
+        self.unnotified.discard(key)
+
+    def _update_flapping(self, key, state):
+        if not self.flap_threshold:
+            return
+        ratio = state.flap_ratio()
+        if not state.flapping and ratio >= self.flap_threshold:
+            state.flapping = True
+            logger.warn("Service %s is flapping (%d%% state changes), notifications suppressed.", key, ratio * 100)
+        elif state.flapping and ratio < self.flap_threshold / 2:
+            state.flapping = False
+            logger.info("Service %s stopped flapping.", key)
@@ -0,0 +1,91 @@
+# encoding: utf-8
+"""
+tls_check -- makes a TLS handshake and checks how long the certificate of the server is still valid
+"""
+
+from check_service import CheckService, CheckResult
+import ssl
+import time
+import logging
+
+from common.clock import monotonic
+from generic_tcp_connect import open_connection
+from http_check import tls_context
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class TLSCheck(CheckService):
+
+    """
+    makes a TLS handshake and checks how long the certificate of the server is still valid
+    """
+
+    OPTIONS = ("cert_min_days", "tls_verify")
+
+    def __init__(self, host, port, protocol="TLS", resolver=None, timeout=10, cert_min_days=14, tls_verify=True):
+        """
+        :param str host: FQDN or IP
+        :param integer port: port
+        :param str protocol: protocol to use (default is TLS)
+        :param DNSCache resolver: get addresses from here instead of resolving host on every run
+        :param float timeout: seconds to wait for the connection and the handshake
+        :param integer cert_min_days: fail if the certificate expires in less than x days, 0 to not check
+        :param bool tls_verify: check the certificate chain and host name, the expiry is only checked if True
+        """
+        super(TLSCheck, self).__init__(host, port, protocol)
+        self.resolver = resolver
+        self.timeout = timeout
+        self.cert_min_days = cert_min_days
+        self.tls_verify = tls_verify
+
+    def run(self):
+        """
+        Runs the check, raises no exception.
+
+        :return: result, true if success
+        :rtype: CheckResult
+        """
+        start = monotonic()
+        try:
+            sock = tls_context(self.tls_verify).wrap_socket(
+                open_connection(self.host, self.port, self.resolver, self.timeout), server_hostname=self.host)
+            try:
+                latency = monotonic() - start
+                not_after = certificate_expiry(sock) if self.tls_verify else None
+            finally:
+                sock.close()
+        except Exception, e:
+            logger.debug("TLS handshake with %s:%d failed: %s", self.host, self.port, e)
+            return CheckResult(False, error=e)
+        if self.cert_min_days and self.tls_verify:
+            if not_after is None:
+                logger.warning("Could not check the expiry of the certificate of %s:%d, it has no notAfter.",
+                               self.host, self.port)
+                return CheckResult(True, latency)
+            days = (not_after - time.time()) / 86400
+            if days < self.cert_min_days:
+                error = "certificate expires in %.1f days" % days
+                logger.debug("TLS check of %s:%d failed: %s", self.host, self.port, error)
+                return CheckResult(False, error=error)
+        return CheckResult(True, latency)
+
+
+def certificate_expiry(sock):
+    """
+    :param ssl.SSLSocket sock: socket after the handshake with a verifying context
+    :return: time the certificate of the server expires (seconds since the epoch), None if unknown
+    :rtype: float
+    """
+    # getpeercert() decodes the certificate only if it was verified
+    cert = sock.getpeercert()
+    if not cert or "notAfter" not in cert:
+        return None
+    return ssl.cert_time_to_seconds(cert["notAfter"])
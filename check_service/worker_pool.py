@@ -0,0 +1,198 @@
+# encoding: utf-8
+"""
+worker_pool -- runs the checks in several processes, each owning a shard of the services
+
+A single process is limited by the GIL (TLS handshakes and parsing HTTP responses need
+CPU) and by its limit of open files. The pool forks worker processes, every service
+belongs to one of them (by a hash of its name). The coordinator sends each worker the
+services of its shard once, and then only the names of the services to check. The
+workers run the checks with their own DNS cache and timeouts and send the results back
+through a pipe, the coordinator merges them and decides about notifications.
+
+A worker that died is started again. If it died while checking, its checks are sent to
+the new worker once more, if that dies too, they are not run. A crashing worker is not an
+outage of its services, they are checked again when they are due the next time.
+"""
+
+import zlib
+import signal
+import multiprocessing
+import logging
+
+from check_service import CheckResult
+from instrumentation.metrics import REGISTRY
+from instrumentation.trace import TRACER
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+RESTARTS_TOTAL = REGISTRY.counter("sms_notify_worker_restarts_total", "Check worker processes started again.")
+LOST_TOTAL = REGISTRY.counter("sms_notify_worker_lost_checks_total",
+                              "Checks not run, because their worker died twice while checking.")
+
+
+class WorkerPool(object):
+
+    """
+    Runs the checks in several processes, each owning a shard of the services.
+    """
+
+    def __init__(self, size, factory):
+        """
+        :param integer size: number of worker processes
+        :param factory: function called in each worker, returning a function that takes a list of services and
+               returns [(CheckResult, host, port, protocol), ...]
+        """
+        self.size = max(1, size)
+        self.factory = factory
+        self._workers = [None] * self.size  # (process, connection to it)
+        self._shards = [dict() for _ in range(self.size)]  # {name: service}
+
+    def start(self):
+        """
+        Start the worker processes.
+        """
+        for shard in range(self.size):
+            self._start(shard)
+
+    def stop(self):
+        """
+        Stop the worker processes.
+        """
+        for process, connection in self._workers:
+            try:
+                connection.send(("stop",))
+            except (IOError, OSError):
+                pass
+        for process, connection in self._workers:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+            connection.close()
+
+    def shard(self, name):
+        """
+        :param str name: name of a service
+        :return: index of the worker that checks the service
+        :rtype: integer
+        """
+        return (zlib.crc32(name) & 0xffffffff) % self.size
+
+    def update(self, services):
+        """
+        Send the workers the services of their shards, e.g. after the services were reloaded.
+
+        :param list services: [{name, host, port, ...}, ...]
+        """
+        self._shards = [dict() for _ in range(self.size)]
+        for service in services:
+            self._shards[self.shard(service["name"])][service["name"]] = service
+        for shard in range(self.size):
+            self._send(shard, ("services", self._shards[shard]))
+
+    def run(self, services):
+        """
+        Check services in the workers, all shards at the same time.
+
+        :param list services: [{name, ...}, ...], must have been sent with update()
+        :return: [(CheckResult, host, port, protocol), ...] in the order of services, None for services that
+                 were not checked (because an earlier check of their worker failed or the worker died)
+        :rtype: list
+        """
+        names = [list() for _ in range(self.size)]
+        for service in services:
+            names[self.shard(service["name"])].append(service["name"])
+        busy = [shard for shard in range(self.size) if names[shard]]
+        for shard in busy:
+            self._send(shard, ("check", names[shard]))
+        results = dict()
+        for shard in busy:
+            shard_results = self._receive(shard)
+            if shard_results is None:
+                logger.error("Check worker %d died while checking, trying again.", shard)
+                self._restart(shard)
+                self._send(shard, ("check", names[shard]))
+                shard_results = self._receive(shard)
+            if shard_results is None:
+                logger.error("Check worker %d died again, %d checks not run.", shard, len(names[shard]))
+                LOST_TOTAL.inc(len(names[shard]))
+                self._restart(shard)
+                continue
+            results.update(zip(names[shard], shard_results))
+        return [results.get(service["name"]) for service in services]
+
+    def _start(self, shard):
+        parent_end, child_end = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_work, args=(child_end, self.factory), name="check-worker-%d" % shard)
+        process.daemon = True
+        process.start()
+        child_end.close()
+        self._workers[shard] = (process, parent_end)
+        parent_end.send(("services", self._shards[shard]))
+
+    def _restart(self, shard):
+        process, connection = self._workers[shard]
+        process.join(1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        logger.warning("Check worker %d (PID %s) exited with %s, starting it again.", shard, process.pid,
+                       process.exitcode)
+        connection.close()
+        RESTARTS_TOTAL.inc()
+        self._start(shard)
+
+    def _send(self, shard, message):
+        process, connection = self._workers[shard]
+        if not process.is_alive():
+            self._restart(shard)
+            process, connection = self._workers[shard]
+        connection.send(message)
+
+    def _receive(self, shard):
+        # results of the worker, None if it died
+        process, connection = self._workers[shard]
+        while True:
+            try:
+                if connection.poll(1.0):
+                    return connection.recv()
+            except (EOFError, IOError):
+                return None
+            if not process.is_alive():
+                return None
+
+
+def _work(connection, factory):
+    # main function of a worker process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    check = factory()
+    services = dict()
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, IOError):
+            # the coordinator is gone
+            return
+        if message[0] == "services":
+            services = message[1]
+        elif message[0] == "check":
+            results = list()
+            for result in check([services[name] for name in message[1]]):
+                success = result[0]
+                if not isinstance(success, CheckResult):
+                    success = CheckResult(success)
+                # the error may be an exception that cannot be pickled
+                success = CheckResult(success.success, success.latency, str(success.error) if success.error else None)
+                results.append((success,) + tuple(result[1:]))
+            connection.send(results)
+            TRACER.flush()
+        else:
+            return
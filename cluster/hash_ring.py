@@ -0,0 +1,60 @@
+# encoding: utf-8
+"""
+hash_ring -- consistent hashing of services onto the nodes of a cluster
+
+Every node is placed on a ring of 2^32 positions many times (virtual nodes), a service
+belongs to the first nodes found clockwise from its own position. When a node fails,
+only its services move to other nodes, and they are spread over all of them.
+"""
+
+import bisect
+import hashlib
+import struct
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class HashRing(object):
+
+    """
+    Maps keys to nodes, so that adding or removing a node moves as few keys as possible.
+    """
+
+    def __init__(self, nodes, vnodes=100):
+        """
+        :param list nodes: names of the nodes
+        :param integer vnodes: positions of each node on the ring, more spread the keys more evenly
+        """
+        self.nodes = sorted(set(nodes))
+        ring = sorted((_position("%s#%d" % (node, i)), node) for node in self.nodes for i in range(vnodes))
+        self._positions = [position for position, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    def owners(self, key, count=1, alive=None):
+        """
+        :param str key: e.g. name of a service
+        :param integer count: number of nodes
+        :param alive: set of nodes to choose from, None for all
+        :return: the first count different nodes clockwise from the position of key
+        :rtype: list
+        """
+        owners = list()
+        if not self._positions:
+            return owners
+        start = bisect.bisect(self._positions, _position(key))
+        for i in xrange(len(self._nodes)):
+            node = self._nodes[(start + i) % len(self._nodes)]
+            if node not in owners and (alive is None or node in alive):
+                owners.append(node)
+                if len(owners) == count:
+                    break
+        return owners
+
+
+def _position(key):
+    return struct.unpack("<I", hashlib.md5(key).digest()[:4])[0]
@@ -0,0 +1,279 @@
+# encoding: utf-8
+"""
+node -- a daemon in a cluster of daemons that share the checks and agree on outages
+
+Each service is checked by `replicas` nodes (its owners on the hash ring of the nodes
+that are alive). Nodes send their (confirmed) results as votes to all other nodes over
+UDP, together with a heartbeat every `heartbeat` seconds. A node that was not heard of
+for `timeout` seconds is dead: its services move to the other nodes and its votes no
+longer count.
+
+A service is down if at least `quorum` of its owners voted so (or all of them, if fewer
+are alive), so a failing network of one monitoring host does not make services down.
+Only the leader, the alive node with the lowest name, sends messages. A node that sees
+at most half of the cluster is in the minority of a split network and never leads.
+
+Datagrams are JSON: {"node": name, "votes": {service: 1 or 0, ...}}. A datagram counts
+only if it comes from the address of the node it names (resolved at start). There is no
+other authentication, the cluster port must only be reachable from the other nodes.
+"""
+
+import json
+import socket
+import threading
+import logging
+
+from hash_ring import HashRing
+from common.clock import monotonic
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+# keep datagrams below this size, votes are split into several if necessary
+MAX_DATAGRAM = 8192
+
+
+class ClusterNode(object):
+
+    """
+    This daemon in a cluster of daemons.
+    """
+
+    def __init__(self, name, nodes, replicas=2, quorum=0, timeout=10.0, heartbeat=2.0, clock=monotonic):
+        """
+        :param str name: address of this node, host:port, must be in nodes
+        :param list nodes: addresses of all nodes of the cluster, host:port
+        :param integer replicas: number of nodes that check each service
+        :param integer quorum: number of owners that must vote a service down, 0 for a majority of replicas
+        :param float timeout: a node that was not heard of for x seconds is dead
+        :param float heartbeat: send a heartbeat every x seconds
+        :param clock: function returning the current monotonic time in seconds
+        :raises ValueError: if name is not in nodes
+        :raises socket.error: if the address of this node cannot be used
+        """
+        if name not in nodes:
+            raise ValueError("Node %s is not one of the cluster nodes." % name)
+        self.name = name
+        self.nodes = sorted(set(nodes))
+        self.replicas = max(1, min(replicas, len(self.nodes)))
+        self.quorum = min(quorum or self.replicas // 2 + 1, self.replicas)
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.clock = clock
+        self.ring = HashRing(self.nodes)
+        self._addresses = dict((node, _address(node)) for node in self.nodes if node != name)
+        # addresses datagrams of each node come from, nodes send from the address they listen on
+        self._sources = dict((node, _sources(address)) for node, address in self._addresses.items())
+        self._lock = threading.Lock()
+        now = clock()
+        # nodes count as alive until they had the time to send a heartbeat
+        self._last_seen = dict((node, now) for node in self.nodes)
+        self._votes = dict()  # service: {node: success}
+        self._updated = set()  # services with new votes of other nodes
+        self._alive = frozenset(self.nodes)
+        self._membership_changed = False
+        address = _address(name)
+        self._sock = socket.socket(socket.AF_INET6 if ":" in address[0] else socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(address)
+        # wake up regularly, to notice stop()
+        self._sock.settimeout(1.0)
+        self._stop = threading.Event()
+        self._threads = list()
+
+    def start(self):
+        """
+        Start receiving votes and sending heartbeats in background threads.
+        """
+        for target, thread_name in [(self._receive, "cluster-receive"), (self._send_heartbeats, "cluster-heartbeat")]:
+            thread = threading.Thread(target=target, name=thread_name)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the background threads and close the port.
+        """
+        self._stop.set()
+        self._sock.close()
+
+    def alive(self):
+        """
+        :return: nodes that were heard of recently, including this one
+        :rtype: frozenset
+        """
+        self._check_alive()
+        return self._alive
+
+    def membership_changed(self):
+        """
+        :return: True if nodes died or came back since the last call
+        :rtype: bool
+        """
+        self._check_alive()
+        with self._lock:
+            changed = self._membership_changed
+            self._membership_changed = False
+        return changed
+
+    def owners(self, service):
+        """
+        :param str service: name of a service
+        :return: alive nodes that check the service
+        :rtype: list
+        """
+        return self.ring.owners(service, self.replicas, self.alive())
+
+    def is_mine(self, service):
+        """
+        :param str service: name of a service
+        :return: True if this node checks the service
+        :rtype: bool
+        """
+        return self.name in self.owners(service)
+
+    def is_leader(self):
+        """
+        :return: True if this node sends the messages of the cluster
+        :rtype: bool
+        """
+        alive = self.alive()
+        return 2 * len(alive) > len(self.nodes) and min(alive) == self.name
+
+    def vote(self, votes):
+        """
+        Record results of this node and send them to all other nodes.
+
+        :param dict votes: {service: success, ...}
+        """
+        if not votes:
+            return
+        with self._lock:
+            for service, success in votes.items():
+                self._votes.setdefault(service, dict())[self.name] = bool(success)
+        self._send(votes)
+
+    def verdict(self, service):
+        """
+        :param str service: name of a service
+        :return: False if enough owners voted the service down, True if too many voted it up for that, None if
+                 the missing votes decide
+        :rtype: bool
+        """
+        owners = self.owners(service)
+        with self._lock:
+            votes = self._votes.get(service, dict())
+            votes = [votes[node] for node in owners if node in votes]
+        needed = min(self.quorum, len(owners))
+        if votes.count(False) >= needed:
+            return False
+        if votes.count(True) > len(owners) - needed:
+            return True
+        return None
+
+    def pop_updated(self):
+        """
+        :return: services that got new votes from other nodes since the last call
+        :rtype: set
+        """
+        with self._lock:
+            updated = self._updated
+            self._updated = set()
+        return updated
+
+    def forget(self, service):
+        """
+        Drop the votes of a service, e.g. when it was removed.
+
+        :param str service: name of a service
+        """
+        with self._lock:
+            self._votes.pop(service, None)
+            self._updated.discard(service)
+
+    def _check_alive(self):
+        now = self.clock()
+        with self._lock:
+            self._last_seen[self.name] = now
+            alive = frozenset(node for node, seen in self._last_seen.items() if now - seen < self.timeout)
+            if alive != self._alive:
+                logger.info("Cluster nodes alive: %s (dead: %s).", ", ".join(sorted(alive)),
+                            ", ".join(sorted(set(self.nodes) - alive)) or "none")
+                self._alive = alive
+                self._membership_changed = True
+                # a node that comes back votes again
+                for votes in self._votes.values():
+                    for node in self.nodes:
+                        if node not in alive:
+                            votes.pop(node, None)
+                # services whose owners changed get a new verdict
+                self._updated.update(self._votes)
+
+    def _send(self, votes):
+        # send votes (may be empty, a heartbeat) to all other nodes, in datagrams of at most MAX_DATAGRAM bytes
+        chunks = [dict()]
+        size = 0
+        for service, success in votes.items():
+            size += len(service) + 8
+            if size > MAX_DATAGRAM - 200:
+                chunks.append(dict())
+                size = len(service) + 8
+            chunks[-1][service] = 1 if success else 0
+        for chunk in chunks:
+            data = json.dumps({"node": self.name, "votes": chunk}, separators=(",", ":"))
+            for node, address in self._addresses.items():
+                try:
+                    self._sock.sendto(data, address)
+                except socket.error, e:
+                    logger.debug("Could not send to cluster node %s: %s", node, e)
+
+    def _send_heartbeats(self):
+        while not self._stop.wait(self.heartbeat):
+            self._send(dict())
+
+    def _receive(self):
+        while not self._stop.is_set():
+            try:
+                data, source = self._sock.recvfrom(65535)
+                message = json.loads(data)
+                node = message["node"]
+                votes = message["votes"]
+            except socket.timeout:
+                continue
+            except socket.error:
+                if self._stop.is_set():
+                    return
+                logger.exception("Receiving from cluster nodes.")
+                continue
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Invalid message from a cluster node.")
+                continue
+            if node not in self._sources:
+                logger.warning("Message from unknown cluster node %r.", node)
+                continue
+            if source[:2] not in self._sources[node]:
+                logger.warning("Message from %s claiming to be cluster node %s ignored.", source[0], node)
+                continue
+            with self._lock:
+                self._last_seen[node] = self.clock()
+                for service, success in votes.items():
+                    service = str(service)
+                    self._votes.setdefault(service, dict())[node] = bool(success)
+                    self._updated.add(service)
+
+
+def _address(name):
+    # host:port or [IPv6]:port to a socket address
+    host, _, port = name.rpartition(":")
+    return host.strip("[]"), int(port)
+
+
+def _sources(address):
+    # all (IP, port) a socket address resolves to
+    return set(info[4][:2] for info in socket.getaddrinfo(address[0], address[1], 0, socket.SOCK_DGRAM))
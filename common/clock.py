@@ -0,0 +1,63 @@
+# encoding: utf-8
+"""
+clock -- monotonic time for deadlines and time windows
+
+Python 2 has no time.monotonic(), so clock_gettime(CLOCK_MONOTONIC) is called through ctypes.
+Where that is not available, time.time() is used.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import time
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _find_clock_gettime():
+    for lib in [ctypes.util.find_library("rt"), ctypes.util.find_library("c")]:
+        if not lib:
+            continue
+        try:
+            func = getattr(ctypes.CDLL(lib, use_errno=True), "clock_gettime")
+        except (OSError, AttributeError):
+            continue
+        func.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        return func
+    return None
+
+
+_clock_gettime = _find_clock_gettime()
+
+
+def monotonic():
+    """
+    Seconds since an unspecified point in time, never jumps back.
+
+    :return: seconds
+    :rtype: float
+    """
+    ts = _Timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+if _clock_gettime is None:
+    logger.warn("clock_gettime() not found, using time.time() as monotonic clock.")
+    monotonic = time.time
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+history.query -- uptime and outages of services from the check history
+
+Reads the history directory written by main.py with --history_dir and prints per
+service the number of probes, failed probes, the uptime and the outages. An outage
+starts with a failed probe and ends with the next successful one.
+
+Run from the projects root directory:
+    python -m history.query -d /var/lib/sms_notify/history --since 7d --outages db1:5432
+"""
+
+import sys
+import time
+import calendar
+from argparse import ArgumentParser
+
+from history.store import HistoryReader
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+class ServiceHistory(object):
+
+    """
+    Probes and outages of a service.
+    """
+
+    def __init__(self):
+        self.probes = 0
+        self.failures = 0
+        self.first = None  # time of the first probe
+        self.last = None  # time of the last probe
+        self.down_since = None  # time of the first failed probe of the current outage
+        self.outages = list()  # [(start, end), ...], end is None if the service is still down
+
+    def add(self, timestamp, success):
+        """
+        :param integer timestamp: time of the probe
+        :param bool success: result of the probe
+        """
+        self.probes += 1
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        if not success:
+            self.failures += 1
+            if self.down_since is None:
+                self.down_since = timestamp
+        elif self.down_since is not None:
+            self.outages.append((self.down_since, timestamp))
+            self.down_since = None
+
+    def all_outages(self):
+        """
+        :return: [(start, end), ...], end is None if the service is still down
+        :rtype: list
+        """
+        return self.outages + ([(self.down_since, None)] if self.down_since is not None else [])
+
+    def downtime(self):
+        """
+        :return: seconds the service was down, until its last probe for the current outage
+        :rtype: integer
+        """
+        return sum((end if end is not None else self.last) - start for start, end in self.all_outages())
+
+    def uptime(self):
+        """
+        :return: percentage of the observed time the service was up, by probes if observed only once
+        :rtype: float
+        """
+        if self.last == self.first:
+            return 100.0 * (self.probes - self.failures) / self.probes
+        return 100.0 * (1 - float(self.downtime()) / (self.last - self.first))
+
+
+def summarize(records):
+    """
+    :param records: (time, name, success, latency), ordered by time
+    :return: {name: ServiceHistory, ...}
+    :rtype: dict
+    """
+    services = dict()
+    for timestamp, name, success, _ in records:
+        history = services.get(name)
+        if history is None:
+            history = services[name] = ServiceHistory()
+        history.add(timestamp, success)
+    return services
+
+
+def parse_time(value, now):
+    """
+    :param str value: relative like 7d, 12h, 30m or absolute like 2015-01-06 or 2015-01-06T12:00 (UTC)
+    :param float now: current time in seconds since the epoch
+    :return: seconds since the epoch
+    :rtype: float
+    :raises ValueError: if value cannot be parsed
+    """
+    if value[-1:] in UNITS and value[:-1].isdigit():
+        return now - int(value[:-1]) * UNITS[value[-1]]
+    for time_format in ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return calendar.timegm(time.strptime(value, time_format))
+        except ValueError:
+            pass
+    raise ValueError("Invalid time '%s'." % value)
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp))
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return "%dd%02dh%02dm" % (days, hours, minutes)
+    if hours:
+        return "%dh%02dm" % (hours, minutes)
+    return "%dm%02ds" % (minutes, seconds)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-d", "--history_dir", required=True, metavar="DIR", help="history directory of main.py")
+    parser.add_argument("--since", default="7d",
+                        help="start of the period, e.g. 7d, 12h or 2015-01-06 (UTC) [%(default)s]")
+    parser.add_argument("--until", help="end of the period, like --since [now]")
+    parser.add_argument("--outages", action="store_true", help="list the outages of every service")
+    parser.add_argument("--min_outage", type=int, default=0,
+                        help="ignore outages shorter than x seconds [%(default)s]")
+    parser.add_argument("services", nargs="*", metavar="service", help="names of services [all]")
+    args = parser.parse_args()
+
+    now = time.time()
+    try:
+        since = parse_time(args.since, now)
+        until = parse_time(args.until, now) if args.until else None
+    except ValueError, e:
+        parser.error(str(e))
+    reader = HistoryReader(args.history_dir)
+    unknown = [x for x in args.services if x not in reader.names]
+    if unknown:
+        parser.error("No history of %s." % ", ".join(unknown))
+    services = summarize(reader.records(set(args.services) if args.services else None, since, until))
+
+    print "%-40s %8s %8s %9s %8s %12s" % ("service", "probes", "failed", "uptime", "outages", "downtime")
+    for name in sorted(services):
+        history = services[name]
+        outages = [(start, end) for start, end in history.all_outages()
+                   if (end if end is not None else history.last) - start >= args.min_outage]
+        print "%-40s %8d %8d %8.3f%% %8d %12s" % (name, history.probes, history.failures, history.uptime(),
+                                                  len(outages), format_duration(history.downtime()))
+        if args.outages:
+            for start, end in outages:
+                if end is None:
+                    print "    %s - still down" % format_time(start)
+                else:
+                    print "    %s - %s (%s)" % (format_time(start), format_time(end), format_duration(end - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
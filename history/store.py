@@ -0,0 +1,224 @@
+# encoding: utf-8
+"""
+store -- append-only log of all check results, in daily segments of fixed-width records
+
+Every probe is appended as a 12 byte record (time, service ID, connect time, flags) to
+the segment of its UTC day, a file YYYY-MM-DD.hist in the history directory. Service
+names are stored only once, in services.txt: the line number is the ID of the service.
+Thousands of services checked every minute take a few dozen MB per day.
+
+Records are buffered and written after each run of checks. Reading maps the segments
+into memory, a record that was written only partially (the daemon was killed) is
+ignored, and cut off before the next record is appended.
+"""
+
+import os
+import mmap
+import time
+import calendar
+import struct
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+# seconds since the epoch, service ID, connect time in ms, flags
+RECORD = struct.Struct("<IIHH")
+NO_LATENCY = 0xFFFF
+SUCCESS = 1
+
+DAY = 86400
+SERVICES_FILE = "services.txt"
+SEGMENT_SUFFIX = ".hist"
+
+
+class HistoryWriter(object):
+
+    """
+    Appends check results to the history directory.
+    """
+
+    def __init__(self, directory, keep_days=0, clock=time.time):
+        """
+        :param str directory: history directory, created if it does not exist
+        :param integer keep_days: delete segments older than x days, 0 to keep all
+        :param clock: function returning the current time in seconds since the epoch
+        """
+        self.directory = directory
+        self.keep_days = keep_days
+        self.clock = clock
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        path = os.path.join(directory, SERVICES_FILE)
+        self._names_file = _open_truncated(path, lambda f, size: f.read().rfind("\n") + 1)
+        self._ids = dict((name, service_id) for service_id, name in enumerate(read_services(directory)))
+        self._buffer = list()  # (time, packed record)
+        self._day = None
+        self._segment = None
+
+    def record(self, name, success, latency=None, timestamp=None):
+        """
+        Add the result of a probe, it is written by the next flush().
+
+        :param str name: name of the service
+        :param bool success: result of the probe
+        :param float latency: connect time in seconds, None if unknown
+        :param float timestamp: time of the probe in seconds since the epoch, None for now
+        """
+        service_id = self._ids.get(name)
+        if service_id is None:
+            service_id = self._ids[name] = len(self._ids)
+            self._names_file.write(name + "\n")
+            self._names_file.flush()
+        timestamp = int(self.clock() if timestamp is None else timestamp)
+        latency = NO_LATENCY if latency is None else min(int(round(latency * 1000)), NO_LATENCY - 1)
+        self._buffer.append((timestamp, RECORD.pack(timestamp, service_id, latency, SUCCESS if success else 0)))
+
+    def flush(self):
+        """
+        Write the buffered records, to the segments of their days.
+        """
+        if not self._buffer:
+            return
+        chunk = list()
+        for timestamp, record in self._buffer:
+            if timestamp // DAY != self._day:
+                self._write(chunk)
+                chunk = list()
+                self._open_segment(timestamp // DAY)
+            chunk.append(record)
+        self._write(chunk)
+        self._buffer = list()
+
+    def close(self):
+        """
+        Write the buffered records and close the files.
+        """
+        self.flush()
+        if self._segment:
+            self._segment.close()
+            self._segment = None
+        self._names_file.close()
+
+    def _write(self, records):
+        if records:
+            self._segment.write("".join(records))
+            self._segment.flush()
+
+    def _open_segment(self, day):
+        if self._segment:
+            self._segment.close()
+        self._day = day
+        path = os.path.join(self.directory, segment_name(day))
+        self._segment = _open_truncated(path, lambda f, size: size - size % RECORD.size)
+        if self.keep_days:
+            for name in list_segments(self.directory):
+                if segment_day(name) <= day - self.keep_days:
+                    logger.debug("Deleting history segment %s.", name)
+                    os.remove(os.path.join(self.directory, name))
+
+
+class HistoryReader(object):
+
+    """
+    Reads check results from the history directory.
+    """
+
+    def __init__(self, directory):
+        """
+        :param str directory: history directory
+        """
+        self.directory = directory
+        self.names = read_services(directory)
+
+    def records(self, names=None, since=None, until=None):
+        """
+        :param list names: names of services, None for all
+        :param float since: only probes at or after this time (seconds since the epoch), None for all
+        :param float until: only probes before this time, None for all
+        :return: (time, name, success, latency in seconds or None), ordered by time
+        :rtype: generator
+        """
+        ids = None
+        if names is not None:
+            ids = set(service_id for service_id, name in enumerate(self.names) if name in names)
+        for name in list_segments(self.directory):
+            day = segment_day(name)
+            if (since and (day + 1) * DAY <= since) or (until and day * DAY >= until):
+                continue
+            with open(os.path.join(self.directory, name), "rb") as segment:
+                size = os.fstat(segment.fileno()).st_size
+                size -= size % RECORD.size
+                if not size:
+                    continue
+                data = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for offset in xrange(0, size, RECORD.size):
+                        timestamp, service_id, latency, flags = RECORD.unpack_from(data, offset)
+                        if (ids is not None and service_id not in ids) or (since and timestamp < since) or \
+                                (until and timestamp >= until) or service_id >= len(self.names):
+                            continue
+                        yield (timestamp, self.names[service_id], bool(flags & SUCCESS),
+                               None if latency == NO_LATENCY else latency / 1000.0)
+                finally:
+                    data.close()
+
+
+def read_services(directory):
+    """
+    :param str directory: history directory
+    :return: names of the services, the index is their ID
+    :rtype: list
+    """
+    try:
+        with open(os.path.join(directory, SERVICES_FILE), "rb") as names_file:
+            data = names_file.read()
+    except IOError:
+        return list()
+    # without a partially written last line
+    return data[:data.rfind("\n") + 1].splitlines()
+
+
+def list_segments(directory):
+    """
+    :param str directory: history directory
+    :return: file names of the segments, oldest first
+    :rtype: list
+    """
+    return sorted(x for x in os.listdir(directory) if x.endswith(SEGMENT_SUFFIX))
+
+
+def segment_name(day):
+    """
+    :param integer day: days since the epoch
+    :return: file name of the segment of the day
+    :rtype: str
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(day * DAY)) + SEGMENT_SUFFIX
+
+
+def segment_day(name):
+    """
+    :param str name: file name of a segment
+    :return: days since the epoch
+    :rtype: integer
+    """
+    return calendar.timegm(time.strptime(name[:-len(SEGMENT_SUFFIX)], "%Y-%m-%d")) // DAY
+
+
+def _open_truncated(path, valid_length):
+    # open a file for appending, cut off the end if valid_length(file, size) is less than its size
+    f = open(path, "r+b" if os.path.exists(path) else "w+b")
+    size = os.fstat(f.fileno()).st_size
+    length = valid_length(f, size)
+    if length != size:
+        logger.warning("Cutting off %d bytes of incomplete data at the end of %s.", size - length, path)
+        f.truncate(length)
+    f.seek(0, os.SEEK_END)
+    return f
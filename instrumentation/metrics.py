@@ -0,0 +1,406 @@
+# encoding: utf-8
+"""
+metrics -- counters, gauges and histograms in the Prometheus text format
+
+Modules create their metrics once at import time in the module wide REGISTRY and update
+them while running. Updating a metric only takes a lock and changes a few numbers, so it
+can be done in the checks themselves. The metrics can be served over HTTP by a
+MetricsServer and written to a file for the textfile collector of node_exporter.
+"""
+
+import os
+import bisect
+import threading
+import BaseHTTPServer
+import SocketServer
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# seconds an HTTP client may take to send its request
+REQUEST_TIMEOUT = 5
+
+
+class _Metric(object):
+
+    """
+    Base class of metrics, a metric has one child per combination of label values.
+    """
+
+    kind = None
+
+    def __init__(self, name, doc, labelnames=()):
+        """
+        :param str name: metric name
+        :param str doc: help text
+        :param tuple labelnames: names of the labels
+        """
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = dict()  # label values: child
+
+    def labels(self, *values):
+        """
+        :param values: one value for each label name
+        :return: the child for these label values, created if necessary
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError("%s needs labels %s." % (self.name, ", ".join(self.labelnames)))
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """
+        Forget the child for these label values, does nothing if it does not exist.
+        """
+        with self._lock:
+            self._children.pop(values, None)
+
+    def expose(self):
+        """
+        :return: lines of the text format
+        :rtype: list
+        """
+        lines = ["# HELP %s %s" % (self.name, self.doc.replace("\\", "\\\\").replace("\n", "\\n")),
+                 "# TYPE %s %s" % (self.name, self.kind)]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            for suffix, extra, value in child.samples():
+                labels = zip(self.labelnames, values) + extra
+                lines.append("%s%s%s %s" % (self.name, suffix, _format_labels(labels), _format_value(value)))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+
+    """
+    A number that only goes up.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1):
+        """
+        Increase the counter without labels.
+        """
+        self.labels().inc(amount)
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class Gauge(_Metric):
+
+    """
+    A number that goes up and down.
+    """
+
+    kind = "gauge"
+
+    def set(self, value):
+        """
+        Set the gauge without labels.
+        """
+        self.labels().set(value)
+
+    def set_function(self, func):
+        """
+        Get the value of the gauge without labels from func when it is exposed.
+
+        :param func: function returning a number
+        """
+        self.labels().set_function(func)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class Histogram(_Metric):
+
+    """
+    Counts observed values in buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        :param str name: metric name
+        :param str doc: help text
+        :param tuple labelnames: names of the labels
+        :param tuple buckets: upper bounds of the buckets, ascending
+        """
+        super(Histogram, self).__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value):
+        """
+        Observe a value in the histogram without labels.
+        """
+        self.labels().observe(value)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class _CounterChild(object):
+
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only be increased.")
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [("", [], self.value)]
+
+
+class _GaugeChild(object):
+
+    __slots__ = ("_lock", "value", "func")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+        self.func = None
+
+    def set(self, value):
+        self.value = float(value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, func):
+        self.func = func
+
+    def samples(self):
+        value = self.value
+        if self.func is not None:
+            try:
+                value = self.func()
+            except Exception, e:
+                logger.error("Could not get value of gauge: %s", e)
+                return list()
+        return [("", [], value)]
+
+
+class _HistogramChild(object):
+
+    __slots__ = ("_lock", "buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        num = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[num] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = list()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            samples.append(("_bucket", [("le", _format_value(bound))], cumulative))
+        samples.append(("_sum", [], total))
+        samples.append(("_count", [], cumulative))
+        return samples
+
+
+class Registry(object):
+
+    """
+    Collection of metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = dict()  # name: metric
+
+    def counter(self, name, doc, labelnames=()):
+        """
+        :return: the counter with this name, created if necessary
+        :rtype: Counter
+        """
+        return self._get(Counter, name, doc, labelnames)
+
+    def gauge(self, name, doc, labelnames=()):
+        """
+        :return: the gauge with this name, created if necessary
+        :rtype: Gauge
+        """
+        return self._get(Gauge, name, doc, labelnames)
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        :return: the histogram with this name, created if necessary
+        :rtype: Histogram
+        """
+        return self._get(Histogram, name, doc, labelnames, buckets)
+
+    def expose(self):
+        """
+        :return: all metrics in the Prometheus text format
+        :rtype: str
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = list()
+        for _, metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Write all metrics to a file for the textfile collector of node_exporter. The file is
+        replaced atomically, so the collector never reads half a file.
+
+        :param str path: file name, should end with .prom
+        """
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp, "wb") as prom_file:
+                prom_file.write(self.expose())
+            os.rename(tmp, path)
+        except (IOError, OSError), e:
+            logger.error("Could not write metrics to '%s': %s", path, e)
+
+    def _get(self, cls, name, doc, labelnames, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, doc, labelnames, *args)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError("Metric %s already registered with another type or labels." % name)
+            return metric
+
+
+REGISTRY = Registry()
+
+
+class MetricsServer(object):
+
+    """
+    Serves the metrics of a registry over HTTP at /metrics, in a background thread.
+    """
+
+    def __init__(self, registry=REGISTRY, address="127.0.0.1", port=9135):
+        """
+        :param Registry registry: metrics to serve
+        :param str address: address to listen on
+        :param integer port: port to listen on
+        :raises socket.error: if the port cannot be opened
+        """
+        self.registry = registry
+        self._server = _ThreadingHTTPServer((address, port), _MetricsHandler)
+        self._server.registry = registry
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving and close the port.
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    # a thread per request, so that a slow or idle client does not block the scrapes of others
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        logger.debug("Metrics request from %s failed.", client_address[0], exc_info=True)
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # close connections of clients that do not send their request
+    timeout = REQUEST_TIMEOUT
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.expose()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logger.debug("Metrics request from %s: %s", self.client_address[0], fmt % args)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                                          .replace("\n", "\\n")) for name, value in labels)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    elif value == float("-inf"):
+        return "-Inf"
+    elif value != value:
+        return "NaN"
+    elif float(value).is_integer():
+        return "%d" % value
+    return repr(float(value))
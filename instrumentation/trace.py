@@ -0,0 +1,232 @@
+# encoding: utf-8
+"""
+trace -- timing of the phases of each cycle in the Chrome trace event format, and cProfile dumps
+
+Modules record spans (host name lookups, connects, building and sending messages) in the
+module wide TRACER. While tracing is off (the default), span() returns a shared object
+that does nothing and complete() returns right away, so the spans can stay in the hot
+paths. When on, the events are buffered and appended to a JSON file after each cycle,
+which chrome://tracing and https://ui.perfetto.dev load. The file is a JSON array that
+is never closed, which both accept, so it is valid whenever the daemon stops. Worker
+processes append to the same file.
+
+A CycleProfiler runs cycles under cProfile and keeps the dumps of the last cycles, for
+python -m pstats or snakeviz. cProfile sees only the thread it was started in.
+"""
+
+import os
+import json
+import time
+import cProfile
+import threading
+import multiprocessing
+import logging
+
+from common.clock import monotonic
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+TRACE_FILE = "trace.json"
+# drop events if more than this many were recorded between two flushes
+MAX_EVENTS = 100000
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args["error"] = str(exc_value)
+        self.tracer.complete(self.name, self.start, self.category, self.args)
+        return False
+
+
+class Tracer(object):
+
+    """
+    Records spans and writes them in the Chrome trace event format.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.max_bytes = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._events = list()
+        self._named = set()  # (pid, tid, name) written to the file, tid None for the process
+
+    def start(self, path, max_bytes=64 * 1024 * 1024):
+        """
+        Start recording.
+
+        :param str path: file to append the events to, its directory is created if it does not exist
+        :param integer max_bytes: move the file to path.1 when it gets larger, replacing that
+        :raises OSError: if the directory cannot be created
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = True
+
+    def stop(self):
+        """
+        Write the recorded events and stop recording.
+        """
+        self.flush()
+        self.enabled = False
+
+    def span(self, name, category="", **args):
+        """
+        :param str name: name of the span, e.g. connect
+        :param str category: e.g. check or notify
+        :param args: shown with the span, e.g. host="db1"
+        :return: context manager recording the time until it exits, with the error if there was an exception
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def complete(self, name, start, category="", args=None, end=None):
+        """
+        Record a span that already ended.
+
+        :param str name: name of the span
+        :param float start: monotonic time the span started
+        :param str category: e.g. check or notify
+        :param dict args: shown with the span, None for nothing
+        :param float end: monotonic time the span ended, None for now
+        """
+        if not self.enabled:
+            return
+        end = monotonic() if end is None else end
+        thread = threading.current_thread()
+        pid = os.getpid()
+        event = {"name": name, "cat": category, "ph": "X", "ts": int(start * 1e6), "dur": int((end - start) * 1e6),
+                 "pid": pid, "tid": thread.ident}
+        if args:
+            event["args"] = args
+        with self._lock:
+            if len(self._events) >= MAX_EVENTS:
+                self.dropped += 1
+                return
+            process_name = multiprocessing.current_process().name
+            if (pid, None, process_name) not in self._named:
+                self._named.add((pid, None, process_name))
+                self._events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": process_name}})
+            # thread IDs are reused by new threads
+            if (pid, thread.ident, thread.name) not in self._named:
+                self._named.add((pid, thread.ident, thread.name))
+                self._events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread.ident,
+                                     "args": {"name": thread.name}})
+            self._events.append(event)
+
+    def flush(self):
+        """
+        Append the recorded events to the file.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            events = self._events
+            self._events = list()
+            dropped = self.dropped
+            self.dropped = 0
+        if dropped:
+            logger.warning("Dropped %d trace events, more than %d since the last flush.", dropped, MAX_EVENTS)
+        if not events:
+            return
+        data = "".join(json.dumps(event, separators=(",", ":")) + ",\n" for event in events)
+        try:
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.rename(self.path, self.path + ".1")
+                with self._lock:
+                    # the new file needs the names again
+                    self._named.clear()
+            # one write with O_APPEND, so that the events of worker processes are not mixed up
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    data = "[\n" + data
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+        except (IOError, OSError), e:
+            logger.error("Could not write trace to '%s': %s", self.path, e)
+
+
+TRACER = Tracer()
+
+
+class CycleProfiler(object):
+
+    """
+    Profiles cycles with cProfile, keeping the dumps of the last cycles.
+    """
+
+    def __init__(self, directory, keep=10):
+        """
+        :param str directory: write the dumps here, as cycle-<time>-<number>.prof
+        :param integer keep: number of dumps to keep
+        """
+        self.directory = directory
+        self.keep = keep
+        self.cycles = 0
+        self._profile = None
+
+    def start(self):
+        """
+        Start profiling a cycle, in this thread.
+        """
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        """
+        Stop profiling the cycle, write its dump and delete the oldest ones.
+        """
+        if self._profile is None:
+            return
+        self._profile.disable()
+        self.cycles += 1
+        path = os.path.join(self.directory, "cycle-%s-%06d.prof" % (time.strftime("%Y%m%d-%H%M%S"), self.cycles))
+        try:
+            self._profile.dump_stats(path)
+            dumps = sorted(x for x in os.listdir(self.directory) if x.startswith("cycle-") and x.endswith(".prof"))
+            for name in dumps[:-self.keep]:
+                os.remove(os.path.join(self.directory, name))
+        except (IOError, OSError), e:
+            logger.error("Could not write profile to '%s': %s", path, e)
+        self._profile = None
@@ -8,18 +8,40 @@ main is the start module to run the checks and react to downtime.
 
 import sys
 import os
-import re
 import logging
+import threading
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 import ConfigParser
 from daemon.daemon import DaemonContext
 from daemon.runner import make_pidlockfile
-import time
 import signal
+import socket
 
-from check_service.generic_tcp_connect import GenericTCPConnect
-from notify_sms.sipgate_sms import SipgateSMS
-from notify_sms.msg_count import MsgCount
+from check_service.generic_tcp_connect import GenericTCPConnect, CONNECT_SECONDS
+from check_service.check_executor import CheckExecutor
+from check_service.nonblocking_tcp_connect import NonBlockingTCPConnect, ConnectProber
+from check_service.dns_cache import DNSCache
+from check_service.scheduler import Scheduler
+from check_service.confirmation import Confirmation
+from check_service.service_state import StateStore, UP, DOWN
+from check_service.latency_stats import LatencyStats
+from check_service.adaptive_timeout import AdaptiveTimeout
+from check_service.registry import check_class_for
+from check_service.inventory import Inventory, InventoryError, diff_services
+from check_service.dependencies import Dependencies
+from check_service.worker_pool import WorkerPool
+from check_service.heartbeat import HEARTBEATS, HeartbeatReceiver
+from check_service import http_check
+from notify_sms.sipgate_sms import SipgateSMS, URL as SIPGATE_URL
+from notify_sms.rate_limit import RateLimiter, MINUTE, HOUR, DAY
+from notify_sms.sms_session import SMSSession
+from notify_sms.notify_queue import NotifyQueue
+from notify_sms.message_builder import compact_services, build_messages
+from instrumentation.metrics import REGISTRY, MetricsServer
+from instrumentation.trace import TRACER, TRACE_FILE, CycleProfiler
+from history.store import HistoryWriter
+from cluster.node import ClusterNode
+from common.clock import monotonic
 
 __all__ = []
 __version__ = 0.1
@@ -38,6 +60,19 @@ DEBUG = 0
 
 logger = logging.getLogger()
 
+# set by SIGHUP, the services are read again before the next checks
+RELOAD_REQUESTED = threading.Event()
+
+# check_engine: (check class, executor class)
+CHECK_ENGINES = {"threads": (GenericTCPConnect, CheckExecutor), "select": (NonBlockingTCPConnect, ConnectProber)}
+
+SWEEP_SECONDS = REGISTRY.histogram("sms_notify_sweep_seconds", "Time to run a batch of checks.",
+                                   buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+DNS_SECONDS = REGISTRY.histogram("sms_notify_dns_seconds", "Time to look up the hosts of a batch of checks.")
+CHECKS_TOTAL = REGISTRY.counter("sms_notify_checks_total", "Checks run, by service and result.", ["service", "result"])
+LATENCY_PERCENTILE = REGISTRY.gauge("sms_notify_connect_p95_seconds", "95th percentile of the recent connect times.",
+                                    ["service"])
+
 
 def main(argv=None):  # IGNORE:C0111
     if argv is None:
@@ -54,6 +89,8 @@ def main(argv=None):  # IGNORE:C0111
                  not arg.startswith("_") and arg not in ["password"]]:
         logger.debug("    %s", conf)
 
+    # the daemon runs in /, relative paths on the command line are relative to this
+    start_dir = os.getcwd()
     if args.daemonize:
         daemon_context = DaemonContext()
         daemon_context.files_preserve = [lh.stream for lh in logger.handlers]
@@ -63,7 +100,7 @@ def main(argv=None):  # IGNORE:C0111
             except:
                 logger.exception("PIDfile creation failed.")
                 exit(1)
-        daemon_context.signal_map = {signal.SIGTERM: main_quit, signal.SIGHUP: main_quit}
+        daemon_context.signal_map = {signal.SIGTERM: main_quit, signal.SIGHUP: request_reload}
         daemon_context.open()
 
         logger.info("Forked into background with PID %s.", os.getpid())
@@ -72,83 +109,561 @@ def main(argv=None):  # IGNORE:C0111
         if args.write_conf_file:
             logger.debug("Configuration written to '%s'.", args.write_conf_file)
 
+    profiler = None
+    if args.profile:
+        try:
+            TRACER.start(os.path.join(args.profile, TRACE_FILE))
+        except OSError:
+            logger.exception("Could not create profile directory '%s'.", args.profile)
+            exit(1)
+        if args.profile_cycles:
+            profiler = CycleProfiler(args.profile, args.profile_cycles)
+        logger.debug("Writing trace to '%s'.", os.path.join(args.profile, TRACE_FILE))
+
+    # before the fork, so that the workers check with the same limits
+    http_check.POOL.configure(args.http_pool_size, args.http_idle_timeout)
+
+    # fork before any threads are started
+    workers = None
+    if args.workers:
+
+        def worker_checks():
+            # runs in each worker process, with its own caches
+            worker_resolver = DNSCache(args.dns_ttl, args.dns_negative_ttl)
+            worker_timeouts = AdaptiveTimeout(args.timeout_floor, args.timeout_ceiling, args.timeout_k)
+            return lambda batch: execute_checks(args, batch, worker_resolver, worker_timeouts)
+
+        workers = WorkerPool(args.workers, worker_checks)
+        workers.start()
+        workers.update(services)
+        logger.debug("Started %d check workers.", args.workers)
+
     failed_services = 0
-    msg_count = MsgCount(args.msg_limit)
+    rate_limiter = RateLimiter({MINUTE: args.msg_limit_minute, HOUR: args.msg_limit, DAY: args.msg_limit_day},
+                               args.msg_burst, args.rate_state or None)
+    for recipient in args.recipients:
+        rate_limiter.set_limit(recipient, args.recipient_limit)
+    sms_session = SMSSession(lambda: SipgateSMS(args.username, args.password, timeout=args.sms_timeout,
+                                                pool_size=args.sms_parallel, url=args.sms_url),
+                             args.sms_probe_interval, args.sms_parallel)
+    if args.daemonize and not args.test:
+        # log in now and keep the connection alive, so it is ready when a message has to be sent
+        sms_session.start_health_probe()
+    # messages are sent in the background, so that a slow SMS provider does not delay the checks
+    notify_queue = NotifyQueue(sms_session.send_batch, args.queue_size, args.spool_dir or None, args.sms_retries)
+    notify_queue.start()
+    REGISTRY.gauge("sms_notify_queue_depth", "Notifications waiting to be sent.").set_function(notify_queue.qsize)
+    REGISTRY.gauge("sms_notify_msg_budget_remaining", "Messages that can be sent before a limit is reached."
+                   ).set_function(rate_limiter.remaining)
+    if args.metrics_port:
+        try:
+            metrics_server = MetricsServer(REGISTRY, args.metrics_address, args.metrics_port)
+        except Exception:
+            logger.exception("Could not listen on %s:%d for metrics requests.", args.metrics_address, args.metrics_port)
+            exit(1)
+        metrics_server.start()
+        logger.debug("Serving metrics on http://%s:%d/metrics", args.metrics_address, metrics_server.port)
+    receiver = None
+    if args.heartbeat_port:
+        expect_reports(args, services)
+        try:
+            receiver = HeartbeatReceiver(HEARTBEATS, args.heartbeat_address, args.heartbeat_port)
+        except socket.error:
+            logger.exception("Could not listen on %s:%d for heartbeats.", args.heartbeat_address, args.heartbeat_port)
+            exit(1)
+        receiver.start()
+        logger.debug("Receiving heartbeats on %s:%d (UDP and HTTP).", args.heartbeat_address, receiver.port)
+    history = None
+    if args.history_dir:
+        try:
+            history = HistoryWriter(args.history_dir, args.history_days)
+        except (IOError, OSError):
+            logger.exception("Could not open history in '%s'.", args.history_dir)
+            exit(1)
+    cluster = None
+    if args.cluster_nodes:
+        try:
+            cluster = ClusterNode(args.cluster_node, args.cluster_nodes, args.cluster_replicas, args.cluster_quorum,
+                                  args.cluster_timeout, args.cluster_timeout / 5)
+        except (ValueError, socket.error):
+            logger.exception("Could not join the cluster as %s.", args.cluster_node)
+            exit(1)
+        cluster.start()
+        REGISTRY.gauge("sms_notify_cluster_nodes_alive", "Nodes of the cluster that are alive."
+                       ).set_function(lambda: len(cluster.alive()))
+    resolver = DNSCache(args.dns_ttl, args.dns_negative_ttl)
+    timeouts = AdaptiveTimeout(args.timeout_floor, args.timeout_ceiling, args.timeout_k)
+    scheduler = Scheduler(args.jitter)
+    confirmation = Confirmation(args.recheck_delays, args.confirm_failures)
+    by_name = dict()
+    for service in services:
+        by_name[service_name(service)] = service
+        rate_limiter.set_limit(service_name(service), service["msg_limit"])
+        if cluster and not cluster.is_mine(service_name(service)):
+            # checked by other nodes of the cluster
+            continue
+        # without daemon, check all services once (and re-check failed ones)
+        scheduler.add(service_name(service), service["interval"] * 60 if args.daemonize else None)
+    dependencies = Dependencies(dict((service_name(service), service["depends"]) for service in services))
+    states = StateStore(args.flap_threshold)
+    REGISTRY.gauge("sms_notify_services_down", "Services that are down.").set_function(lambda: states.down_count)
+    last_results = dict()  # service name: success of its last decided check
+    latency_stats = LatencyStats()
+    slow_unnotified = set()  # services that became slow since the last notification
+    not_run = set()  # services whose last due check was skipped, because an earlier check failed or its worker died
+
+    failed_now = set()  # failed in the current run, confirmed or not
+
+    def is_down(name):
+        return name in failed_now or (name in states and states[name].state == DOWN)
+
+    def update_state(name, success):
+        if states.update(name, success) == (DOWN, UP):
+            # check the services that were not checked while this one was down
+            for child in dependencies.children[name]:
+                if not cluster or cluster.is_mine(child):
+                    scheduler.recheck(child, 0)
+
+    # votes of other nodes are handled at least every heartbeat, reports of passive services every second
+    max_wait = cluster.heartbeat if cluster else None
+    if receiver:
+        max_wait = min(max_wait or 1.0, 1.0)
 
     while True:
         try:
-            results = run_checks(args, services)
-            failed_services = reduce(lambda x, y: x + y, [int(not x[0]) for x in results], 0)
-            if failed_services >= args.threshold:
-                if msg_count.can_send():
-                    count = notify(results, services, args)
-                    msg_count.update(count)
-                else:
-                    logger.info("Service(s) failed, but didn't send message because limit reached.")
+            reshard = cluster and cluster.membership_changed()
+            if RELOAD_REQUESTED.is_set():
+                RELOAD_REQUESTED.clear()
+                new_services = reload_services(args, start_dir)
+                if new_services is not None:
+                    added, removed, changed = diff_services(services, new_services)
+                    new_by_name = dict((service_name(service), service) for service in new_services)
+                    # keep the state of unchanged services, forget the removed ones
+                    for name in removed:
+                        scheduler.remove(name)
+                        confirmation.forget(name)
+                        states.remove(name)
+                        rate_limiter.set_limit(name, 0)
+                        latency_stats.remove(name)
+                        timeouts.remove(name)
+                        last_results.pop(name, None)
+                        slow_unnotified.discard(name)
+                        not_run.discard(name)
+                        forget_metrics(name)
+                        if cluster:
+                            cluster.forget(name)
+                    for name in changed:
+                        if new_by_name[name]["interval"] != by_name[name]["interval"]:
+                            scheduler.remove(name)
+                            scheduler.add(name, new_by_name[name]["interval"] * 60)
+                        if new_by_name[name]["msg_limit"] != by_name[name]["msg_limit"]:
+                            rate_limiter.set_limit(name, new_by_name[name]["msg_limit"])
+                    for name in added:
+                        rate_limiter.set_limit(name, new_by_name[name]["msg_limit"])
+                        scheduler.add(name, new_by_name[name]["interval"] * 60)
+                    services, by_name = new_services, new_by_name
+                    if workers:
+                        workers.update(services)
+                    if receiver:
+                        expect_reports(args, services)
+                    dependencies = Dependencies(dict((service_name(service), service["depends"])
+                                                     for service in services))
+                    logger.info("Reloaded services: %d added, %d removed, %d changed.", len(added), len(removed),
+                                len(changed))
+                    reshard = bool(cluster)
+            if reshard:
+                # nodes died or came back, check the services this node owns now
+                for service in services:
+                    name = service_name(service)
+                    if cluster.is_mine(name) and name not in scheduler:
+                        scheduler.add(name, service["interval"] * 60)
+                    elif not cluster.is_mine(name) and name in scheduler:
+                        scheduler.remove(name)
+                        confirmation.forget(name)
+            if receiver:
+                # a passive service that reported a new status is checked right away
+                for name in HEARTBEATS.pop_changed():
+                    if name in scheduler:
+                        scheduler.recheck(name, 0)
+            due = scheduler.pop_due()
+            updated = cluster.pop_updated() if cluster else set()  # services with new votes of other nodes
+            if due or updated:
+                cycle_start = monotonic()
+                if profiler:
+                    profiler.start()
+                votes = dict()
+                # parents first, services whose parent is down are not checked
+                for level in dependencies.levels(due):
+                    batch = list()
+                    for name in level:
+                        parent = dependencies.down_ancestor(name, is_down)
+                        if parent:
+                            logger.debug("Not checking %s, %s is down.", name, parent)
+                        else:
+                            batch.append(by_name[name])
+                    if not batch:
+                        continue
+                    results = run_checks(args, batch, resolver, timeouts, history, workers)
+                    for service, result in zip(batch, results):
+                        name = service_name(service)
+                        if result is None:
+                            # checked again when it is due the next time
+                            not_run.add(name)
+                            continue
+                        not_run.discard(name)
+                        if not result[0]:
+                            failed_now.add(name)
+                        success, delay = confirmation.update(name, result[0])
+                        if success is None:
+                            # not decided yet, keep the previous result until then
+                            scheduler.recheck(name, delay)
+                            continue
+                        last_results[name] = success
+                        if cluster:
+                            votes[name] = success
+                        else:
+                            update_state(name, success)
+                        if result[0] and result[0].latency is not None:
+                            became_slow = latency_stats.update(name, result[0].latency,
+                                                               by_name[name]["latency_threshold"])
+                            if became_slow:
+                                slow_unnotified.add(name)
+                            elif became_slow is False:
+                                slow_unnotified.discard(name)
+                            LATENCY_PERCENTILE.labels(name).set(latency_stats.get_percentile(name))
+                failed_now.clear()
+                if cluster:
+                    # the state of a service is what the quorum of the nodes checking it says
+                    cluster.vote(votes)
+                    for name in updated.union(votes):
+                        verdict = cluster.verdict(name)
+                        if name in by_name and verdict is not None:
+                            last_results[name] = verdict
+                            update_state(name, verdict)
+                failed_services = states.down_count
+                # only services that changed their state since the last notification need attention
+                recovered = [name for name in states.unnotified if states[name].state != DOWN]
+                states.mark_notified(recovered)
+                if states.unnotified and failed_services >= args.threshold:
+                    down = [name for name, state in states.states.items() if state.state == DOWN]
+                    muted = [name for name in down if not rate_limiter.can_send(name)]
+                    recipients, max_messages = message_budget(rate_limiter, args.recipients)
+                    if muted:
+                        logger.info("Not notifying about %s, limit of service reached.", ", ".join(sorted(muted)))
+                    if cluster and not cluster.is_leader():
+                        # only the leader of the cluster sends messages
+                        states.mark_notified(down)
+                    elif len(muted) == len(down):
+                        states.mark_notified(down)
+                    elif max_messages and recipients:
+                        # report only the root cause, not the services that depend on it
+                        dependent = set(name for name in down if dependencies.down_ancestor(name, is_down))
+                        results = [(last_results[service_name(x)], service_name(x)) for x in services
+                                   if service_name(x) in last_results and service_name(x) not in muted and
+                                   service_name(x) not in dependent]
+                        count = notify(results, services, args, notify_queue, max_messages, recipients,
+                                       len(dependent), len(not_run))
+                        rate_limiter.update(count, recipients + [name for name in down if name not in muted])
+                        states.mark_notified(down)
+                    else:
+                        logger.info("Service(s) failed, but didn't send message because limit reached.")
+                # slow services that are down now were notified about as failed
+                slow_unnotified.difference_update([name for name in slow_unnotified
+                                                   if name in states and states[name].state == DOWN])
+                if cluster:
+                    # each slow service is reported by one of the nodes checking it
+                    slow_unnotified.difference_update([name for name in slow_unnotified
+                                                       if cluster.owners(name)[:1] != [cluster.name]])
+                if slow_unnotified:
+                    slow = [service_name(x) for x in services if
+                            service_name(x) in slow_unnotified and rate_limiter.can_send(service_name(x))]
+                    recipients, max_messages = message_budget(rate_limiter, args.recipients)
+                    if not slow:
+                        logger.info("Not notifying about slow %s, limit of service reached.",
+                                    ", ".join(sorted(slow_unnotified)))
+                        slow_unnotified.clear()
+                    elif max_messages and recipients:
+                        slow.sort(key=lambda name: -by_name[name]["priority"])
+                        slow = [(name, latency_stats.get_percentile(name)) for name in slow]
+                        count = notify_slow(slow, args, notify_queue, max_messages, recipients)
+                        rate_limiter.update(count, recipients + [name for name, _ in slow])
+                        slow_unnotified.clear()
+                    else:
+                        logger.info("Service(s) slow, but didn't send message because limit reached.")
+                if history:
+                    history.flush()
+                if args.metrics_file:
+                    REGISTRY.write_textfile(args.metrics_file)
+                if profiler:
+                    profiler.stop()
+                TRACER.complete("cycle", cycle_start, "main", {"due": len(due), "updated": len(updated)})
+                TRACER.flush()
         except Exception, e:
             logger.exception("Running checks or notifying.")
             raise e
-        if args.daemonize:
-            time.sleep(args.interval * 60)
+        if args.daemonize or len(scheduler):
+            scheduler.wait(max_wait)
         else:
             break
+    if cluster:
+        cluster.stop()
+    if workers:
+        workers.stop()
+    if receiver:
+        receiver.stop()
+    if history:
+        history.close()
+    if not notify_queue.drain(notify_queue.retry_time(args.sms_timeout)):
+        logger.error("Could not send all messages, %d left in queue.", notify_queue.qsize())
+    notify_queue.stop()
+    TRACER.stop()
     return failed_services
 
 
+class ConfigError(Exception):
+    pass
+
+
 def main_quit(ec=0):
     logger.info("** EXIT **")
     exit(ec)
 
 
-def run_checks(args, services):
+def request_reload(signum=None, frame=None):
+    RELOAD_REQUESTED.set()
+
+
+def raise_config_error(message):
+    raise ConfigError(message)
+
+
+def service_name(service):
+    """
+    :param dict service: {name, host, port, ...}
+    :return: host:port for TCP services, else the URI
+    :rtype: str
+    """
+    return service["name"]
+
+
+def forget_metrics(name):
+    """
+    remove the series of a service that is not checked anymore from the metrics
+
+    :param str name: service_name() of the service
     """
-    run checks on network services
+    CHECKS_TOTAL.remove(name, "success")
+    CHECKS_TOTAL.remove(name, "failure")
+    CONNECT_SECONDS.remove(name)
+    LATENCY_PERCENTILE.remove(name)
+
+
+def reload_services(args, start_dir):
+    """
+    read the config file and the inventory again, see request_reload()
+
+    :param object args: returned by ArgumentParser.parse_args() at start
+    :param str start_dir: working directory at start, relative paths on the command line refer to it
+    :return: list services: [Service, ...], None if the configuration has errors
+    """
+    cwd = os.getcwd()
+    os.chdir(start_dir)
+    try:
+        new_args, services = parse_cmd_line(reloading=True)
+    except ConfigError, e:
+        logger.error("Not reloading, error in configuration: %s", e)
+        return None
+    finally:
+        os.chdir(cwd)
+    changed = [x for x in sorted(vars(new_args)) if x not in ["inventory", "services"] and
+               getattr(new_args, x) != getattr(args, x, None)]
+    if changed:
+        logger.warning("Changed options need a restart: %s", ", ".join(changed))
+    return services
+
+
+def execute_checks(args, services, resolver=None, timeouts=None):
+    """
+    run checks on network services, in this process
 
     :param object args: returned by ArgumentParser.parse_args()
-    :param list services: [{host, port}, ...]
-    :return: list results: [(success, host, port, protocol), ...]
+    :param list services: [{scheme, protocol, host, port, timeout, ...}, ...]
+    :param DNSCache resolver: cache for host name lookups, None to resolve in every check
+    :param AdaptiveTimeout timeouts: timeouts of services without their own, None to use timeout_ceiling
+    :return: list results: [(CheckResult, host, port, protocol), ...]
     """
-    results = list()
+    start = monotonic()
+    if resolver:
+        # look up each host only once, before the checks start
+        with TRACER.span("resolve", "check", hosts=len(services)):
+            resolver.prefetch([service["host"] for service in services if not check_class_for(service).PASSIVE],
+                              args.max_parallel)
+        DNS_SECONDS.observe(monotonic() - start)
+    check_class, executor_class = CHECK_ENGINES[args.check_engine]
+    checks = list()
     for service in services:
-        gtc = GenericTCPConnect(service["host"], service["port"], "TCP")
-        success = gtc.run()
-        results.append((success, service["host"], service["port"], "TCP"))
-        logger.debug("Check %s: %s:%s", "OK" if success else "FAILED", service["host"], service["port"],)
-        if not (success or args.force_all_checks):
-            break
+        timeout = service["timeout"] or (timeouts.get(service_name(service)) if timeouts else args.timeout_ceiling)
+        # TCP connects are run by the check engine, other checks by their own class
+        service_class = check_class if service["scheme"] == "tcp" else check_class_for(service)
+        options = dict((x, service[x]) for x in service_class.OPTIONS if x in service)
+        checks.append(service_class(service["host"], service["port"], service["protocol"], resolver, timeout,
+                                    **options))
+    executor = executor_class(args.max_parallel)
+    with TRACER.span("checks", "check", checks=len(checks)):
+        check_results = executor.run(checks, stop_on_failure=not args.force_all_checks)
+    results = list()
+    for success, check, service in zip(check_results, checks, services):
+        results.append((success, check.host, check.port, check.protocol))
+        if timeouts:
+            timeouts.update(service_name(service), success.latency if success else None)
+    if resolver:
+        logger.debug("DNS cache: %s", ", ".join("%s=%d" % item for item in sorted(resolver.stats().items())))
+    return results
+
+
+def run_checks(args, services, resolver=None, timeouts=None, history=None, workers=None):
+    """
+    run checks on network services, record and count the results
+
+    :param object args: returned by ArgumentParser.parse_args()
+    :param list services: [{scheme, protocol, host, port, timeout, ...}, ...]
+    :param DNSCache resolver: cache for host name lookups, None to resolve in every check
+    :param AdaptiveTimeout timeouts: timeouts of services without their own, None to use timeout_ceiling
+    :param HistoryWriter history: record every result here, None to not record them
+    :param WorkerPool workers: run the checks in these processes (with their own resolver and timeouts), None to
+           run them in this process
+    :return: list results: [(CheckResult, host, port, protocol), ...] in the order of services, None for services
+             that were not checked (without force_all_checks after the first failed one, or their worker died)
+    """
+    start = monotonic()
+    if workers:
+        # passive services are checked here, their reports are received by this process
+        passive = [service for service in services if check_class_for(service).PASSIVE]
+        active = [service for service in services if not check_class_for(service).PASSIVE]
+        by_name = dict(zip([service_name(x) for x in active], workers.run(active)))
+        if passive:
+            by_name.update(zip([service_name(x) for x in passive], execute_checks(args, passive)))
+        results = [by_name.get(service_name(service)) for service in services]
+    else:
+        results = execute_checks(args, services, resolver, timeouts)
+        # the checks after the first failed one were not run
+        results += [None] * (len(services) - len(results))
+    for result, service in zip(results, services):
+        if result is None:
+            continue
+        success = result[0]
+        if history:
+            history.record(service_name(service), success, success.latency if success else None)
+        CHECKS_TOTAL.labels(service_name(service), "success" if success else "failure").inc()
+        logger.debug("Check %s: %s", "OK" if success else "FAILED", service_name(service))
+    SWEEP_SECONDS.observe(monotonic() - start)
     return results
 
 
-def notify(results, services, args):
+def expect_reports(args, services):
     """
-    send message about failed service-checks to args.mobile
+    Tell HEARTBEATS which passive services to expect reports from.
 
-    :param list results: [(success, host, port, protocol), ...]
-    :param list services: [{host, port}, ...]
     :param object args: returned by ArgumentParser.parse_args()
-    :return: number of messages sent
+    :param list services: [{name, interval, timeout, ...}, ...]
+    """
+    deadlines = dict()
+    for service in services:
+        if check_class_for(service).PASSIVE:
+            # failed if it did not report for its interval plus its timeout
+            deadlines[service_name(service)] = service["interval"] * 60 + (service["timeout"] or args.timeout_ceiling)
+    HEARTBEATS.expect(deadlines)
+
+
+def notify(results, services, args, notify_queue, max_messages=1, recipients=None, dependent=0, not_run=0):
+    """
+    send message about failed service-checks to all recipients
+
+    :param list results: [(success, service name), ...]
+    :param list services: [{name, host, port, protocol, path, priority, ...}, ...]
+    :param object args: returned by ArgumentParser.parse_args()
+    :param NotifyQueue notify_queue: queue of messages to send
+    :param integer max_messages: send at most this many messages, summarize the rest
+    :param list recipients: phone numbers, None for all in args.recipients
+    :param integer dependent: number of failed services left out of results, because a service they depend on failed
+    :param integer not_run: number of services not checked, because an earlier check failed
+    :return: number of messages queued
     :rtype: integer
     """
-    msg = "Service(s) failed: %s" % " ".join(["%s:%d(%s)" % (x[1], x[2], x[3]) for x in results if not x[0]])
-    if len(results) < len(services):
-        msg += " (%d checks not run)" % (len(services) - len(results))
-    logger.info(msg)
-    count = 0
-    ssms = SipgateSMS(args.username, args.password)
-    for msg_slice in range(0, len(msg), 160):
-        message = msg[msg_slice:msg_slice + 160]
-        if args.test:
-            logger.info("Test run - not sending SMS >>%s<< to >>%s<<.", message, args.mobile)
-        else:
-            ssms.send(args.mobile, message)
-        count += 1
-    return count
+    by_name = dict((service_name(service), service) for service in services)
+    # highest priority first, in the order of the services otherwise (sort is stable)
+    failed = [by_name[name] for _, name in sorted([x for x in results if not x[0]],
+                                                  key=lambda x: -by_name[x[1]]["priority"])]
+    notes = list()
+    if dependent:
+        notes.append("%d dependent failed" % dependent)
+    if not_run:
+        notes.append("%d checks not run" % not_run)
+    trailer = "(%s)" % ", ".join(notes) if notes else None
+    with TRACER.span("build messages", "notify", services=len(failed)):
+        tokens = compact_services([(x["host"], x["port"], x["protocol"], x["path"]) for x in failed])
+        messages = build_messages("Service(s) failed:", tokens, max_messages, trailer)
+    return send_messages(messages, args, notify_queue, recipients)
+
+
+def notify_slow(slow, args, notify_queue, max_messages=1, recipients=None):
+    """
+    send message about slow services to all recipients
+
+    :param list slow: [(service name, 95th percentile of connect time), ...], most important first
+    :param object args: returned by ArgumentParser.parse_args()
+    :param NotifyQueue notify_queue: queue of messages to send
+    :param integer max_messages: send at most this many messages, summarize the rest
+    :param list recipients: phone numbers, None for all in args.recipients
+    :return: number of messages queued
+    :rtype: integer
+    """
+    with TRACER.span("build messages", "notify", services=len(slow)):
+        tokens = ["%s(p95 %s)" % (name, "%.1fs" % latency if latency >= 1 else "%.3gms" % (latency * 1000))
+                  for name, latency in slow]
+        messages = build_messages("Service(s) slow:", tokens, max_messages)
+    return send_messages(messages, args, notify_queue, recipients)
 
 
-def parse_cmd_line():
+def send_messages(messages, args, notify_queue, recipients=None):
+    """
+    queue messages for all recipients, only log them in a test run
+
+    :param list messages: the messages, max 160 characters each
+    :param object args: returned by ArgumentParser.parse_args()
+    :param NotifyQueue notify_queue: queue of messages to send
+    :param list recipients: phone numbers, None for all in args.recipients
+    :return: number of messages queued
+    :rtype: integer
+    """
+    if recipients is None:
+        recipients = args.recipients
+    logger.info(" ".join(messages))
+    if args.test:
+        for message in messages:
+            logger.info("Test run - not sending SMS >>%s<< to >>%s<<.", message, ", ".join(recipients))
+    else:
+        notify_queue.put(recipients, messages)
+    return len(messages)
+
+
+def message_budget(rate_limiter, recipients):
+    """
+    :param RateLimiter rate_limiter: limits of all messages, recipients and services
+    :param list recipients: phone numbers
+    :return: (recipients whose limit is not reached, number of messages that can be sent to them)
+    :rtype: tuple
+    """
+    recipients = [x for x in recipients if rate_limiter.can_send(x)]
+    budget = [rate_limiter.remaining(x) for x in [None] + recipients]
+    return recipients, min(x for x in budget if x is not None)
+
+
+def parse_cmd_line(reloading=False):
     """
     parse command line, check and set sane values
 
+    :param bool reloading: raise ConfigError instead of exiting if there is an error
     :return: tuple (object, list): (returned by ArgumentParser.parse_args() , [{host, port}, ...])
     """
     program_name = os.path.basename(sys.argv[0])
@@ -171,14 +686,26 @@ USAGE
 ''' % (program_shortdesc, str(__date__))
 
     # set defaults, don't use None because the type() is used when reading from a config file
-    defaults = {"daemonize": False, "threshold": 1, "force_all_checks": False, "interval": 1, "logfile": "",
-                "msg_limit": 1, "mobile": "", "password": "", "pid_file": "", "quiet": False,
-                "services": "", "test": False, "username": "", "verbose": False, "write_conf_file": ""}
+    defaults = {"check_engine": "threads", "cluster_node": "", "cluster_nodes": "", "cluster_quorum": 0,
+                "cluster_replicas": 2, "cluster_timeout": 10.0, "confirm_failures": 1, "daemonize": False,
+                "dns_negative_ttl": 30, "dns_ttl": 300, "threshold": 1, "force_all_checks": False,
+                "heartbeat_address": "127.0.0.1", "heartbeat_port": 0, "flap_threshold": 0.5, "history_days": 0,
+                "history_dir": "", "http_idle_timeout": 120.0, "http_pool_size": 2, "interval": 1, "inventory": "",
+                "jitter": 0.1, "latency_threshold": 0.0, "logfile": "", "max_parallel": 10,
+                "metrics_address": "127.0.0.1", "metrics_file": "", "metrics_port": 0, "msg_burst": 0, "msg_limit": 1,
+                "msg_limit_day": 0, "msg_limit_minute": 0, "mobile": "", "password": "", "pid_file": "",
+                "profile": "", "profile_cycles": 0, "queue_size": 100, "quiet": False, "rate_state": "",
+                "recipient_limit": 0, "recheck_delays": "2,5,15", "services": "", "sms_probe_interval": 600,
+                "sms_retries": 5, "sms_timeout": 30, "sms_url": SIPGATE_URL, "spool_dir": "", "test": False,
+                "timeout_ceiling": 10.0, "timeout_floor": 3.0, "timeout_k": 4.0, "username": "", "verbose": False,
+                "workers": 0, "write_conf_file": ""}
     try:
         # check for a config file first
         conf_parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter, add_help=False)
         conf_parser.add_argument("-c", "--conf_file",
                                  help="Specify config file, cmdline option overwrite values from file.", metavar="FILE")
+        if reloading:
+            conf_parser.error = raise_config_error
         args, remaining_argv = conf_parser.parse_known_args()
 
         # overwrite defaults with settings from config file
@@ -203,40 +730,161 @@ USAGE
                     # option not in config file
                     pass
 
-            # make list of services from string in config file
+            # make list of services and mobile numbers from strings in config file
             if defaults.get("services"):
                 defaults["services"] = defaults["services"].split()
+            if defaults.get("mobile"):
+                defaults["mobile"] = defaults["mobile"].split()
+            if defaults.get("cluster_nodes"):
+                defaults["cluster_nodes"] = defaults["cluster_nodes"].split()
         else:
             conf_file = None
         # read remaining cmdline options, overwrite defaults (again)
         parser = ArgumentParser(parents=[conf_parser], description=program_license,
                                 formatter_class=RawDescriptionHelpFormatter)
         parser.set_defaults(**defaults)
+        if reloading:
+            # report errors to the running daemon instead of exiting
+            parser.error = raise_config_error
+        parser.add_argument("--check_engine", choices=sorted(CHECK_ENGINES.keys()),
+                            help="Run checks in a pool of threads or all from one thread using non-blocking sockets"
+                                 " [default: %(default)s]")
+        parser.add_argument("--cluster_node", metavar="host:port",
+                            help="Address of this node in cluster_nodes [default: %(default)s]")
+        parser.add_argument("--cluster_nodes", metavar="host:port", nargs='+',
+                            help="UDP addresses of all daemons of a cluster, that share the checks and agree on"
+                                 " outages [default: %(default)s]")
+        parser.add_argument("--cluster_quorum", type=int,
+                            help="Count a service as failed if x of the nodes checking it see it failed, 0 for a"
+                                 " majority [default: %(default)s]")
+        parser.add_argument("--cluster_replicas", type=int,
+                            help="Check each service from x nodes of the cluster [default: %(default)s]")
+        parser.add_argument("--cluster_timeout", type=float,
+                            help="Count a node as dead if it was not heard of for x seconds [default: %(default)s]")
+        parser.add_argument("--confirm_failures", type=int,
+                            help="Count a service as failed only if x probes (the check and its re-checks) fail"
+                                 " [default: %(default)s]")
         parser.add_argument("-d", "--daemonize", action="store_true",
                             help="Run in background [default: %(default)s]")
+        parser.add_argument('--dns_ttl', help="Cache host name lookups for x seconds [default: %(default)s]", type=int)
+        parser.add_argument('--dns_negative_ttl', type=int,
+                            help="Cache failed host name lookups for x seconds [default: %(default)s]")
         parser.add_argument('-e', '--threshold', help="Notify only if at least x tests fail [default: %(default)s]",
                             type=int)
         parser.add_argument('-f', '--force_all_checks', action='store_true',
                             help="Do not stop running checks after the first one fails [default: %(default)s]")
+        parser.add_argument('--flap_threshold', type=float,
+                            help="Suppress notifications about a service if at least x of its last 20 results were"
+                                 " state changes, 0 to disable [default: %(default)s]")
+        parser.add_argument('--heartbeat_address',
+                            help="Address to receive reports of passive services on, see heartbeat_port"
+                                 " [default: %(default)s]")
+        parser.add_argument('--heartbeat_port', type=int,
+                            help="Receive reports of passive services (push://name) on this UDP and TCP (HTTP POST)"
+                                 " port, 0 to disable [default: %(default)s]")
+        parser.add_argument('--history_days', type=int,
+                            help="Delete check history older than x days, 0 to keep all [default: %(default)s]")
+        parser.add_argument('--history_dir', metavar="DIR",
+                            help="Record the result of every check in this directory, query it with python -m"
+                                 " history.query [default: %(default)s]")
+        parser.add_argument('--http_idle_timeout', type=float,
+                            help="Close connections of HTTP checks not used for x seconds [default: %(default)s]")
+        parser.add_argument('--http_pool_size', type=int,
+                            help="Keep up to x connections to each server of HTTP checks open between checks, 0 to"
+                                 " open a new connection for every check [default: %(default)s]")
+        parser.add_argument('--inventory', metavar="PATH",
+                            help="Read services from this file, or all files in this directory: one service per line,"
+                                 " optionally followed by option=value pairs [default: %(default)s]")
         parser.add_argument('-i', '--interval', help="Run check(s) every x minutes [default: %(default)s]",
                             type=int)
+        parser.add_argument('--jitter', type=float,
+                            help="Delay checks randomly by up to x times the interval [default: %(default)s]")
+        parser.add_argument('--latency_threshold', type=float,
+                            help="Notify if the 95th percentile of the recent connect times of a service is above x"
+                                 " seconds, 0 to disable [default: %(default)s]")
         parser.add_argument('-l', '--logfile', help="Set logfile [default: %(default)s]")
+        parser.add_argument('--max_parallel', help="Run at most x checks at the same time [default: %(default)s]",
+                            type=int)
+        parser.add_argument('--metrics_address',
+                            help="Address to serve metrics on, see metrics_port [default: %(default)s]")
+        parser.add_argument('--metrics_file', metavar="FILE",
+                            help="Write metrics to this file after every check, for the textfile collector of"
+                                 " node_exporter [default: %(default)s]")
+        parser.add_argument('--metrics_port', type=int,
+                            help="Serve metrics in the Prometheus format on http://metrics_address:x/metrics, 0 to"
+                                 " disable [default: %(default)s]")
+        parser.add_argument('--msg_burst', type=int,
+                            help="Send at most x msg at once, allowing more again at the rate of the limits, 0 to"
+                                 " disable [default: %(default)s]")
         parser.add_argument('--msg_limit', help="Limit num of msg sent per hour [default: %(default)s]", type=int)
-        parser.add_argument("-m", "--mobile",
-                            help="Mobile phone number to send SMS to (starting with country code, e.g. 4917712345678) [required]")
+        parser.add_argument('--msg_limit_day', type=int,
+                            help="Limit num of msg sent per day, 0 for no limit [default: %(default)s]")
+        parser.add_argument('--msg_limit_minute', type=int,
+                            help="Limit num of msg sent per minute, 0 for no limit [default: %(default)s]")
+        parser.add_argument("-m", "--mobile", metavar="mobile", nargs='+',
+                            help="Mobile phone number(s) to send SMS to (starting with country code, e.g. 4917712345678)"
+                                 " or @group from the config file [required]")
         parser.add_argument("-p", "--password", help="SIP account password [required]")
         parser.add_argument('--pid_file', help="Set pid_file [default: %(default)s]")
+        parser.add_argument('--profile', metavar="DIR",
+                            help="Append the time of each phase of each cycle (DNS, connects, building and sending"
+                                 " messages) to DIR/trace.json, for chrome://tracing or ui.perfetto.dev"
+                                 " [default: %(default)s]")
+        parser.add_argument('--profile_cycles', type=int,
+                            help="With --profile, also run each cycle under cProfile and keep the dumps of the last x"
+                                 " cycles in DIR, 0 to disable [default: %(default)s]")
+        parser.add_argument('--queue_size', type=int,
+                            help="Keep at most x messages waiting to be sent [default: %(default)s]")
         group = parser.add_mutually_exclusive_group()
         group.add_argument("-q", "--quiet", action="store_true",
                            help="Show errors only on the console [default: %(default)s]")
+        parser.add_argument("--rate_state", metavar="FILE",
+                            help="Keep the number of sent msg in this file, so the limits survive a restart"
+                                 " [default: %(default)s]")
+        parser.add_argument("--recheck_delays", metavar="SECONDS",
+                            help="Comma separated delays of re-checks of a failed service, used if confirm_failures"
+                                 " > 1 [default: %(default)s]")
+        parser.add_argument("--recipient_limit", type=int,
+                            help="Limit num of msg sent to each recipient per hour, 0 for no limit"
+                                 " [default: %(default)s]")
         parser.add_argument("-s", "--service", dest="services", metavar="service", nargs='+',
-                            help="TCP service to check in format host:port or IP:port [required]")
+                            help="Service to check in format host:port or IP:port (TCP connect) or as URI like"
+                                 " http://host:port/path, https://..., tls://host:port, ssh://host, smtp://host,"
+                                 " redis://host, banner://host:port [required]")
+        parser.add_argument("--sms_parallel", type=int,
+                            help="Send to at most x recipients at the same time [default: %(default)s]")
+        parser.add_argument("--sms_probe_interval", type=int,
+                            help="Check the connection to the SMS provider every x seconds, 0 to disable"
+                                 " [default: %(default)s]")
+        parser.add_argument("--sms_retries", type=int,
+                            help="Retry sending a message x times, waiting longer each time [default: %(default)s]")
+        parser.add_argument("--sms_timeout", type=int,
+                            help="Wait at most x seconds for the SMS provider [default: %(default)s]")
+        parser.add_argument("--sms_url", metavar="URL",
+                            help="XML-RPC URL of the SMS provider, e.g. of python -m bench.fake_sipgate for tests"
+                                 " [default: %(default)s]")
+        parser.add_argument("--spool_dir", metavar="DIR",
+                            help="Keep unsent messages in this directory, to send them after a restart"
+                                 " [default: %(default)s]")
         parser.add_argument("-t", "--test", action="store_true",
                             help="Test run - don't send SMS [default: %(default)s]")
+        parser.add_argument("--timeout_ceiling", type=float,
+                            help="Wait at most x seconds for a connection, also used for services without successful"
+                                 " checks [default: %(default)s]")
+        parser.add_argument("--timeout_floor", type=float,
+                            help="Wait at least x seconds for a connection. Linux sends a lost SYN again after 1"
+                                 " and 3 seconds, with less than 3 a single lost packet can fail the check"
+                                 " [default: %(default)s]")
+        parser.add_argument("--timeout_k", type=float,
+                            help="Wait for a connection the smoothed connect time of the service plus x times its"
+                                 " variation [default: %(default)s]")
         parser.add_argument("-u", "--username", help="SIP account username [required]")
         group.add_argument("-v", "--verbose", action="store_true",
                            help="Enable noise on the console [default: %(default)s]")
         parser.add_argument('-V', '--version', action='version', version=program_version_message)
+        parser.add_argument("--workers", type=int,
+                            help="Run the checks in x processes, each checking a share of the services, 0 to run them"
+                                 " in this process [default: %(default)s]")
         parser.add_argument("-w", "--write_conf_file", help="Write configuration given on cmdline to file",
                             metavar="FILE")
 
@@ -245,9 +893,29 @@ USAGE
 
         args.conf_file = conf_file
         args.interval = max(1, args.interval)
+        args.jitter = min(max(0.0, args.jitter), 1.0)
+        args.max_parallel = max(1, args.max_parallel)
+        args.sms_parallel = max(1, args.sms_parallel)
+        args.workers = max(0, args.workers)
+        if not args.sms_url.startswith(("http://", "https://")):
+            parser.error("Invalid sms_url '%s'." % args.sms_url)
+        try:
+            args.recheck_delays = [float(x) for x in args.recheck_delays.split(",") if x.strip()]
+        except ValueError:
+            parser.error("Invalid recheck_delays '%s'." % args.recheck_delays)
+        if any(x < 0 for x in args.recheck_delays):
+            parser.error("Invalid recheck_delays '%s'." % args.recheck_delays)
+        if not 1 <= args.confirm_failures <= len(args.recheck_delays) + 1:
+            parser.error("confirm_failures must be between 1 and the number of recheck_delays + 1.")
         args.msg_limit = max(1, args.msg_limit)
+        if not 0 < args.timeout_floor <= args.timeout_ceiling:
+            parser.error("timeout_floor must be positive and not greater than timeout_ceiling.")
+        args.timeout_k = max(0.0, args.timeout_k)
+        args.http_pool_size = max(0, args.http_pool_size)
+        for argn in ["msg_burst", "msg_limit_day", "msg_limit_minute", "recipient_limit"]:
+            setattr(args, argn, max(0, getattr(args, argn)))
 
-        for argn in ["logfile", "pid_file", "write_conf_file"]:
+        for argn in ["logfile", "metrics_file", "pid_file", "rate_state", "write_conf_file"]:
             filen = getattr(args, argn, None)
             if filen:
                 path = os.path.abspath(filen)
@@ -257,10 +925,34 @@ USAGE
                 else:
                     setattr(args, argn, path)
 
+        if not 0 <= args.metrics_port <= 65535:
+            parser.error("Invalid metrics_port '%d'." % args.metrics_port)
+        if not 0 <= args.heartbeat_port <= 65535:
+            parser.error("Invalid heartbeat_port '%d'." % args.heartbeat_port)
+
+        if args.history_dir:
+            args.history_dir = os.path.abspath(args.history_dir)
+
+        if args.profile:
+            args.profile = os.path.abspath(args.profile)
+        args.profile_cycles = max(0, args.profile_cycles)
+
+        if args.spool_dir:
+            args.spool_dir = os.path.abspath(args.spool_dir)
+            if not os.path.isdir(args.spool_dir) or not os.access(args.spool_dir, os.W_OK):
+                parser.error("Directory '%s' for spool_dir not writable." % args.spool_dir)
+
     except KeyboardInterrupt:
+        if reloading:
+            raise
         # handle keyboard interrupt
         return 0
+    except ConfigError:
+        raise
     except Exception, e:
+        if reloading:
+            # e.g. ConfigParser.ParsingError, the running daemon keeps its configuration
+            raise ConfigError(str(e))
         if DEBUG:
             raise e
         indent = len(program_name) * " "
@@ -269,29 +961,55 @@ USAGE
         return 2
 
     # check for required arguments, as argparse was not instructed to do it
-    if not all([args.mobile, args.services, args.username, args.password, type(args.services) == list]):
-        parser.error("Missing at least one of the required arguments: -m mobile, -s service, -u username, -p password.")
+    if not all([args.mobile, args.services or args.inventory, args.username, args.password,
+                type(args.services) == list or not args.services, type(args.mobile) == list]):
+        parser.error("Missing at least one of the required arguments: -m mobile, -s service or --inventory, -u "
+                     "username, -p password.")
 
-    services = list()
-    for service in args.services:
-        # check service format, even if socket class does it too...
-        try:
-            host, port = service.split(":")
-            if is_valid_service(host, port, parser):
-                port = int(port)
-                services.append({"host": host, "port": port})
-        except:
-            parser.error("Invalid service '%s'." % service)
+    inventory = Inventory({"depends": list(), "interval": args.interval, "latency_threshold": args.latency_threshold,
+                           "msg_limit": 0, "priority": 0, "timeout": 0.0})
+    for spec in args.services or []:
+        inventory.add(spec)
+    if args.inventory:
+        inventory.load(args.inventory)
+    try:
+        if conf_file:
+            inventory.read_config(conf_file)
+        services = inventory.services()
+    except (ConfigParser.Error, InventoryError), e:
+        parser.error(str(e))
+    args.recipients = read_recipients(conf_file, args.mobile, parser)
+
+    if args.check_engine not in CHECK_ENGINES:
+        parser.error("Unknown check_engine '%s'." % args.check_engine)
+
+    if not args.heartbeat_port and any(check_class_for(service).PASSIVE for service in services):
+        parser.error("Passive services (push://) need a heartbeat_port.")
+
+    if args.cluster_nodes:
+        if type(args.cluster_nodes) != list or args.cluster_node not in args.cluster_nodes:
+            parser.error("The cluster_node must be one of the cluster_nodes.")
+        if not args.daemonize:
+            parser.error("A cluster node must run as daemon.")
+        if args.cluster_replicas < 1 or args.cluster_quorum < 0 or args.cluster_timeout <= 0:
+            parser.error("Invalid cluster_replicas, cluster_quorum or cluster_timeout.")
+        for node in args.cluster_nodes:
+            host, _, port = node.rpartition(":")
+            if not host or not port.isdigit() or not 0 < int(port) < 65536:
+                parser.error("Invalid cluster node '%s', use host:port." % node)
 
     if not args.force_all_checks and args.threshold > 1:
         parser.error("Threshold cannot be higher than 1 if force_all_checks is off.")
 
-    if args.write_conf_file:
+    if args.write_conf_file and not reloading:
         config = ConfigParser.SafeConfigParser()
         config.add_section('Defaults')
         for arg in dir(args):
-            if not arg.startswith("_") and arg not in ["conf_file", "services", "write_conf_file"]:
-                config.set('Defaults', arg, str(getattr(args, arg)))
+            if not arg.startswith("_") and arg not in ["conf_file", "recipients", "services", "write_conf_file"]:
+                value = getattr(args, arg)
+                if isinstance(value, list):
+                    value = (" " if arg in ["cluster_nodes", "mobile"] else ",").join(str(x) for x in value)
+                config.set('Defaults', arg, str(value))
         config.set('Defaults', "services", reduce(lambda x, y: x + y, [x + " " for x in args.services], "").rstrip())
 
         with open(args.write_conf_file, 'wb') as configfile:
@@ -303,6 +1021,38 @@ USAGE
     return args, services
 
 
+def read_recipients(conf_file, mobile, parser):
+    """
+    expand @group entries in mobile with the numbers from the [recipients] section of the config file
+
+    :param str conf_file: path to config file or None
+    :param list mobile: phone numbers and @group names
+    :param ArgumentParser parser: to report errors
+    :return: phone numbers, each only once
+    :rtype: list
+    """
+    config = ConfigParser.SafeConfigParser()
+    if conf_file:
+        try:
+            config.read([conf_file])
+        except ConfigParser.Error, e:
+            parser.error(str(e))
+    recipients = list()
+    for entry in mobile:
+        if entry.startswith("@"):
+            if not config.has_option("recipients", entry[1:]):
+                parser.error("Unknown recipient group '%s', add it to the [recipients] section." % entry)
+            numbers = config.get("recipients", entry[1:]).split()
+        else:
+            numbers = [entry]
+        for number in numbers:
+            if not number.isdigit():
+                parser.error("Invalid mobile phone number '%s'." % number)
+            if number not in recipients:
+                recipients.append(number)
+    return recipients
+
+
 def setup_logging(args):
     logger.setLevel(logging.DEBUG)
 
@@ -328,37 +1078,6 @@ def setup_logging(args):
         logger.addHandler(fh)
 
 
-def is_valid_service(host, port, parser):
-    try:
-        port = int(port)
-    except:
-        parser.error("Invalid port '%s'." % port)
-    if port > 65535 or port < 1:
-        raise ValueError("Invalid port number '%d'." % port)
-    # https://stackoverflow.com/questions/11264005/using-a-regex-to-match-ip-addresses-in-python
-    pat = re.compile(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
-    is_ip = pat.match(host)
-    if is_ip:
-        for octet in host.split("."):
-            if int(octet) > 256:
-                parser.error("Invalid IP '%s'." % host)
-    else:
-        if not is_valid_hostname(host):
-            parser.error("Invalid hostname '%s'." % host)
-    return True
-
-
-def is_valid_hostname(hostname):
-    # https://stackoverflow.com/questions/2532053/validate-a-hostname-string
-    if len(hostname) > 255:
-        return False
-    if hostname[-1] == ".":
-        # strip exactly one dot from the right, if present
-        hostname = hostname[:-1]
-    allowed = re.compile("(?!-)[A-Z\d-]{1,63}(?<!-)$", re.IGNORECASE)
-    return all(allowed.match(x) for x in hostname.split("."))
-
-
 if __name__ == "__main__":
     if DEBUG:
         sys.argv.append("-v")
@@ -0,0 +1,144 @@
+# encoding: utf-8
+"""
+message_builder -- packs a list of failed services into as few text messages as possible
+
+Services are grouped by host with their ports collapsed into ranges (db1:5432-5434,8080).
+Services with a path (URIs) are only grouped with services of the same path, which is kept
+(www1:80,8080/health(HTTP)). The result is split into messages at service boundaries, never inside a host:port. Message
+length is counted like the GSM network does: 160 GSM-7 characters (characters from the
+GSM-7 extension table count twice) or 70 UCS-2 characters if the text contains a character
+that is not in GSM-7. If not everything fits into the allowed number of messages, the last
+one ends with a "+N more" summary.
+"""
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+GSM7_BASIC = set(u"@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?¡ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                 u"ÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà")
+GSM7_EXTENSION = set(u"^{}\\[~]|€\f")
+
+# characters in a single message / in each part of a concatenated message
+GSM7_SINGLE = 160
+GSM7_CONCAT = 153
+UCS2_SINGLE = 70
+UCS2_CONCAT = 67
+
+
+def is_gsm7(text):
+    """
+    :param unicode text: message text
+    :return: True if text can be sent with the GSM-7 alphabet
+    :rtype: bool
+    """
+    return all(c in GSM7_BASIC or c in GSM7_EXTENSION for c in _unicode(text))
+
+
+def message_length(text):
+    """
+    :param unicode text: message text
+    :return: (length in characters of its encoding, maximum length of a single message)
+    :rtype: tuple
+    """
+    text = _unicode(text)
+    if is_gsm7(text):
+        return len(text) + sum(1 for c in text if c in GSM7_EXTENSION), GSM7_SINGLE
+    return len(text.encode("utf-16-le")) // 2, UCS2_SINGLE
+
+
+def fits(text):
+    """
+    :param unicode text: message text
+    :return: True if text fits into a single message
+    :rtype: bool
+    """
+    length, max_length = message_length(text)
+    return length <= max_length
+
+
+def compact_services(services):
+    """
+    Group services by host, protocol and path, collapse consecutive ports into ranges.
+    Groups keep the order of the first service of each group.
+
+    :param list services: [(host, port, protocol), ...] or [(host, port, protocol, path), ...]
+    :return: ["host:port,port-port/path", ...], protocol is appended in brackets if not TCP
+    :rtype: list
+    """
+    groups = list()
+    ports = dict()
+    for service in services:
+        host, port, protocol = service[:3]
+        # http://host and http://host/ are the same page
+        path = service[3] if len(service) > 3 and service[3] != "/" else ""
+        if (host, protocol, path) not in ports:
+            groups.append((host, protocol, path))
+            ports[(host, protocol, path)] = set()
+        ports[(host, protocol, path)].add(port)
+
+    tokens = list()
+    for host, protocol, path in groups:
+        ranges = list()
+        for port in sorted(ports[(host, protocol, path)]):
+            if ranges and ranges[-1][1] == port - 1:
+                ranges[-1][1] = port
+            else:
+                ranges.append([port, port])
+        if ranges == [[0, 0]]:
+            # passive services have no port
+            token = host
+        else:
+            # IPv6 addresses in brackets
+            token = "%s:%s" % ("[%s]" % host if ":" in host else host,
+                               ",".join(str(a) if a == b else "%d-%d" % (a, b) for a, b in ranges)) + path
+        if protocol != "TCP":
+            token += "(%s)" % protocol
+        tokens.append(token)
+    return tokens
+
+
+def build_messages(header, tokens, max_messages=1, trailer=None):
+    """
+    Put header and tokens (separated by spaces) into as few messages as possible, without
+    splitting a token. If not all tokens fit into max_messages messages, the last message
+    ends with "+N more".
+
+    :param str header: start of the first message
+    :param list tokens: strings, most important first
+    :param integer max_messages: maximum number of messages
+    :param str trailer: appended after the last token, if there is room
+    :return: messages
+    :rtype: list
+    """
+    max_messages = max(1, max_messages)
+    tokens = list(tokens) + ([trailer] if trailer else [])
+    messages = list()
+    current = [header]
+    for num, token in enumerate(tokens):
+        if fits(" ".join(current + [token])):
+            current.append(token)
+        elif len(messages) + 1 < max_messages and fits(token):
+            messages.append(" ".join(current))
+            current = [token]
+        else:
+            # last message: make room for the summary
+            left = len([x for x in tokens[num:] if x is not trailer])
+            if not left:
+                break
+            while len(current) > 1 and not fits(" ".join(current + ["+%d more" % left])):
+                if current.pop() is not trailer:
+                    left += 1
+            current.append("+%d more" % left)
+            break
+    messages.append(" ".join(current))
+    return [msg[:GSM7_SINGLE] for msg in messages]
+
+
+def _unicode(text):
+    if isinstance(text, str):
+        return text.decode("utf-8", "replace")
+    return text
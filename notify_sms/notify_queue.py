@@ -0,0 +1,230 @@
+# encoding: utf-8
+"""
+notify_queue -- sends messages in the background, so a slow SMS provider does not stop the checks
+
+Messages are put into a bounded queue and sent by a worker thread, to all recipients in
+parallel. If sending fails, the failed messages are retried with exponential backoff. If
+a spool directory is set, every queued message is written to a file there until it was
+sent, and messages left over from the last run are sent after a restart.
+"""
+
+import os
+import json
+import itertools
+import threading
+import time
+import Queue
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+
+class NotifyQueue(object):
+
+    """
+    Sends messages in the background.
+    """
+
+    def __init__(self, send_batch, maxsize=100, spool_dir=None, retries=5, backoff=2.0, max_backoff=300.0):
+        """
+        :param send_batch: function(destinations, messages) like SMSSession.send_batch()
+        :param integer maxsize: maximum number of queued messages, 0 for no limit
+        :param str spool_dir: directory to keep queued messages in, None to keep them only in memory
+        :param integer retries: number of retries after a failed send
+        :param float backoff: seconds to wait before the first retry, doubled for every further retry
+        :param float max_backoff: maximum seconds to wait before a retry
+        """
+        self.send_batch = send_batch
+        self.spool_dir = spool_dir
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue = Queue.Queue(max(0, maxsize))
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.spool_dir:
+            self._load_spool()
+
+    def qsize(self):
+        """
+        :return: number of notifications waiting to be sent
+        :rtype: integer
+        """
+        return self._queue.qsize()
+
+    def put(self, destinations, messages):
+        """
+        Queue messages, does not block.
+
+        :param list destinations: phone numbers (RFC3824), starting with country code (e.g. 4917712345678)
+        :param list messages: the messages, each is sent to every destination
+        :return: False if the queue was full and the messages were dropped
+        :rtype: bool
+        """
+        # destination and the messages that still have to be sent to it
+        item = {"pending": [[destination, list(messages)] for destination in destinations], "attempts": 0,
+                "file": None}
+        if self.spool_dir:
+            self._spool(item)
+        try:
+            self._queue.put_nowait(item)
+        except Queue.Full:
+            logger.error("Notification queue full, dropping message(s) to '%s': %s", "', '".join(destinations),
+                         messages)
+            self.dropped += 1
+            self._unspool(item)
+            return False
+        return True
+
+    def start(self):
+        """
+        Start the worker thread.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._work, name="notify-queue")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Stop the worker thread after the message it is sending. Spooled messages are kept.
+
+        :param float timeout: maximum seconds to wait for the worker thread to end
+        """
+        self._stop.set()
+        if self._thread is not None:
+            try:
+                # wake up the worker
+                self._queue.put_nowait(None)
+            except Queue.Full:
+                pass
+            self._thread.join(timeout)
+
+    def drain(self, timeout=None):
+        """
+        Wait until all queued messages were handled.
+
+        :param float timeout: maximum seconds to wait, see retry_time()
+        :return: True if the queue is empty
+        :rtype: bool
+        """
+        done = threading.Event()
+
+        def wait():
+            self._queue.join()
+            done.set()
+
+        waiter = threading.Thread(target=wait, name="notify-queue-drain")
+        # left waiting after a timeout, must not keep the process alive
+        waiter.daemon = True
+        waiter.start()
+        return done.wait(timeout)
+
+    def retry_time(self, send_timeout):
+        """
+        :param float send_timeout: maximum seconds an attempt to send takes
+        :return: maximum seconds until a message is sent or given up, with all retries and the backoff before them
+        :rtype: float
+        """
+        return send_timeout * (self.retries + 1) + sum(self._delay(attempt) for attempt in range(1, self.retries + 1))
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=1)
+            except Queue.Empty:
+                continue
+            if item is None:
+                self._queue.task_done()
+                continue
+            try:
+                self._send(item)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, item):
+        while not self._stop.is_set():
+            failed = list()
+            error = None
+            # destinations with the same pending messages are sent to in one batch
+            batches = dict()
+            for destination, messages in item["pending"]:
+                batches.setdefault(tuple(messages), list()).append(destination)
+            for messages, destinations in batches.items():
+                for destination, results in self.send_batch(destinations, list(messages)).items():
+                    left = [message for message, result in zip(messages, results) if result is not True]
+                    self.sent += len(messages) - len(left)
+                    if left:
+                        failed.append([destination, left])
+                        error = [result for result in results if result is not True][0]
+            if not failed:
+                self._unspool(item)
+                return
+            item["pending"] = failed
+            item["attempts"] += 1
+            destinations = "', '".join(destination for destination, _ in failed)
+            if item["attempts"] > self.retries:
+                logger.error("Giving up sending message(s) to '%s' after %d attempts: %s", destinations,
+                             item["attempts"], error)
+                self.failed += sum(len(messages) for _, messages in failed)
+                self._unspool(item)
+                return
+            delay = self._delay(item["attempts"])
+            logger.warn("Sending message(s) to '%s' failed (%s), retrying in %g seconds.", destinations, error, delay)
+            if self.spool_dir:
+                self._spool(item)
+            self._stop.wait(delay)
+
+    def _delay(self, attempts):
+        # seconds to wait before the retry after attempts failed attempts
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+
+    def _spool(self, item):
+        if not item["file"]:
+            item["file"] = os.path.join(self.spool_dir, "%.6f-%06d.msg" % (time.time(), next(self._seq)))
+        data = dict((k, v) for k, v in item.items() if k != "file")
+        try:
+            tmp = item["file"] + ".tmp"
+            with open(tmp, "wb") as spool_file:
+                json.dump(data, spool_file)
+            os.rename(tmp, item["file"])
+        except (IOError, OSError), e:
+            logger.error("Could not write message to spool directory: %s", e)
+
+    def _unspool(self, item):
+        if item["file"]:
+            try:
+                os.remove(item["file"])
+            except OSError, e:
+                logger.error("Could not remove '%s' from spool directory: %s", item["file"], e)
+            item["file"] = None
+
+    def _load_spool(self):
+        for filename in sorted(os.listdir(self.spool_dir)):
+            if not filename.endswith(".msg"):
+                continue
+            path = os.path.join(self.spool_dir, filename)
+            try:
+                with open(path, "rb") as spool_file:
+                    item = json.load(spool_file)
+                item["file"] = path
+                self._queue.put_nowait(item)
+                logger.info("Loaded unsent message(s) to '%s' from spool.",
+                            "', '".join(destination for destination, _ in item["pending"]))
+            except Queue.Full:
+                logger.error("Notification queue full, not loading more messages from spool.")
+                break
+            except (IOError, OSError, ValueError, KeyError), e:
+                logger.error("Could not read '%s' from spool directory: %s", path, e)
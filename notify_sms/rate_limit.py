@@ -0,0 +1,261 @@
+# encoding: utf-8
+"""
+rate_limit -- limits the number of messages sent per time window
+
+Every window keeps the messages sent in it in a deque ordered by monotonic time, so
+checking the budget only has to drop entries from the left end and is O(1) amortized,
+and jumps of the wall clock do not matter. A limiter combines several windows (e.g. per
+minute, hour and day), an optional token bucket that allows short bursts, and budgets of
+single recipients or services. Its state can be written to a file, so that restarting
+the daemon does not reset the budget.
+"""
+
+import os
+import json
+import time
+import collections
+import logging
+
+from common.clock import monotonic
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+
+class SlidingWindow(object):
+
+    """
+    Number of messages sent in the last seconds.
+    """
+
+    __slots__ = ("limit", "seconds", "clock", "count", "_entries")
+
+    def __init__(self, limit, seconds, clock=monotonic):
+        """
+        :param integer limit: maximum number of messages in the window
+        :param float seconds: length of the window
+        :param clock: function returning the current monotonic time in seconds
+        """
+        self.limit = max(0, limit)
+        self.seconds = seconds
+        self.clock = clock
+        self.count = 0
+        self._entries = collections.deque()  # [time, count], oldest first
+
+    def remaining(self):
+        """
+        :return: number of messages that can still be sent
+        :rtype: integer
+        """
+        self._expire(self.clock())
+        return max(0, self.limit - self.count)
+
+    def add(self, count):
+        """
+        :param integer count: number of messages sent now
+        """
+        if count <= 0:
+            return
+        now = self.clock()
+        self._expire(now)
+        self.count += count
+        if self._entries and self._entries[-1][0] == now:
+            self._entries[-1][1] += count
+        else:
+            self._entries.append([now, count])
+
+    def dump(self):
+        """
+        :return: [[age in seconds, count], ...], oldest first
+        :rtype: list
+        """
+        now = self.clock()
+        self._expire(now)
+        return [[now - ts, count] for ts, count in self._entries]
+
+    def load(self, entries, offset=0.0):
+        """
+        Add messages from dump().
+
+        :param list entries: [[age in seconds, count], ...], oldest first
+        :param float offset: seconds to add to each age
+        """
+        now = self.clock()
+        for age, count in entries:
+            if age + offset < self.seconds and count > 0:
+                self._entries.append([now - age - offset, count])
+                self.count += count
+        self._expire(now)
+
+    def _expire(self, now):
+        entries = self._entries
+        while entries and now - entries[0][0] >= self.seconds:
+            self.count -= entries.popleft()[1]
+
+
+class TokenBucket(object):
+
+    """
+    Allows bursts of messages, refilled at a constant rate.
+    """
+
+    __slots__ = ("rate", "burst", "clock", "tokens", "_last")
+
+    def __init__(self, rate, burst, clock=monotonic):
+        """
+        :param float rate: tokens added per second
+        :param integer burst: maximum number of tokens
+        :param clock: function returning the current monotonic time in seconds
+        """
+        self.rate = rate
+        self.burst = max(0, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self._last = clock()
+
+    def remaining(self):
+        """
+        :return: number of messages that can be sent now
+        :rtype: integer
+        """
+        self._refill()
+        return int(self.tokens)
+
+    def add(self, count):
+        """
+        :param integer count: number of messages sent now
+        """
+        self._refill()
+        self.tokens = max(0.0, self.tokens - max(0, count))
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(float(self.burst), self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+class RateLimiter(object):
+
+    """
+    Limits the number of messages sent in several time windows, overall and for single recipients or services.
+    """
+
+    def __init__(self, limits, burst=0, state_file=None, clock=monotonic):
+        """
+        :param dict limits: {window in seconds: maximum number of messages}, limits of 0 are ignored
+        :param integer burst: send at most this many messages at once, refilled at the smallest rate of
+               limits, 0 to disable
+        :param str state_file: file to keep the sent messages in, None to keep them only in memory
+        :param clock: function returning the current monotonic time in seconds
+        """
+        self.clock = clock
+        self.state_file = state_file
+        self.windows = [SlidingWindow(limit, seconds, clock) for seconds, limit in sorted(limits.items()) if limit]
+        self.bucket = None
+        if burst and self.windows:
+            self.bucket = TokenBucket(min(w.limit / float(w.seconds) for w in self.windows), burst, clock)
+        self.budgets = dict()  # key: SlidingWindow
+        self._saved = dict()  # key: entries read from state_file, for budgets not set yet
+        if self.state_file:
+            self._load()
+
+    def set_limit(self, key, limit, seconds=HOUR):
+        """
+        Set the budget of a single recipient or service. If it has a budget already, the
+        messages sent in its window still count.
+
+        :param str key: e.g. phone number or service name
+        :param integer limit: maximum number of messages in the window, 0 for no limit
+        :param float seconds: length of the window
+        """
+        if not limit:
+            self.budgets.pop(key, None)
+            return
+        window = self.budgets.get(key)
+        if window is not None and window.seconds == seconds:
+            window.limit = max(0, limit)
+            return
+        window = SlidingWindow(limit, seconds, self.clock)
+        saved = self._saved.pop(key, None)
+        if saved:
+            window.load(*saved)
+        self.budgets[key] = window
+
+    def remaining(self, key=None):
+        """
+        :param str key: budget to look at, None for the overall limits
+        :return: number of messages that can still be sent, None if there is no limit
+        :rtype: integer
+        """
+        if key is not None:
+            window = self.budgets.get(key)
+            return None if window is None else window.remaining()
+        counts = [w.remaining() for w in self.windows]
+        if self.bucket:
+            counts.append(self.bucket.remaining())
+        return min(counts) if counts else None
+
+    def can_send(self, key=None):
+        """
+        :param str key: budget to look at, None for the overall limits
+        :return: True if at least one message can be sent
+        :rtype: bool
+        """
+        return self.remaining(key) != 0
+
+    def update(self, count, keys=()):
+        """
+        Count sent messages and write the state file.
+
+        :param integer count: number of messages sent now
+        :param keys: budgets to charge in addition to the overall limits
+        """
+        for window in self.windows:
+            window.add(count)
+        if self.bucket:
+            self.bucket.add(count)
+        for key in keys:
+            if key in self.budgets:
+                self.budgets[key].add(count)
+        if self.state_file:
+            self._save()
+
+    def _save(self):
+        state = {"time": time.time(), "windows": dict((str(w.seconds), w.dump()) for w in self.windows),
+                 "budgets": dict((key, w.dump()) for key, w in self.budgets.items())}
+        if self.bucket:
+            state["tokens"] = self.bucket.remaining()
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "wb") as state_file:
+                json.dump(state, state_file)
+            os.rename(tmp, self.state_file)
+        except (IOError, OSError), e:
+            logger.error("Could not write rate limit state to '%s': %s", self.state_file, e)
+
+    def _load(self):
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "rb") as state_file:
+                state = json.load(state_file)
+            # time that passed while not running, the monotonic clock does not survive a reboot
+            offset = max(0.0, time.time() - state["time"])
+            for window in self.windows:
+                window.load(state["windows"].get(str(window.seconds), []), offset)
+            for key, entries in state["budgets"].items():
+                self._saved[key] = (entries, offset)
+            if self.bucket and "tokens" in state:
+                self.bucket.tokens = min(float(self.bucket.burst), state["tokens"] + offset * self.bucket.rate)
+        except (IOError, OSError, ValueError, KeyError, TypeError), e:
+            logger.error("Could not read rate limit state from '%s': %s", self.state_file, e)
@@ -2,6 +2,7 @@
 """
 Base class for SMS sending function.
 """
+from multiprocessing.pool import ThreadPool
 
 __author__ = "Daniel Tröder"
 __copyright__ = "2015, Daniel Tröder"
@@ -26,6 +27,15 @@ class SendSMS(object):
         self.username = username
         self.password = password
 
+    def identify(self):
+        """
+        Check that the connection to the provider works, does nothing if the provider has nothing
+        suitable. Used to keep a long lived connection alive.
+
+        :raises Exception: if there was an error connecting (wrong username/password)
+        """
+        pass
+
     def send(self, destination, message):
         """
         This function can be called multiple times.
@@ -37,3 +47,36 @@ class SendSMS(object):
         :raises Exception: if there was an error sending the message (wrong phone number)
         """
         raise NotImplementedError
+
+    def send_batch(self, destinations, messages, max_parallel=5):
+        """
+        Send all messages to all destinations. Destinations are handled in parallel, the messages
+        to one destination are sent one after the other, in order. Raises no exception.
+
+        send() must be thread safe for this.
+
+        :param list destinations: phone numbers (RFC3824), starting with country code (e.g. 4917712345678)
+        :param list messages: the messages, max 160 characters each
+        :param integer max_parallel: maximum number of messages being sent at the same time
+        :return: {destination: [True or exception, ...]}, one entry for each message
+        :rtype: dict
+        """
+        def send_all(destination):
+            results = list()
+            for message in messages:
+                try:
+                    self.send(destination, message)
+                    results.append(True)
+                except Exception, e:
+                    results.append(e)
+            return results
+
+        destinations = list(destinations)
+        if not destinations:
+            return dict()
+        pool = ThreadPool(max(1, min(max_parallel, len(destinations))))
+        try:
+            return dict(zip(destinations, pool.map(send_all, destinations)))
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,159 @@
+# encoding: utf-8
+"""
+sms_session -- long lived connection to the SMS provider
+
+The SendSMS object is created when it is first needed and then kept, so that sending a
+message does not have to log in and open a new HTTPS connection first. A background
+thread calls identify() from time to time to keep the connection alive and to find
+problems before a message has to be sent. If sending fails because of the connection,
+a new SendSMS object is created (logging in again) and sending is retried once.
+"""
+
+import httplib
+import socket
+import threading
+import xmlrpclib
+import logging
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+logger = logging.getLogger()
+
+# errors after which a new connection is tried, other errors (e.g. xmlrpclib.Fault) are not retried
+CONNECTION_ERRORS = (socket.error, httplib.HTTPException, xmlrpclib.ProtocolError)
+
+
+class SMSSession(object):
+
+    """
+    Long lived connection to the SMS provider.
+    """
+
+    def __init__(self, factory, probe_interval=600, max_parallel=5):
+        """
+        :param factory: function returning a new, logged in SendSMS object
+        :param float probe_interval: seconds between calls to identify() by the health probe, 0 to disable
+        :param integer max_parallel: maximum number of messages being sent at the same time by send_batch()
+        """
+        self.factory = factory
+        self.probe_interval = probe_interval
+        self.max_parallel = max_parallel
+        self._client = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._probe_thread = None
+
+    def client(self):
+        """
+        :return: the SendSMS object, created if necessary
+        :rtype: SendSMS
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = self.factory()
+            return self._client
+
+    def send(self, destination, message):
+        """
+        Send a message, log in again and retry once if the connection failed.
+
+        :param str destination: phone number (RFC3824), starting with country code (e.g. 4917712345678)
+        :param str message: the message, max 160 characters
+        :raises Exception: if there was an error sending the message
+        """
+        client = self.client()
+        try:
+            return client.send(destination, message)
+        except CONNECTION_ERRORS, e:
+            logger.warn("Sending SMS failed (%s), connecting again.", e)
+            self._drop(client)
+        return self.client().send(destination, message)
+
+    def send_batch(self, destinations, messages):
+        """
+        Send all messages to all destinations in parallel, log in again and retry the failed messages
+        once if the connection failed. Raises no exception.
+
+        :param list destinations: phone numbers (RFC3824), starting with country code (e.g. 4917712345678)
+        :param list messages: the messages, max 160 characters each
+        :return: {destination: [True or exception, ...]}, one entry for each message
+        :rtype: dict
+        """
+        try:
+            client = self.client()
+        except Exception, e:
+            return dict((destination, [e] * len(messages)) for destination in destinations)
+        results = client.send_batch(destinations, messages, self.max_parallel)
+        retry = [destination for destination, res in results.items() if
+                 any(isinstance(x, CONNECTION_ERRORS) for x in res)]
+        if not retry:
+            return results
+        logger.warn("Sending SMS to %s failed, connecting again.", ", ".join(retry))
+        self._drop(client)
+        for destination in retry:
+            failed = [num for num, res in enumerate(results[destination]) if isinstance(res, CONNECTION_ERRORS)]
+            res = self._send_batch_once([destination], [messages[num] for num in failed])[destination]
+            for num, result in zip(failed, res):
+                results[destination][num] = result
+        return results
+
+    def _send_batch_once(self, destinations, messages):
+        try:
+            return self.client().send_batch(destinations, messages, self.max_parallel)
+        except Exception, e:
+            return dict((destination, [e] * len(messages)) for destination in destinations)
+
+    def probe(self):
+        """
+        Check the connection by calling identify(), create a new one if it failed. Raises no exception.
+
+        :return: True if the connection works
+        :rtype: bool
+        """
+        client = None
+        try:
+            with self._lock:
+                if self._client is None:
+                    self.client()
+                    return True
+                client = self._client
+            client.identify()
+            return True
+        except Exception, e:
+            logger.error("Connection to SMS provider failed: %s", e)
+            self._drop(client)
+            return False
+
+    def start_health_probe(self):
+        """
+        Log in now and then call probe() every probe_interval seconds in a background thread.
+        """
+        if self._probe_thread is not None:
+            return
+        self._probe_thread = threading.Thread(target=self._probe_loop, name="sms-health-probe")
+        self._probe_thread.daemon = True
+        self._probe_thread.start()
+
+    def close(self):
+        """
+        Stop the health probe and forget the connection.
+        """
+        self._stop.set()
+        with self._lock:
+            self._client = None
+
+    def _drop(self, client):
+        # forget the client, unless another thread already replaced it
+        with self._lock:
+            if client is None or self._client is client:
+                self._client = None
+
+    def _probe_loop(self):
+        self.probe()
+        while self.probe_interval and not self._stop.wait(self.probe_interval):
+            self.probe()
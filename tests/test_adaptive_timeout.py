@@ -0,0 +1,56 @@
+# encoding: utf-8
+"""
+tests.test_adaptive_timeout -- connect timeouts from the recent connect times of a service
+"""
+
+import unittest
+
+from check_service.adaptive_timeout import AdaptiveTimeout
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class AdaptiveTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timeouts = AdaptiveTimeout(floor=3.0, ceiling=10.0, k=4.0)
+
+    def test_unknown(self):
+        self.assertEqual(self.timeouts.get("db1:5432"), 10.0)
+        self.timeouts.update("db1:5432", None)
+        self.assertEqual(self.timeouts.get("db1:5432"), 10.0)
+
+    def test_floor(self):
+        # a service on the LAN keeps enough time for a lost SYN to be sent again
+        for _ in range(20):
+            self.timeouts.update("db1:5432", 0.001)
+        self.assertEqual(self.timeouts.get("db1:5432"), 3.0)
+
+    def test_far_away(self):
+        for latency in (2.0, 2.4, 1.8, 2.2):
+            self.timeouts.update("db1:5432", latency)
+        self.assertTrue(3.0 < self.timeouts.get("db1:5432") < 10.0)
+
+    def test_backoff(self):
+        for _ in range(20):
+            self.timeouts.update("db1:5432", 0.001)
+        self.timeouts.update("db1:5432", None)
+        self.assertEqual(self.timeouts.get("db1:5432"), 6.0)
+        self.timeouts.update("db1:5432", None)
+        self.assertEqual(self.timeouts.get("db1:5432"), 10.0)
+        self.timeouts.update("db1:5432", 0.001)
+        self.assertEqual(self.timeouts.get("db1:5432"), 3.0)
+
+    def test_remove(self):
+        self.timeouts.update("db1:5432", 0.001)
+        self.timeouts.remove("db1:5432")
+        self.assertEqual(self.timeouts.get("db1:5432"), 10.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# encoding: utf-8
+"""
+tests.test_cluster -- nodes of a cluster on localhost sharing checks and agreeing on outages
+"""
+
+import json
+import time
+import socket
+import unittest
+
+from cluster.hash_ring import HashRing
+from cluster.node import ClusterNode
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+def free_ports(num):
+    socks = list()
+    for _ in range(num):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        socks.append(sock)
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def wait_for(condition, timeout=2.0):
+    # condition is called until it is true, only once after that (pop_updated() has side effects)
+    end = time.time() + timeout
+    while True:
+        if condition():
+            return True
+        if time.time() > end:
+            return False
+        time.sleep(0.01)
+
+
+class HashRingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = ["a:1", "b:1", "c:1", "d:1"]
+        self.ring = HashRing(self.nodes)
+        self.keys = ["service%d:80" % i for i in range(1000)]
+
+    def test_owners(self):
+        for key in self.keys[:100]:
+            owners = self.ring.owners(key, 3)
+            self.assertEqual(len(set(owners)), 3)
+            self.assertEqual(owners, HashRing(list(reversed(self.nodes))).owners(key, 3))
+
+    def test_spread(self):
+        counts = dict((node, 0) for node in self.nodes)
+        for key in self.keys:
+            counts[self.ring.owners(key)[0]] += 1
+        self.assertTrue(all(150 < count < 350 for count in counts.values()), counts)
+
+    def test_dead_node(self):
+        # only the keys of the dead node move
+        alive = set(self.nodes) - set(["a:1"])
+        for key in self.keys:
+            owner = self.ring.owners(key)[0]
+            if owner != "a:1":
+                self.assertEqual(self.ring.owners(key, 1, alive), [owner])
+            else:
+                self.assertIn(self.ring.owners(key, 1, alive)[0], alive)
+
+    def test_empty(self):
+        self.assertEqual(HashRing([]).owners("db1:5432"), [])
+
+
+class ClusterNodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.names = sorted("127.0.0.1:%d" % port for port in free_ports(3))
+        self.nodes = list()
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.stop()
+
+    def start(self, quorum=0):
+        for name in self.names:
+            node = ClusterNode(name, self.names, replicas=3, quorum=quorum, timeout=10.0, heartbeat=60.0,
+                               clock=lambda: self.now)
+            node.start()
+            self.nodes.append(node)
+        return self.nodes
+
+    def test_quorum(self):
+        a, b, c = self.start()
+        a.vote({"db1:5432": False})
+        self.assertTrue(wait_for(lambda: "db1:5432" in b.pop_updated()))
+        # one of three owners is not a majority
+        self.assertIsNone(b.verdict("db1:5432"))
+        c.vote({"db1:5432": False})
+        self.assertTrue(wait_for(lambda: b.verdict("db1:5432") is False))
+        self.assertTrue(wait_for(lambda: a.verdict("db1:5432") is False))
+
+    def test_up(self):
+        a, b, c = self.start()
+        a.vote({"db1:5432": True})
+        c.vote({"db1:5432": True})
+        self.assertTrue(wait_for(lambda: b.verdict("db1:5432") is True))
+
+    def test_spoofed(self):
+        a, b, c = self.start()
+        # datagrams claiming to be a and c, but not from their addresses
+        spoofer = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for name in (a.name, c.name):
+            spoofer.sendto(json.dumps({"node": name, "votes": {"db1:5432": 0}}),
+                           ("127.0.0.1", int(b.name.rpartition(":")[2])))
+        spoofer.close()
+        # a real vote sent afterwards, the spoofed ones were handled when it arrives
+        a.vote({"db2:5432": True})
+        self.assertTrue(wait_for(lambda: "db2:5432" in b.pop_updated()))
+        self.assertIsNone(b.verdict("db1:5432"))
+
+    def test_leader(self):
+        a, b, c = self.start()
+        self.assertTrue(a.is_leader())
+        self.assertFalse(b.is_leader())
+        # a does not hear of the others anymore: it is in the minority and must not lead
+        self.now += 11
+        self.assertEqual(a.alive(), frozenset([a.name]))
+        self.assertFalse(a.is_leader())
+
+    def test_dead_node_votes(self):
+        a, b, c = self.start(quorum=1)
+        a.vote({"db1:5432": False})
+        self.assertTrue(wait_for(lambda: b.verdict("db1:5432") is False))
+        a.stop()
+        c.stop()
+        self.now += 11
+        # a is dead, its vote does not count anymore
+        self.assertTrue(b.membership_changed())
+        self.assertEqual(b.owners("db1:5432"), [b.name])
+        self.assertIsNone(b.verdict("db1:5432"))
+        self.assertTrue(b.is_mine("db1:5432"))
+
+
+if __name__ == "__main__":
+    unittest.main()
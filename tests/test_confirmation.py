@@ -0,0 +1,54 @@
+# encoding: utf-8
+"""
+tests.test_confirmation -- confirming failed checks by re-checks
+"""
+
+import unittest
+
+from check_service.confirmation import Confirmation
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class ConfirmationTest(unittest.TestCase):
+
+    def test_single_probe(self):
+        confirmation = Confirmation([2, 5, 15], 1)
+        self.assertEqual(confirmation.update("db1:5432", True), (True, None))
+        self.assertEqual(confirmation.update("db1:5432", False), (False, None))
+
+    def test_confirmed(self):
+        confirmation = Confirmation([2, 5, 15], 2)
+        self.assertEqual(confirmation.update("db1:5432", False), (None, 2))
+        self.assertEqual(confirmation.update("db1:5432", True), (None, 5))
+        self.assertEqual(confirmation.update("db1:5432", False), (False, None))
+        self.assertNotIn("db1:5432", confirmation.pending)
+
+    def test_cleared(self):
+        # a single lost packet does not make a service down
+        confirmation = Confirmation([2, 5, 15], 3)
+        self.assertEqual(confirmation.update("db1:5432", False), (None, 2))
+        self.assertEqual(confirmation.update("db1:5432", True), (None, 5))
+        self.assertEqual(confirmation.update("db1:5432", True), (True, None))
+        self.assertEqual(confirmation.update("db1:5432", False), (None, 2))
+
+    def test_failures_needed_limited(self):
+        confirmation = Confirmation([2], 5)
+        self.assertEqual(confirmation.failures_needed, 2)
+        self.assertEqual(confirmation.update("db1:5432", False), (None, 2))
+        self.assertEqual(confirmation.update("db1:5432", False), (False, None))
+
+    def test_forget(self):
+        confirmation = Confirmation([2, 5], 2)
+        confirmation.update("db1:5432", False)
+        confirmation.forget("db1:5432")
+        self.assertEqual(confirmation.update("db1:5432", True), (True, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
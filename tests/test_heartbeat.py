@@ -0,0 +1,62 @@
+# encoding: utf-8
+"""
+tests.test_heartbeat -- reports of passive services over UDP and HTTP
+"""
+
+import time
+import socket
+import urllib2
+import unittest
+
+from check_service.heartbeat import HeartbeatStore, HeartbeatReceiver
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class HeartbeatReceiverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = HeartbeatStore()
+        self.store.expect({"backup1": 60, "backup2": 60})
+        self.receiver = HeartbeatReceiver(self.store, "127.0.0.1", 0)
+        self.receiver.start()
+        self.url = "http://127.0.0.1:%d/" % self.receiver.port
+
+    def tearDown(self):
+        self.receiver.stop()
+
+    def post(self, data):
+        return urllib2.urlopen(urllib2.Request(self.url, data), timeout=2).read()
+
+    def test_http(self):
+        self.assertEqual(self.post("backup1 fail disk full\nbogus\n"), "accepted 1, rejected 1\n")
+        self.assertEqual(self.store.status("backup1").error, "disk full")
+        self.assertEqual(self.store.pop_changed(), set(["backup1"]))
+
+    def test_udp(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto("backup2 down", ("127.0.0.1", self.receiver.port))
+        sock.close()
+        end = time.time() + 2
+        while self.store.status("backup2") and time.time() < end:
+            time.sleep(0.01)
+        self.assertFalse(self.store.status("backup2"))
+
+    def test_idle_client(self):
+        # a client that connects but sends nothing must not block the reports of others
+        idle = socket.create_connection(("127.0.0.1", self.receiver.port))
+        try:
+            idle.sendall("POST / HTTP/1.0\r\n")
+            self.assertEqual(self.post("backup1 ok\nbackup2 fail"), "accepted 2, rejected 0\n")
+            self.assertFalse(self.store.status("backup2"))
+        finally:
+            idle.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# encoding: utf-8
+"""
+tests.test_history -- recording check results and querying outages
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from history.store import HistoryWriter, HistoryReader, list_segments, segment_name, DAY, RECORD
+from history.query import summarize, parse_time
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+# 2015-01-06 00:00:00 UTC
+START = 16441 * DAY
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="sms_notify_test_")
+        self.now = START
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def writer(self, keep_days=0):
+        return HistoryWriter(self.directory, keep_days, clock=lambda: self.now)
+
+    def test_records(self):
+        writer = self.writer()
+        writer.record("db1:5432", True, 0.0123)
+        writer.record("www1:80", False)
+        writer.close()
+        self.assertEqual(list(HistoryReader(self.directory).records()),
+                         [(START, "db1:5432", True, 0.012), (START, "www1:80", False, None)])
+        # IDs survive a restart
+        writer = self.writer()
+        writer.record("www1:80", True, 0.001, START + 60)
+        writer.close()
+        self.assertEqual(list(HistoryReader(self.directory).records(["www1:80"], since=START + 1)),
+                         [(START + 60, "www1:80", True, 0.001)])
+
+    def test_segments(self):
+        writer = self.writer(keep_days=2)
+        for day in range(4):
+            writer.record("db1:5432", True, timestamp=START + day * DAY)
+            writer.flush()
+        writer.close()
+        # segments older than keep_days are deleted when a new day starts
+        self.assertEqual(list_segments(self.directory),
+                         [segment_name(START // DAY + 2), segment_name(START // DAY + 3)])
+        self.assertEqual([x[0] for x in HistoryReader(self.directory).records()], [START + 2 * DAY, START + 3 * DAY])
+
+    def test_partial_record(self):
+        writer = self.writer()
+        writer.record("db1:5432", True)
+        writer.close()
+        path = os.path.join(self.directory, segment_name(START // DAY))
+        with open(path, "ab") as segment:
+            segment.write("\0" * 5)
+        self.assertEqual(len(list(HistoryReader(self.directory).records())), 1)
+        # cut off before the next record is appended
+        writer = self.writer()
+        writer.record("db1:5432", False, timestamp=START + 60)
+        writer.close()
+        self.assertEqual(os.path.getsize(path), 2 * RECORD.size)
+        self.assertEqual([x[2] for x in HistoryReader(self.directory).records()], [True, False])
+
+    def test_outages(self):
+        writer = self.writer()
+        for minute, success in enumerate([True, False, False, True, True, False]):
+            writer.record("db1:5432", success, timestamp=START + minute * 60)
+        writer.close()
+        history = summarize(HistoryReader(self.directory).records())["db1:5432"]
+        self.assertEqual(history.probes, 6)
+        self.assertEqual(history.failures, 3)
+        self.assertEqual(history.all_outages(), [(START + 60, START + 180), (START + 300, None)])
+        self.assertEqual(history.downtime(), 120)
+        self.assertAlmostEqual(history.uptime(), 100.0 * (1 - 120 / 300.0))
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("7d", START + 7 * DAY), START)
+        self.assertEqual(parse_time("2015-01-06", 0), START)
+        self.assertEqual(parse_time("2015-01-06T12:00", 0), START + DAY / 2)
+        self.assertRaises(ValueError, parse_time, "yesterday", 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
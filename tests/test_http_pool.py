@@ -0,0 +1,138 @@
+# encoding: utf-8
+"""
+tests.test_http_pool -- reusing connections of HTTP checks
+"""
+
+import time
+import socket
+import httplib
+import threading
+import unittest
+
+from check_service.http_pool import HTTPPool
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+RESPONSE = "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nOK"
+
+
+class TestServer(object):
+
+    """
+    Answers at most answers requests on each connection after delay seconds, later requests
+    on the same connection are never answered, like a connection dropped by a NAT on the way.
+    Closes each connection after its first response if close is set.
+    """
+
+    def __init__(self, answers=None, delay=0, close=False):
+        self.answers = answers
+        self.delay = delay
+        self.close_after_response = close
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self._clients = list()
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.sock.close()
+        for client in self._clients:
+            client.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            self._clients.append(client)
+            thread = threading.Thread(target=self._serve, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, client):
+        data = ""
+        answered = 0
+        try:
+            while True:
+                while "\r\n\r\n" not in data:
+                    chunk = client.recv(4096)
+                    if not chunk:
+                        return
+                    data += chunk
+                data = data.partition("\r\n\r\n")[2]
+                if self.answers is not None and answered >= self.answers:
+                    continue
+                time.sleep(self.delay)
+                client.sendall(RESPONSE)
+                answered += 1
+                if self.close_after_response:
+                    client.close()
+                    return
+        except socket.error:
+            pass
+
+
+class HTTPPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = None
+        self.pool = HTTPPool(max_per_host=2, idle_timeout=60)
+
+    def tearDown(self):
+        self.pool.close_idle()
+        self.server.close()
+
+    def request(self, timeout=1.0):
+        return self.pool.request("server", lambda: httplib.HTTPConnection("127.0.0.1", self.server.port, timeout=10),
+                                 "/", {}, timeout, 1024)
+
+    def test_reuse(self):
+        self.server = TestServer()
+        for _ in range(3):
+            self.assertEqual(self.request(), (200, "OK"))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_closed_connection(self):
+        # the server closed the pooled connection: the request is sent on a new one
+        self.server = TestServer(close=True)
+        self.assertEqual(self.request(), (200, "OK"))
+        time.sleep(0.05)
+        self.assertEqual(self.request(), (200, "OK"))
+        self.assertEqual(self.server.connections, 2)
+
+    def test_dropped_connection(self):
+        # the pooled connection looks alive, but is not answered anymore: the request gets the whole timeout
+        self.server = TestServer(answers=1)
+        self.assertEqual(self.request(), (200, "OK"))
+        start = time.time()
+        self.assertRaises(socket.timeout, self.request, 0.3)
+        self.assertGreaterEqual(time.time() - start, 0.29)
+        # the connection is not used again
+        self.assertEqual(self.request(), (200, "OK"))
+        self.assertEqual(self.server.connections, 2)
+
+    def test_wait_for_connection(self):
+        # waiting for a free connection counts against the timeout
+        self.server = TestServer(delay=0.3)
+        self.pool.configure(1, 60)
+        other = threading.Thread(target=self.request)
+        other.start()
+        time.sleep(0.05)
+        start = time.time()
+        self.assertRaises(socket.timeout, self.request, 0.4)
+        self.assertLess(time.time() - start, 0.45)
+        other.join()
+
+if __name__ == "__main__":
+    unittest.main()
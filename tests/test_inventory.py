@@ -0,0 +1,37 @@
+# encoding: utf-8
+"""
+tests.test_inventory -- reading and validating services
+"""
+
+import unittest
+
+from check_service.inventory import Inventory, InventoryError
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class InventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.inventory = Inventory({"depends": list(), "interval": 1, "latency_threshold": 0.0, "msg_limit": 0,
+                                    "priority": 0, "timeout": 0.0})
+
+    def test_cert_min_days_without_verify(self):
+        self.inventory.add("tls://mail.example.com:993", options={"tls_verify": "false", "cert_min_days": "10"})
+        with self.assertRaises(InventoryError) as context:
+            self.inventory.services()
+        self.assertEqual(context.exception.errors, ["tls://mail.example.com:993: cert_min_days needs tls_verify"])
+
+    def test_tls_options(self):
+        self.inventory.add("tls://mail.example.com:993", options={"tls_verify": "false"})
+        self.inventory.add("tls://www.example.com:443", options={"cert_min_days": "10"})
+        self.assertEqual(len(self.inventory.services()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
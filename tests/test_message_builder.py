@@ -0,0 +1,77 @@
+# encoding: utf-8
+"""
+tests.test_message_builder -- packing failed services into text messages
+"""
+
+import unittest
+from argparse import Namespace
+
+import main
+from check_service.inventory import Inventory
+from notify_sms.message_builder import compact_services
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class FakeQueue(object):
+
+    def __init__(self):
+        self.messages = list()
+
+    def put(self, recipients, messages):
+        self.messages.extend(messages)
+
+
+class CompactServicesTest(unittest.TestCase):
+
+    def test_ports(self):
+        self.assertEqual(compact_services([("db1", 5432, "TCP"), ("db1", 5433, "TCP"), ("db1", 8080, "TCP"),
+                                           ("2001:db8::1", 22, "TCP")]),
+                         ["db1:5432-5433,8080", "[2001:db8::1]:22"])
+
+    def test_paths(self):
+        # pages on the same server are separate services
+        self.assertEqual(compact_services([("www1", 80, "HTTP", "/a"), ("www1", 80, "HTTP", "/b"),
+                                           ("www1", 8080, "HTTP", "/a"), ("www1", 80, "HTTP", "/")]),
+                         ["www1:80,8080/a(HTTP)", "www1:80/b(HTTP)", "www1:80(HTTP)"])
+
+    def test_passive(self):
+        self.assertEqual(compact_services([("nightly.backup1", 0, "PUSH", "")]), ["nightly.backup1(PUSH)"])
+
+
+class NotifyTest(unittest.TestCase):
+
+    def test_priority_by_service(self):
+        inventory = Inventory({"depends": list(), "interval": 1, "latency_threshold": 0.0, "msg_limit": 0,
+                               "priority": 0, "timeout": 0.0})
+        inventory.add("http://www1/a")
+        inventory.add("http://www1/b", options={"priority": "10"})
+        services = inventory.services()
+        queue = FakeQueue()
+        args = Namespace(test=False, recipients=["4917712345678"])
+        main.notify([(False, "http://www1/a"), (False, "http://www1/b")], services, args, queue)
+        self.assertEqual(queue.messages, ["Service(s) failed: www1:80/b(HTTP) www1:80/a(HTTP)"])
+
+    def test_not_run(self):
+        inventory = Inventory({"depends": list(), "interval": 1, "latency_threshold": 0.0, "msg_limit": 0,
+                               "priority": 0, "timeout": 0.0})
+        for spec in ("db1:5432", "db2:5432", "db3:5432"):
+            inventory.add(spec)
+        services = inventory.services()
+        args = Namespace(test=False, recipients=["4917712345678"])
+        # services without a result yet (not due so far) are not "not run"
+        queue = FakeQueue()
+        main.notify([(False, "db1:5432")], services, args, queue)
+        self.assertEqual(queue.messages, ["Service(s) failed: db1:5432"])
+        queue = FakeQueue()
+        main.notify([(False, "db1:5432")], services, args, queue, not_run=2)
+        self.assertEqual(queue.messages, ["Service(s) failed: db1:5432 (2 checks not run)"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+# encoding: utf-8
+"""
+tests.test_metrics -- serving the metrics over HTTP
+"""
+
+import socket
+import urllib2
+import unittest
+
+from instrumentation.metrics import Registry, MetricsServer
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class MetricsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.counter("test_checks_total", "Checks run.", ["service"]).labels("db1:5432").inc()
+        self.server = MetricsServer(self.registry, "127.0.0.1", 0)
+        self.server.start()
+        self.url = "http://127.0.0.1:%d/metrics" % self.server.port
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, url):
+        return urllib2.urlopen(url, timeout=2).read()
+
+    def test_metrics(self):
+        self.assertIn('test_checks_total{service="db1:5432"} 1\n', self.get(self.url))
+        self.assertRaises(urllib2.HTTPError, self.get, self.url.replace("/metrics", "/other"))
+
+    def test_idle_client(self):
+        # a client that connects but sends nothing must not block the scrapes of others
+        idle = socket.create_connection(("127.0.0.1", self.server.port))
+        try:
+            idle.sendall("GET /metrics HTTP/1.0\r\n")
+            self.assertIn("test_checks_total", self.get(self.url))
+        finally:
+            idle.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
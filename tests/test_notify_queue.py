@@ -0,0 +1,71 @@
+# encoding: utf-8
+"""
+tests.test_notify_queue -- sending messages in the background, with retries
+"""
+
+import threading
+import unittest
+
+from notify_sms.notify_queue import NotifyQueue
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class NotifyQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.failures = 0
+        self.sent = list()
+        self.release = threading.Event()
+        self.release.set()
+        self.queue = NotifyQueue(self.send_batch, retries=3, backoff=0.01, max_backoff=0.02)
+
+    def tearDown(self):
+        self.release.set()
+        self.queue.stop()
+
+    def send_batch(self, destinations, messages):
+        # fails self.failures times, blocks while self.release is not set
+        self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            return dict((destination, ["provider down"] * len(messages)) for destination in destinations)
+        self.sent.extend((destination, message) for destination in destinations for message in messages)
+        return dict((destination, [True] * len(messages)) for destination in destinations)
+
+    def test_retry(self):
+        self.failures = 2
+        self.queue.start()
+        self.queue.put(["4917712345678"], ["db1:5432 down"])
+        self.assertTrue(self.queue.drain(2))
+        self.assertEqual(self.sent, [("4917712345678", "db1:5432 down")])
+        self.assertEqual(self.queue.failed, 0)
+
+    def test_give_up(self):
+        self.failures = 4
+        self.queue.start()
+        self.queue.put(["4917712345678"], ["db1:5432 down"])
+        self.assertTrue(self.queue.drain(2))
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.queue.failed, 1)
+
+    def test_drain_timeout(self):
+        self.release.clear()
+        self.queue.start()
+        self.queue.put(["4917712345678"], ["db1:5432 down"])
+        self.assertFalse(self.queue.drain(0.1))
+        self.release.set()
+        self.assertTrue(self.queue.drain(2))
+
+    def test_retry_time(self):
+        # 4 attempts of 30 seconds, waiting 0.01, 0.02 and 0.02 (max_backoff) seconds before the retries
+        self.assertAlmostEqual(self.queue.retry_time(30), 120.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+# encoding: utf-8
+"""
+tests.test_rate_limit -- limits of sent messages
+"""
+
+import unittest
+
+from notify_sms.rate_limit import RateLimiter, HOUR
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.limiter = RateLimiter({HOUR: 100}, clock=lambda: self.now)
+
+    def test_change_limit(self):
+        # e.g. msg_limit of a service changed by a reload: the messages already sent still count
+        self.limiter.set_limit("db1:5432", 3)
+        self.limiter.update(2, ["db1:5432"])
+        self.limiter.set_limit("db1:5432", 2)
+        self.assertFalse(self.limiter.can_send("db1:5432"))
+        self.limiter.set_limit("db1:5432", 5)
+        self.assertEqual(self.limiter.remaining("db1:5432"), 3)
+        self.now += HOUR
+        self.assertEqual(self.limiter.remaining("db1:5432"), 5)
+
+    def test_remove_limit(self):
+        self.limiter.set_limit("db1:5432", 1)
+        self.limiter.update(1, ["db1:5432"])
+        self.limiter.set_limit("db1:5432", 0)
+        self.assertIsNone(self.limiter.remaining("db1:5432"))
+        self.assertTrue(self.limiter.can_send("db1:5432"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+# encoding: utf-8
+"""
+tests.test_reload -- reloading the configuration of a running daemon (SIGHUP)
+
+Run from the projects root directory:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import main
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+CONFIG = """[Defaults]
+username = test
+password = test
+mobile = 4917712345678
+inventory = %s
+"""
+
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sms_notify_test_")
+        self.conf_file = os.path.join(self.tmp_dir, "sms_notify.conf")
+        self.inventory = os.path.join(self.tmp_dir, "services.txt")
+        self.write(self.conf_file, CONFIG % self.inventory)
+        self.write(self.inventory, "db1:5432\nhttp://www.example.com/health\n")
+        self.argv = sys.argv
+        self.main_module = sys.modules["__main__"]
+        sys.argv = ["main.py", "-c", self.conf_file]
+        # parse_cmd_line() takes its description from the script it was started as
+        sys.modules["__main__"] = main
+        self.args, self.services = main.parse_cmd_line()
+
+    def tearDown(self):
+        sys.argv = self.argv
+        sys.modules["__main__"] = self.main_module
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    @staticmethod
+    def write(path, text):
+        with open(path, "wb") as out_file:
+            out_file.write(text)
+
+    def names(self, services):
+        return [main.service_name(service) for service in services]
+
+    def test_reload(self):
+        self.write(self.inventory, "db1:5432\ndb2:5432\n")
+        services = main.reload_services(self.args, self.tmp_dir)
+        self.assertEqual(self.names(services), ["db1:5432", "db2:5432"])
+
+    def test_config_syntax_error(self):
+        self.write(self.conf_file, "[Defaults\nusername = test\n")
+        self.assertIsNone(main.reload_services(self.args, self.tmp_dir))
+        self.write(self.conf_file, (CONFIG % self.inventory) + "this is not an option\n")
+        self.assertIsNone(main.reload_services(self.args, self.tmp_dir))
+        self.assertEqual(self.names(self.services), ["db1:5432", "http://www.example.com/health"])
+
+    def test_invalid_inventory(self):
+        self.write(self.inventory, "db1:5432\ndb2:99999\n")
+        self.assertIsNone(main.reload_services(self.args, self.tmp_dir))
+
+    def test_invalid_option(self):
+        self.write(self.conf_file, (CONFIG % self.inventory) + "confirm_failures = 99\n")
+        self.assertIsNone(main.reload_services(self.args, self.tmp_dir))
+
+    def test_forget_metrics(self):
+        main.CHECKS_TOTAL.labels("db9:5432", "success").inc()
+        main.CHECKS_TOTAL.labels("db9:5432", "failure").inc()
+        main.CONNECT_SECONDS.labels("db9:5432").observe(0.001)
+        main.LATENCY_PERCENTILE.labels("db9:5432").set(0.001)
+        self.assertIn('service="db9:5432"', main.REGISTRY.expose())
+        main.forget_metrics("db9:5432")
+        self.assertNotIn('service="db9:5432"', main.REGISTRY.expose())
+
+
+if __name__ == "__main__":
+    unittest.main()
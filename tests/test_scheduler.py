@@ -0,0 +1,55 @@
+# encoding: utf-8
+"""
+tests.test_scheduler -- when services are checked
+"""
+
+import time
+import unittest
+
+from check_service.scheduler import Scheduler, IDLE_WAIT
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class SchedulerWaitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.sleeps = list()
+        self.sleep = time.sleep
+        time.sleep = self.sleeps.append
+        self.scheduler = Scheduler(jitter=0, clock=lambda: self.now)
+
+    def tearDown(self):
+        time.sleep = self.sleep
+
+    def test_empty(self):
+        # nothing scheduled, e.g. an empty inventory: sleep instead of returning right away
+        self.scheduler.wait()
+        self.assertEqual(self.sleeps, [IDLE_WAIT])
+
+    def test_empty_max_wait(self):
+        self.scheduler.wait(2.0)
+        self.assertEqual(self.sleeps, [2.0])
+
+    def test_removed(self):
+        self.scheduler.add("db1:5432", 60, spread=False)
+        self.scheduler.remove("db1:5432")
+        self.scheduler.wait()
+        self.assertEqual(self.sleeps, [IDLE_WAIT])
+
+    def test_next_deadline(self):
+        self.scheduler.add("db1:5432", 60, spread=False)
+        self.assertEqual(self.scheduler.pop_due(), ["db1:5432"])
+        self.now += 15
+        self.scheduler.wait()
+        self.assertEqual(self.sleeps, [45.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
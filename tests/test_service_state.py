@@ -0,0 +1,60 @@
+# encoding: utf-8
+"""
+tests.test_service_state -- states of services and flap damping
+"""
+
+import unittest
+
+from check_service.service_state import StateStore, UP, DOWN
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+class StateStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.states = StateStore(0.5, clock=lambda: self.now)
+
+    def test_transitions(self):
+        self.assertEqual(self.states.update("db1:5432", True), (None, UP))
+        self.assertIsNone(self.states.update("db1:5432", True))
+        self.assertEqual(self.states["db1:5432"].consecutive, 2)
+        self.now += 60
+        self.assertEqual(self.states.update("db1:5432", False), (UP, DOWN))
+        self.assertEqual(self.states["db1:5432"].since, self.now)
+        self.assertEqual(self.states.down_count, 1)
+        self.assertEqual(self.states.unnotified, set(["db1:5432"]))
+        self.states.mark_notified(["db1:5432"])
+        self.assertEqual(self.states.unnotified, set())
+        self.states.remove("db1:5432")
+        self.assertEqual(self.states.down_count, 0)
+        self.assertNotIn("db1:5432", self.states)
+
+    def test_flapping(self):
+        for num in range(20):
+            self.states.update("db1:5432", num % 2 == 0)
+        state = self.states["db1:5432"]
+        self.assertTrue(state.flapping)
+        # state changes of a flapping service are not notified
+        self.assertNotIn("db1:5432", self.states.unnotified)
+        # calm again once less than half of the threshold of the results are changes
+        for _ in range(18):
+            self.states.update("db1:5432", True)
+        self.assertFalse(state.flapping)
+
+    def test_flap_detection_off(self):
+        states = StateStore(0)
+        for num in range(20):
+            states.update("db1:5432", num % 2 == 0)
+        self.assertFalse(states["db1:5432"].flapping)
+        self.assertIn("db1:5432", states.unnotified)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# encoding: utf-8
+"""
+tests.test_worker_pool -- checks in worker processes, and workers that die
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from check_service.check_service import CheckResult
+from check_service.worker_pool import WorkerPool
+
+__author__ = "Daniel Tröder"
+__copyright__ = "2015, Daniel Tröder"
+__credits__ = ["Daniel Tröder"]
+__license__ = "GPLv3"
+__maintainer__ = "Daniel Tröder"
+__email__ = "daniel@admin-box.com"
+
+
+def service(name):
+    return {"name": name, "host": name, "port": 80, "protocol": "TCP"}
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="sms_notify_test_")
+        self.services = [service("host%d" % num) for num in range(20)]
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool:
+            self.pool.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def start(self, crash=None, crashes=1):
+        # crash: name of a service whose check kills its worker, crashes times
+        marker = os.path.join(self.tmp_dir, "crashes")
+
+        def factory():
+            def check(batch):
+                for item in batch:
+                    if item["name"] == crash:
+                        with open(marker, "ab") as marker_file:
+                            marker_file.write("x")
+                        if os.path.getsize(marker) <= crashes:
+                            os._exit(1)
+                return [(CheckResult(item["name"] != "down", 0.001), item["host"], item["port"], item["protocol"])
+                        for item in batch]
+            return check
+
+        self.pool = WorkerPool(3, factory)
+        self.pool.start()
+        self.pool.update(self.services)
+
+    def test_run(self):
+        self.services.append(service("down"))
+        self.start()
+        results = self.pool.run(self.services)
+        self.assertEqual([result[1] for result in results], [x["name"] for x in self.services])
+        self.assertEqual([bool(result[0]) for result in results], [True] * 20 + [False])
+
+    def test_restart(self):
+        # the worker dies once: it is started again and its checks are sent once more
+        self.start(crash="host3")
+        results = self.pool.run(self.services)
+        self.assertTrue(all(result and result[0] for result in results))
+
+    def test_died_twice(self):
+        # a crashing worker is not an outage of its services: they are not run, not failed
+        self.start(crash="host3", crashes=2)
+        shard = self.pool.shard("host3")
+        results = self.pool.run(self.services)
+        for item, result in zip(self.services, results):
+            if self.pool.shard(item["name"]) == shard:
+                self.assertIsNone(result)
+            else:
+                self.assertTrue(result[0])
+        # the worker was started again and checks the next time
+        results = self.pool.run(self.services)
+        self.assertTrue(all(result and result[0] for result in results))
+
+
+if __name__ == "__main__":
+    unittest.main()